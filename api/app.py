@@ -2,12 +2,14 @@
 FastAPI application for skin lesion classification inference.
 Serves the trained ResNet model and provides REST API endpoints.
 """
+import hashlib
 import os
+import random
 import sys
 from pathlib import Path
 from typing import Dict, List
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import BackgroundTasks, FastAPI, File, UploadFile, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 import torch
 from PIL import Image
@@ -16,13 +18,39 @@ import io
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
-from api.utils import preprocess_image, format_prediction
-from model.model import load_checkpoint
+from api.utils import (TTA_POLICIES, cascade_accepts, format_prediction, preprocess_image, same_preprocessing,
+                       transform_from_metadata)
+from api.explain import ResponseCache, forward_with_cam, overlay_png
+from api.shadow import ShadowEvaluator
+from model.model import get_head, load_metadata, load_ood, mahalanobis_score, calibrate_logits
+from model.optimize import load_optimized
 
 # Configuration
-MODEL_PATH = "models/resnet50_best.pt"
+# Self-describing .safetensors checkpoints carry their own architecture, class names and
+# preprocessing; MODEL_NAME, CLASS_NAMES and the 224px ImageNet transform
+# only apply to legacy bare state_dict (.pt) files.
+MODEL_PATH = os.getenv("MODEL_PATH") or next(
+    (p for p in ("models/resnet50_best.safetensors", "models/resnet50_best.pt") if os.path.exists(p)),
+    "models/resnet50_best.safetensors"
+)
 MODEL_NAME = "resnet50"
-NUM_CLASSES = 7
+# See api.utils.TTA_POLICIES; compare policies with `python -m src.evaluate --tta-policies`.
+# With a calibrated checkpoint (`python -m src.calibrate`) "none" gives well-calibrated single-view confidences.
+TTA_POLICY = os.getenv("TTA_POLICY", "full")
+# See model.optimize.OPTIMIZE_MODES; the optimized model is cached next to the checkpoint
+OPTIMIZE_MODE = os.getenv("OPTIMIZE_MODE", "fold")
+# Explained responses are cached by image hash, so reopening a case is free
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "256"))
+# Shadow mode: a candidate checkpoint scores a sample of live requests in the background
+SHADOW_MODEL_PATH = os.getenv("SHADOW_MODEL_PATH")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_DB = os.getenv("SHADOW_DB", "outputs/shadow.db")
+# Cascade: a fast checkpoint answers confident cases from the original view alone and the
+# rest escalate to MODEL_PATH with TTA. Thresholds come from the fast checkpoint's metadata
+# (`python -m src.tune_cascade`); the env vars override them.
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH")
+CASCADE_MIN_CONFIDENCE = os.getenv("CASCADE_MIN_CONFIDENCE")
+CASCADE_MIN_MARGIN = os.getenv("CASCADE_MIN_MARGIN")
 CLASS_NAMES = ["akiec", "bcc", "bkl", "df", "mel", "nv", "vasc"]
 CLASS_DESCRIPTIONS = {
     "akiec": "Actinic keratoses - Precancerous skin lesion",
@@ -53,12 +81,22 @@ app.add_middleware(
 # Global model variable
 model = None
 device = None
+calibration = None
+model_arch = MODEL_NAME
+class_names = CLASS_NAMES  # from the checkpoint metadata once loaded
+transform = None  # resize/normalize pipeline from the checkpoint metadata
+explain_cache = ResponseCache(EXPLAIN_CACHE_SIZE)
+shadow = None
+ood = None  # Mahalanobis detector stored with the checkpoint (python -m src.fit_ood)
+last_embedding = {}  # penultimate features of the current request, captured by a head hook
+cascade = None  # fast first stage: model, calibration, thresholds, own OOD detector (if fitted)
+cascade_counts = {"fast": 0, "full": 0}
 
 
 @app.on_event("startup")
 async def load_model():
     """Load the trained model on application startup."""
-    global model, device
+    global model, device, calibration, model_arch, class_names, transform, shadow, ood, cascade
     
     try:
         device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -67,18 +105,85 @@ async def load_model():
         if not os.path.exists(MODEL_PATH):
             raise FileNotFoundError(f"Model file not found at {MODEL_PATH}")
         
-        model = load_checkpoint(
-            path=MODEL_PATH,
+        meta = load_metadata(MODEL_PATH)
+        class_names = meta.get("class_names", CLASS_NAMES)
+        transform = transform_from_metadata(meta)
+        model = load_optimized(
+            MODEL_PATH,
+            mode=OPTIMIZE_MODE,
+            device=device,
             model_name=MODEL_NAME,
-            num_classes=NUM_CLASSES,
-            device=device
+            num_classes=len(class_names)
         )
+        model.requires_grad_(False)  # inference only; Grad-CAM differentiates w.r.t. features
+        calibration = meta.get("calibration")
+        model_arch = meta.get("arch", MODEL_NAME)
+        if calibration:
+            print(f"🌡️ Applying {calibration['method']} calibration")
+        if not isinstance(model, torch.jit.ScriptModule):
+            ood = load_ood(MODEL_PATH, device)
+        if ood:
+            # Embedding of the original (first) view, from the prediction forward pass itself
+            get_head(model).register_forward_hook(
+                lambda m, inputs, out: last_embedding.__setitem__("features", inputs[0][:1].detach()))
+            print(f"🛡️ Mahalanobis OOD detector active (threshold {ood['threshold']:.1f})")
         print(f"✅ Model loaded successfully on {device}")
+        
+        shadow_meta = load_metadata(SHADOW_MODEL_PATH) if SHADOW_MODEL_PATH else {}
+        if SHADOW_MODEL_PATH and (shadow_meta.get("class_names", CLASS_NAMES) != class_names
+                                  or not same_preprocessing(shadow_meta, meta)):
+            # The candidate scores the served model's preprocessed views and is compared label by label
+            print(f"⚠️ Shadow mode disabled: {SHADOW_MODEL_PATH} has different classes or preprocessing")
+        elif SHADOW_MODEL_PATH:
+            shadow_model = load_optimized(SHADOW_MODEL_PATH, mode=OPTIMIZE_MODE, device=device,
+                                          model_name=MODEL_NAME, num_classes=len(class_names))
+            os.makedirs(os.path.dirname(SHADOW_DB) or ".", exist_ok=True)
+            shadow = ShadowEvaluator(shadow_model, class_names, SHADOW_DB,
+                                     calibration=shadow_meta.get("calibration"))
+            print(f"👥 Shadowing {SHADOW_SAMPLE_RATE:.0%} of requests with {SHADOW_MODEL_PATH}")
+        
+        fast_meta = load_metadata(CASCADE_MODEL_PATH) if CASCADE_MODEL_PATH else {}
+        if CASCADE_MODEL_PATH and fast_meta.get("class_names", CLASS_NAMES) != class_names:
+            print(f"⚠️ Cascade disabled: {CASCADE_MODEL_PATH} predicts different classes than {MODEL_PATH}")
+        elif CASCADE_MODEL_PATH:
+            # Architecture comes from the fast checkpoint itself (e.g. resnet18)
+            fast_model = load_optimized(CASCADE_MODEL_PATH, mode=OPTIMIZE_MODE, device=device,
+                                        num_classes=len(class_names))
+            thresholds = fast_meta.get("cascade", {})
+            cascade = {
+                "model": fast_model,
+                "arch": fast_meta.get("arch"),
+                "calibration": fast_meta.get("calibration"),
+                # None: reuse the original view of the served model's batch
+                "transform": None if same_preprocessing(fast_meta, meta) else transform_from_metadata(fast_meta),
+                "min_confidence": float(CASCADE_MIN_CONFIDENCE or thresholds.get("min_confidence", 0.9)),
+                "min_margin": float(CASCADE_MIN_MARGIN or thresholds.get("min_margin", 0.5)),
+                "ood": None,
+            }
+            if not isinstance(fast_model, torch.jit.ScriptModule):
+                cascade["ood"] = load_ood(CASCADE_MODEL_PATH, device)
+            if cascade["ood"]:
+                get_head(fast_model).register_forward_hook(
+                    lambda m, inputs, out: last_embedding.__setitem__("fast_features", inputs[0][:1].detach()))
+            if ood and not cascade["ood"]:
+                # Its max-probability fallback can never fire on answers that already cleared
+                # min_confidence, so non-skin images would slip past the served model's detector
+                print(f"⚠️ {CASCADE_MODEL_PATH} has no OOD detector, so every request escalates to {MODEL_PATH} "
+                      f"(fit one with `python -m src.fit_ood --checkpoint {CASCADE_MODEL_PATH}`)")
+            print(f"🪜 Cascade: {CASCADE_MODEL_PATH} answers when confidence >= {cascade['min_confidence']:.2f} "
+                  f"and margin >= {cascade['min_margin']:.2f}")
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         raise
 
 
+@app.on_event("shutdown")
+async def stop_shadow():
+    """Let the shadow worker finish its current sample."""
+    if shadow is not None:
+        shadow.stop()
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
@@ -86,9 +191,10 @@ async def root():
         "message": "Skin Lesion Classifier API",
         "version": "1.0.0",
         "endpoints": {
-            "/predict": "POST - Upload image for classification",
+            "/predict": "POST - Upload image for classification (?explain=true adds a Grad-CAM overlay)",
             "/health": "GET - Health check",
-            "/classes": "GET - Get supported classes"
+            "/classes": "GET - Get supported classes",
+            "/shadow/stats": "GET - Agreement of the shadow candidate with the served model"
         }
     }
 
@@ -101,9 +207,20 @@ async def health_check():
     
     return {
         "status": "healthy",
-        "model": MODEL_NAME,
+        "model": model_arch,
         "device": device,
-        "num_classes": NUM_CLASSES
+        "num_classes": len(class_names),
+        "tta_policy": TTA_POLICY,
+        "ood_detector": "mahalanobis" if ood else "max_probability",
+        "optimize": OPTIMIZE_MODE,
+        "calibrated": bool(calibration),
+        "shadow": {"worker_alive": shadow.alive, "failed": shadow.failed} if shadow else None,
+        "cascade": {
+            "model": cascade["arch"],
+            "min_confidence": cascade["min_confidence"],
+            "min_margin": cascade["min_margin"],
+            "answered": dict(cascade_counts),
+        } if cascade else None
     }
 
 
@@ -115,18 +232,28 @@ async def get_classes() -> Dict[str, List[Dict[str, str]]]:
             "code": code,
             "description": CLASS_DESCRIPTIONS.get(code, "")
         }
-        for code in CLASS_NAMES
+        for code in class_names
     ]
     return {"classes": classes_info}
 
 
+@app.get("/shadow/stats")
+async def shadow_stats():
+    """Agreement statistics of the shadow candidate (if one is configured)."""
+    if shadow is None:
+        raise HTTPException(status_code=404, detail="Shadow mode is not enabled (set SHADOW_MODEL_PATH)")
+    return {"candidate": SHADOW_MODEL_PATH, "sample_rate": SHADOW_SAMPLE_RATE, **shadow.stats()}
+
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(background_tasks: BackgroundTasks, file: UploadFile = File(...), explain: bool = Query(False)):
     """
     Predict skin lesion type from uploaded image.
     
     Args:
         file: Uploaded image file (JPEG, PNG, etc.)
+        explain: Also return a Grad-CAM heatmap overlay (base64 PNG),
+            computed in the same forward pass
     
     Returns:
         JSON with predicted class, confidence, and all class probabilities
@@ -144,32 +271,65 @@ async def predict(file: UploadFile = File(...)):
     try:
         # Read and preprocess image
         image_bytes = await file.read()
+        cache_key = (hashlib.sha1(image_bytes).hexdigest(), TTA_POLICY)
+        if explain:
+            cached = explain_cache.get(cache_key)
+            if cached is not None:
+                return cached
         image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
         
         # Preprocess for model
-        input_tensor = preprocess_image(image, device)
+        input_tensor = preprocess_image(image, device, policy=TTA_POLICY, transform=transform)
+        
+        # Cascade: the fast model scores the original (first) view; explanations
+        # always come from the full model, and so does every answer when only the
+        # full model has an OOD detector
+        stage = "full" if cascade else None
+        if cascade and not explain and (cascade["ood"] or not ood):
+            fast_input = input_tensor[:1] if cascade["transform"] is None else \
+                preprocess_image(image, device, policy="none", transform=cascade["transform"])
+            with torch.no_grad():
+                fast_logits = calibrate_logits(cascade["model"](fast_input), cascade["calibration"])
+                fast_probs = torch.softmax(fast_logits, dim=1)[0]
+            if cascade_accepts(fast_probs.cpu().numpy(), cascade["min_confidence"], cascade["min_margin"]):
+                stage = "fast"
         
         # Run inference with TTA (Test Time Augmentation)
-        with torch.no_grad():
-            # input_tensor is now (5, 3, 224, 224)
-            logits = model(input_tensor)
-            # Calculate probabilities for each augmentation
-            probs_batch = torch.softmax(logits, dim=1)
-            # Average probabilities across all augmentations
-            avg_probs = torch.mean(probs_batch, dim=0)
+        if stage == "fast":
+            avg_probs = fast_probs
+        elif explain:
+            # Same forward pass, plus Grad-CAM of the predicted class over all views
+            avg_probs, class_idx, cam = forward_with_cam(model, input_tensor, TTA_POLICIES[TTA_POLICY], calibration)
+        else:
+            with torch.no_grad():
+                # input_tensor is now (V, 3, H, W), V = number of TTA views
+                logits = calibrate_logits(model(input_tensor), calibration)
+                # Calculate probabilities for each augmentation
+                probs_batch = torch.softmax(logits, dim=1)
+                # Average probabilities across all augmentations
+                avg_probs = torch.mean(probs_batch, dim=0)
             
         # Format response
         result = format_prediction(
             probabilities=avg_probs.cpu().numpy(),
-            class_names=CLASS_NAMES,
+            class_names=class_names,
             class_descriptions=CLASS_DESCRIPTIONS
         )
         
-        # Check confidence threshold for OOD (Out of Distribution) detection
-        confidence_threshold = 0.25
+        # OOD (Out of Distribution) detection: feature-space distance when the
+        # checkpoint has a fitted detector, else the max-probability threshold
         max_conf = float(torch.max(avg_probs))
+        detector = cascade["ood"] if stage == "fast" else ood
+        if detector:
+            features = last_embedding.pop("fast_features" if stage == "fast" else "features")
+            ood_score = float(mahalanobis_score(features, detector))
+            result["ood_score"] = ood_score
+            is_ood = ood_score > detector["threshold"]
+        else:
+            confidence_threshold = 0.25
+            is_ood = max_conf < confidence_threshold
         
-        if max_conf < confidence_threshold:
+        if is_ood:
             result["prediction"] = {
                 "class": "UNKNOWN",
                 "description": "Uncertain / Potential Non-Skin Image",
@@ -177,6 +337,23 @@ async def predict(file: UploadFile = File(...)):
                 "percentage": f"{max_conf * 100:.2f}%"
             }
         
+        if stage:
+            result["stage"] = stage
+            cascade_counts[stage] += 1
+        
+        if shadow is not None and random.random() < SHADOW_SAMPLE_RATE:
+            # Queued only after the response has been sent; scored on the shadow worker thread
+            background_tasks.add_task(shadow.submit, cache_key[0], input_tensor, avg_probs.detach().cpu())
+        
+        if explain:
+            result["explanation"] = {
+                "method": "grad-cam",
+                "class": class_names[class_idx],
+                "tta_views": len(TTA_POLICIES[TTA_POLICY]),
+                "overlay_png_base64": overlay_png(image, cam),
+            }
+            explain_cache.put(cache_key, result)
+        
         return result
         
     except Exception as e:
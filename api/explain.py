@@ -0,0 +1,125 @@
+"""
+Grad-CAM explanations computed inside the prediction forward pass.
+
+A forward pre-hook on the global pooling layer swaps its input (the last
+convolutional feature map) for a detached leaf that requires grad. The trunk
+therefore records no autograd graph (parameters are frozen); only pooling
+and the classifier do, and the backward pass for the predicted class costs
+about as much as the head. The per-view maps of the TTA batch are mapped back
+through the inverse view transforms and averaged.
+"""
+import base64
+import io
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from PIL import Image
+
+from model.model import calibrate_logits
+
+# Inverse of each api.utils.TTA_VIEWS transform, applied to [..., h, w] maps
+INVERSE_VIEWS = {
+    "original": lambda x: x,
+    "hflip": lambda x: torch.flip(x, dims=[-1]),
+    "vflip": lambda x: torch.flip(x, dims=[-2]),
+    "rot90": lambda x: torch.rot90(x, -1, dims=[-2, -1]),
+    "rot270": lambda x: torch.rot90(x, 1, dims=[-2, -1]),
+}
+
+
+def feature_pool(model):
+    """
+    The global pooling layer whose input is the final feature map.
+    """
+    if isinstance(model, torch.jit.ScriptModule):
+        raise ValueError("Explanations need an nn.Module model (OPTIMIZE_MODE 'none' or 'fold')")
+    return getattr(model, "_orig_mod", model).get_submodule("avgpool")
+
+
+def forward_with_cam(model, views, view_names, calibration=None):
+    """
+    Run the TTA batch once and return the prediction plus its Grad-CAM map.
+
+    Args:
+        model: Classifier from model.model / model.optimize (frozen parameters)
+        views (torch.Tensor): [V, 3, H, W] TTA views from preprocess_image
+        view_names (list): TTA_VIEWS names of the views, in order
+        calibration (dict): Checkpoint calibration, applied to the logits
+
+    Returns:
+        avg_probs (torch.Tensor [C]), class index, cam (torch.Tensor [h, w] in [0, 1])
+    """
+    captured = {}
+
+    def pre_hook(module, inputs):
+        features = inputs[0].detach().requires_grad_()
+        captured["features"] = features
+        return (features,)
+
+    handle = feature_pool(model).register_forward_pre_hook(pre_hook)
+    try:
+        with torch.enable_grad():
+            logits = calibrate_logits(model(views), calibration)
+    finally:
+        handle.remove()
+
+    avg_probs = torch.softmax(logits.detach(), dim=1).mean(dim=0)
+    class_idx = int(avg_probs.argmax())
+    features = captured["features"]
+    grads, = torch.autograd.grad(logits[:, class_idx].sum(), features)
+
+    weights = grads.mean(dim=(2, 3), keepdim=True)
+    cams = torch.relu((weights * features).sum(dim=1)).detach()  # [V, h, w]
+    cam = torch.stack([INVERSE_VIEWS[name](c) for name, c in zip(view_names, cams)]).mean(dim=0)
+    peak = cam.max()
+    return avg_probs, class_idx, (cam / peak if peak > 0 else cam).cpu()
+
+
+def _colormap(values):
+    """Jet-like RGB colours for values in [0, 1] (no matplotlib needed)."""
+    x = values[..., None]
+    rgb = np.concatenate([4 * x - 3, 4 * x - 2, 4 * x - 1], axis=-1)
+    return np.clip(1.5 - np.abs(rgb), 0, 1)
+
+
+def overlay_png(image, cam, max_side=320, alpha=0.5):
+    """
+    Heatmap blended over the image, as base64 PNG, at most `max_side` px.
+
+    The map is defined on the model's square input, so stretching it back to
+    the image's aspect ratio puts it over the right pixels.
+    """
+    scale = min(1.0, max_side / max(image.size))
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    base = np.asarray(image.convert("RGB").resize(size, Image.BILINEAR), dtype=np.float32) / 255
+    heat = Image.fromarray(np.uint8(cam.numpy() * 255)).resize(size, Image.BILINEAR)
+    heat = np.asarray(heat, dtype=np.float32)[..., None] / 255
+    blended = base * (1 - alpha * heat) + _colormap(heat[..., 0]) * alpha * heat
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.uint8(np.clip(blended, 0, 1) * 255)).save(buffer, format="PNG", optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+class ResponseCache:
+    """
+    Small LRU of full responses keyed by image hash (and anything else that
+    changes the answer, e.g. the TTA policy).
+    """
+
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def get(self, key):
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        return None
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
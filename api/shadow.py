@@ -0,0 +1,135 @@
+"""
+Shadow evaluation of a candidate checkpoint on sampled live traffic.
+
+/predict hands a sampled fraction of its already-preprocessed TTA batches to
+a ShadowEvaluator after the response is sent. A single background thread
+drains a bounded queue (full queue = sample dropped, never a blocked
+request), scores the batch with the candidate model, and records both
+predictions in a local SQLite store. Agreement statistics are read back from
+that store. A sample that fails (bad input, locked database, ...) is logged
+and counted, and the worker moves on to the next one.
+"""
+import queue
+import sqlite3
+import threading
+import time
+
+import torch
+
+from model.model import calibrate_logits
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shadow (
+    ts REAL,
+    image_sha1 TEXT,
+    primary_class TEXT,
+    primary_conf REAL,
+    shadow_class TEXT,
+    shadow_conf REAL,
+    agree INTEGER,
+    shadow_ms REAL
+);
+"""
+
+
+class ShadowEvaluator:
+    """
+    Background scorer for a candidate model.
+
+    Args:
+        model: Candidate classifier (eval mode)
+        class_names (list): Class names shared by both models
+        db_path (str): SQLite file for per-request records
+        calibration (dict): Candidate calibration, if any
+        max_queue (int): Pending samples kept before new ones are dropped
+    """
+
+    def __init__(self, model, class_names, db_path, calibration=None, max_queue=32):
+        self.model = model
+        self.class_names = class_names
+        self.db_path = db_path
+        self.calibration = calibration
+        self.dropped = 0
+        self.failed = 0
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        with sqlite3.connect(db_path) as conn:
+            conn.executescript(SCHEMA)
+        self._thread = threading.Thread(target=self._run, name="shadow-eval", daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, image_sha1, views, primary_probs):
+        """
+        Queue one request for shadow scoring (non-blocking).
+
+        Returns:
+            bool: False if the sample was dropped (queue full or worker gone)
+        """
+        if not self.alive:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((image_sha1, views, primary_probs))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _score(self, conn, image_sha1, views, primary_probs):
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            probs = torch.softmax(calibrate_logits(self.model(views), self.calibration), dim=1).mean(dim=0)
+        shadow_ms = 1000 * (time.perf_counter() - t0)
+        p_idx, s_idx = int(primary_probs.argmax()), int(probs.argmax())
+        conn.execute("INSERT INTO shadow VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (time.time(), image_sha1, self.class_names[p_idx], float(primary_probs[p_idx]),
+                      self.class_names[s_idx], float(probs[s_idx]), int(p_idx == s_idx), shadow_ms))
+        conn.commit()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._score(conn, *item)
+            except Exception as e:  # one bad sample must not stop the worker
+                self.failed += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"⚠️ Shadow scoring failed for {item[0]}: {self.last_error}")
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+        conn.close()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def stats(self):
+        """
+        Agreement summary plus the most frequent disagreements.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            n, agree, avg_ms = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(agree), 0), AVG(shadow_ms) FROM shadow").fetchone()
+            pairs = conn.execute(
+                "SELECT primary_class, shadow_class, COUNT(*) AS c FROM shadow WHERE agree = 0 "
+                "GROUP BY primary_class, shadow_class ORDER BY c DESC LIMIT 10").fetchall()
+        return {
+            "scored": n,
+            "agreement": agree / n if n else None,
+            "avg_shadow_ms": avg_ms,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "last_error": self.last_error,
+            "worker_alive": self.alive,
+            "top_disagreements": [{"primary": p, "shadow": s, "count": c} for p, s, c in pairs],
+        }
@@ -6,56 +6,96 @@ import torch
 import numpy as np
 from PIL import Image
 from torchvision import transforms
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence
 
+from model.model import IMAGENET_MEAN, IMAGENET_STD
 
-def get_transform():
+
+def get_transform(
+    img_size: int = 224,
+    mean: Sequence[float] = IMAGENET_MEAN,
+    std: Sequence[float] = IMAGENET_STD
+):
     """
     Get the base image transformation pipeline for inference.
     """
     return transforms.Compose([
-        transforms.Resize((224, 224)),
+        transforms.Resize((img_size, img_size)),
         transforms.ToTensor(),
-        transforms.Normalize(
-            mean=[0.485, 0.456, 0.406],
-            std=[0.229, 0.224, 0.225]
-        )
+        transforms.Normalize(mean=list(mean), std=list(std))
     ])
 
 
-def preprocess_image(image: Image.Image, device: str = "cpu") -> torch.Tensor:
+def transform_from_metadata(meta: Dict):
+    """
+    Inference transform described by checkpoint metadata (model.model.load_metadata);
+    legacy checkpoints without it get the 224px ImageNet defaults.
+    """
+    return get_transform(meta.get("img_size", 224), meta.get("mean", IMAGENET_MEAN), meta.get("std", IMAGENET_STD))
+
+
+def same_preprocessing(meta_a: Dict, meta_b: Dict) -> bool:
+    """
+    Whether two checkpoints expect identically preprocessed inputs.
+    """
+    keys = (("img_size", 224), ("mean", IMAGENET_MEAN), ("std", IMAGENET_STD))
+    return all(meta_a.get(k, d) == meta_b.get(k, d) for k, d in keys)
+
+
+# Test Time Augmentation views, as tensor ops on an already resized/normalized batch
+TTA_VIEWS = {
+    "original": lambda x: x,
+    "hflip": lambda x: torch.flip(x, dims=[-1]),
+    "vflip": lambda x: torch.flip(x, dims=[-2]),
+    "rot90": lambda x: torch.rot90(x, 1, dims=[-2, -1]),
+    "rot270": lambda x: torch.rot90(x, -1, dims=[-2, -1]),
+}
+
+# Named TTA policies; "full" is the order stored per view by src.evaluate --tta
+TTA_POLICIES = {
+    "none": ["original"],
+    "hflip": ["original", "hflip"],
+    "flips": ["original", "hflip", "vflip"],
+    "full": ["original", "hflip", "vflip", "rot90", "rot270"],
+}
+
+
+def tta_batch(x: torch.Tensor, policy: str = "full") -> torch.Tensor:
+    """
+    Expand a batch [B, C, H, W] into its TTA views [B, V, C, H, W].
+    """
+    return torch.stack([TTA_VIEWS[view](x) for view in TTA_POLICIES[policy]], dim=1)
+
+
+def preprocess_image(
+    image: Image.Image,
+    device: str = "cpu",
+    policy: str = "full",
+    transform: Optional[transforms.Compose] = None
+) -> torch.Tensor:
     """
     Preprocess a PIL Image for model inference with Test Time Augmentation (TTA).
-    Generates 5 versions of the image:
+    With the default "full" policy it generates 5 versions of the image:
     1. Original
     2. Horizontal Flip
     3. Vertical Flip
     4. Rotate 90 degrees
     5. Rotate -90 degrees
-    
+
+    The image is resized and normalized once; the views are cheap tensor
+    flips/rotations of that result.
+
     Args:
         image: PIL Image object (RGB)
         device: Device to put tensor on ('cpu' or 'cuda')
-    
+        policy: Key of TTA_POLICIES
+        transform: Resize/normalize pipeline (default: get_transform())
+
     Returns:
-        Batch of preprocessed images (5, 3, 224, 224)
+        Batch of preprocessed images (V, 3, H, W)
     """
-    transform = get_transform()
-    
-    # Generate augmentations
-    images = [
-        image,                                  # Original
-        image.transpose(Image.FLIP_LEFT_RIGHT), # Horizontal Flip
-        image.transpose(Image.FLIP_TOP_BOTTOM), # Vertical Flip
-        image.rotate(90),                       # Rotate 90
-        image.rotate(-90)                       # Rotate -90
-    ]
-    
-    # Transform and stack
-    tensors = [transform(img) for img in images]
-    batch_tensor = torch.stack(tensors)
-    
-    return batch_tensor.to(device)
+    tensor = (transform or get_transform())(image).unsqueeze(0)
+    return tta_batch(tensor, policy)[0].to(device)
 
 
 def format_prediction(
@@ -102,3 +142,19 @@ def format_prediction(
         },
         "all_probabilities": all_probabilities
     }
+
+
+def cascade_accepts(probabilities: np.ndarray, min_confidence: float, min_margin: float) -> np.ndarray:
+    """
+    Whether the fast stage of the cascade may answer on its own.
+
+    Args:
+        probabilities: [..., C] class probabilities of the fast model
+        min_confidence: Lowest top-1 probability it may answer with
+        min_margin: Lowest gap between the top-1 and top-2 probabilities
+
+    Returns:
+        Boolean array (one per row); False means escalate to the full model
+    """
+    top2 = np.sort(probabilities, axis=-1)[..., -2:]
+    return (top2[..., 1] >= min_confidence) & (top2[..., 1] - top2[..., 0] >= min_margin)
@@ -1,51 +1,395 @@
+import json
+import os
+import types
+
 import torch
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint_sequential
 from torchvision import models
 
-def get_model(model_name="resnet18", num_classes=7, pretrained=True):
+RESNET_STAGES = ["layer1", "layer2", "layer3", "layer4"]
+
+# Every architecture is described by:
+#   builder/weights: torchvision constructor and its ImageNet weights enum
+#   head:   path of the final nn.Linear, replaced with a num_classes head
+#   stages: four groups of submodule paths, shallow to deep; unfreeze_depth=k
+#           leaves the last k groups (plus the whole head block) trainable
+MODEL_REGISTRY = {
+    "resnet18": {
+        "builder": models.resnet18, "weights": models.ResNet18_Weights,
+        "head": "fc", "head_block": "fc",
+        "stages": [[s] for s in RESNET_STAGES],
+    },
+    "resnet50": {
+        "builder": models.resnet50, "weights": models.ResNet50_Weights,
+        "head": "fc", "head_block": "fc",
+        "stages": [[s] for s in RESNET_STAGES],
+    },
+    "mobilenet_v3_small": {
+        "builder": models.mobilenet_v3_small, "weights": models.MobileNet_V3_Small_Weights,
+        "head": "classifier.3", "head_block": "classifier",
+        "stages": [["features.1"], ["features.2", "features.3"],
+                   [f"features.{i}" for i in range(4, 9)], [f"features.{i}" for i in range(9, 13)]],
+    },
+    "mobilenet_v3_large": {
+        "builder": models.mobilenet_v3_large, "weights": models.MobileNet_V3_Large_Weights,
+        "head": "classifier.3", "head_block": "classifier",
+        "stages": [[f"features.{i}" for i in range(1, 4)], [f"features.{i}" for i in range(4, 7)],
+                   [f"features.{i}" for i in range(7, 13)], [f"features.{i}" for i in range(13, 17)]],
+    },
+    "efficientnet_b0": {
+        "builder": models.efficientnet_b0, "weights": models.EfficientNet_B0_Weights,
+        "head": "classifier.1", "head_block": "classifier",
+        "stages": [["features.1", "features.2"], ["features.3"], ["features.4", "features.5"],
+                   ["features.6", "features.7", "features.8"]],
+    },
+    "regnet_y_400mf": {
+        "builder": models.regnet_y_400mf, "weights": models.RegNet_Y_400MF_Weights,
+        "head": "fc", "head_block": "fc",
+        "stages": [[f"trunk_output.block{i}"] for i in range(1, 5)],
+    },
+    "regnet_y_800mf": {
+        "builder": models.regnet_y_800mf, "weights": models.RegNet_Y_800MF_Weights,
+        "head": "fc", "head_block": "fc",
+        "stages": [[f"trunk_output.block{i}"] for i in range(1, 5)],
+    },
+}
+
+
+def get_model(model_name="resnet18", num_classes=7, pretrained=True, unfreeze_depth=None):
     """
-    Load a pretrained CNN (resnet18 or resnet50) and replace the final layer.
+    Build a registered CNN (see MODEL_REGISTRY) and replace its final layer.
 
     Args:
-        model_name (str): 'resnet18' or 'resnet50'
+        model_name (str): Key of MODEL_REGISTRY, e.g. 'resnet50' or 'mobilenet_v3_large'
         num_classes (int): Number of output classes
         pretrained (bool): Whether to load ImageNet weights
+        unfreeze_depth (int): Number of trailing stages left trainable
+            (e.g. 2 -> layer3, layer4 + fc on a ResNet). None keeps every layer trainable.
 
     Returns:
         nn.Module: The model
     """
-    if model_name == "resnet18":
-        m = models.resnet18(weights=models.ResNet18_Weights.DEFAULT if pretrained else None)
-    elif model_name == "resnet50":
-        m = models.resnet50(weights=models.ResNet50_Weights.DEFAULT if pretrained else None)
-    else:
-        raise ValueError(f"Unsupported model: {model_name}")
+    if model_name not in MODEL_REGISTRY:
+        raise ValueError(f"Unsupported model: {model_name} (choose from {', '.join(MODEL_REGISTRY)})")
+    spec = MODEL_REGISTRY[model_name]
+    m = spec["builder"](weights=spec["weights"].DEFAULT if pretrained else None)
+
+    if unfreeze_depth is not None:
+        for param in m.parameters():
+            param.requires_grad = False
+        stages = spec["stages"]
+        for group in stages[len(stages) - unfreeze_depth:]:
+            for path in group:
+                for param in m.get_submodule(path).parameters():
+                    param.requires_grad = True
+        for param in m.get_submodule(spec["head_block"]).parameters():
+            param.requires_grad = True
 
-    in_features = m.fc.in_features
-    m.fc = nn.Linear(in_features, num_classes)
+    parent_path, _, name = spec["head"].rpartition(".")
+    parent = m.get_submodule(parent_path) if parent_path else m
+    old_head = getattr(parent, name)
+    setattr(parent, name, nn.Linear(old_head.in_features, num_classes))  # new head is always trainable
     return m
 
-def save_checkpoint(model, path):
+
+def get_head(model):
+    """
+    The final classification nn.Linear of a model from get_model.
+    """
+    return [m for m in model.modules() if isinstance(m, nn.Linear)][-1]
+
+
+_STATE_KEYS = {}
+
+
+def infer_architecture(state_dict):
+    """
+    (model_name, num_classes) of a bare state_dict saved from get_model.
+
+    Matches parameter names against every registered architecture (building
+    each skeleton once per process).
+    """
+    keys = set(state_dict)
+    for name, spec in MODEL_REGISTRY.items():
+        if name not in _STATE_KEYS:
+            _STATE_KEYS[name] = set(get_model(name, pretrained=False).state_dict())
+        if _STATE_KEYS[name] == keys:
+            return name, state_dict[spec["head"] + ".weight"].shape[0]
+    raise ValueError("State dict does not match any registered architecture")
+
+
+def _resnet_trunk(m):
+    return [m.conv1, m.bn1, m.relu, m.maxpool] + [getattr(m, s) for s in RESNET_STAGES]
+
+
+def _memory_efficient_forward(self, x):
+    trunk = _resnet_trunk(self)
+    with torch.no_grad():
+        for module in trunk[:self._frozen_prefix]:
+            x = module(x)
+
+    checkpointing = self._checkpoint_segments > 0 and self.training and torch.is_grad_enabled()
+    for module in trunk[self._frozen_prefix:]:
+        if checkpointing and isinstance(module, nn.Sequential) and len(module) > 1:
+            x = checkpoint_sequential(module, min(self._checkpoint_segments, len(module)), x,
+                                      use_reentrant=False)
+        else:
+            x = module(x)
+
+    x = self.avgpool(x)
+    x = torch.flatten(x, 1)
+    return self.fc(x)
+
+
+def enable_memory_efficient(model, checkpoint_segments=0):
+    """
+    Cut training memory of a (partially frozen) ResNet from get_model.
+
+    - The frozen prefix (conv1 .. last fully frozen stage) runs under no_grad,
+      so none of its activations are kept for backward. inference_mode is not
+      used because its tensors cannot feed the trainable stages' autograd graph.
+    - With checkpoint_segments > 0, each trainable residual stage is run with
+      activation checkpointing in that many segments (recomputed in backward).
+
+    The forward is rebound on the instance, so parameter names and checkpoints
+    are unchanged.
+
+    Returns:
+        nn.Module: The same model, for chaining
+    """
+    if not all(hasattr(model, s) for s in RESNET_STAGES):
+        raise ValueError("Memory-efficient mode is only implemented for ResNets")
+    frozen_prefix = 0
+    for module in _resnet_trunk(model):
+        if any(p.requires_grad for p in module.parameters()):
+            break
+        frozen_prefix += 1
+
+    model._frozen_prefix = frozen_prefix
+    model._checkpoint_segments = checkpoint_segments
+    model.forward = types.MethodType(_memory_efficient_forward, model)
+    return model
+
+
+def trainable_parameters(model):
+    """
+    Parameters that need optimizer state (frozen ones are skipped entirely).
+    """
+    return [p for p in model.parameters() if p.requires_grad]
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+METADATA_KEY = "skin_lesion"  # safetensors header entry holding the JSON metadata
+OOD_PREFIX = "ood."  # auxiliary tensors stored next to the weights (not part of the state_dict)
+
+
+def is_safetensors(path):
+    return str(path).endswith(".safetensors")
+
+
+def checkpoint_metadata(model_name, class_names, img_size, mean=IMAGENET_MEAN, std=IMAGENET_STD, **extra):
+    """
+    Everything needed to rebuild and feed a model, embedded in .safetensors checkpoints.
+    """
+    return dict(arch=model_name, num_classes=len(class_names), class_names=list(class_names),
+                img_size=img_size, mean=list(mean), std=list(std), **extra)
+
+
+def _write_safetensors(state_dict, metadata, path):
+    from safetensors.torch import save_file
+
+    tmp = path + ".tmp"
+    save_file(state_dict, tmp, metadata={METADATA_KEY: json.dumps(metadata)})
+    os.replace(tmp, path)
+
+
+def save_checkpoint(model, path, metadata=None, fp16=False):
     """
     Save model weights to a file.
+
+    `.safetensors` paths get a self-describing checkpoint: `metadata` (see
+    checkpoint_metadata) lives in the file header, and with `fp16` the conv /
+    linear weights are stored in half precision (BatchNorm statistics and
+    biases stay float32). Any other path gets a bare state_dict pickle.
     """
-    torch.save(model.state_dict(), path)
+    if not is_safetensors(path):
+        torch.save(model.state_dict(), path)
+        return
+    state_dict = {
+        k: (v.half() if fp16 and v.is_floating_point() and v.dim() > 1 else v).detach().cpu().contiguous()
+        for k, v in model.state_dict().items()
+    }
+    _write_safetensors(state_dict, dict(metadata or {}, dtype="float16" if fp16 else "float32"), path)
+
 
-def load_checkpoint(path, model_name="resnet18", num_classes=7, device="cpu"):
+def read_checkpoint(path, device="cpu"):
+    """
+    (state_dict, metadata) of a checkpoint in either format.
+
+    safetensors files are memory-mapped rather than unpickled; legacy .pt
+    files take their metadata from the `.meta.json` sidecar, if any.
+    """
+    if is_safetensors(path):
+        from safetensors import safe_open
+
+        with safe_open(path, framework="pt", device=str(device)) as f:
+            state_dict = {k: f.get_tensor(k) for k in f.keys() if not k.startswith(OOD_PREFIX)}
+        return state_dict, load_metadata(path)
+    return torch.load(path, map_location=device), load_metadata(path)
+
+
+def load_checkpoint(path, model_name=None, num_classes=None, device="cpu"):
     """
     Load model from a saved checkpoint.
 
+    Architecture and class count embedded in the checkpoint take precedence
+    over the arguments; for bare state_dicts they are inferred when not given.
+
     Args:
-        path (str): File path to model weights
-        model_name (str): 'resnet18' or 'resnet50'
-        num_classes (int): Number of output classes
+        path (str): File path to model weights (.safetensors or .pt)
+        model_name (str): Key of MODEL_REGISTRY (legacy checkpoints only)
+        num_classes (int): Number of output classes (legacy checkpoints only)
         device (str): 'cpu' or 'cuda'
 
     Returns:
         nn.Module: The model with weights loaded
     """
-    model = get_model(model_name=model_name, num_classes=num_classes, pretrained=False)
-    model.load_state_dict(torch.load(path, map_location=device))
+    state_dict, meta = read_checkpoint(path, device)
+    if "arch" in meta:
+        model_name, num_classes = meta["arch"], meta["num_classes"]
+    elif model_name is None:
+        model_name, num_classes = infer_architecture(state_dict)
+    num_classes = num_classes or state_dict[MODEL_REGISTRY[model_name]["head"] + ".weight"].shape[0]
+
+    # Built on the meta device and then given the loaded tensors directly:
+    # no random init and no second copy of the weights
+    with torch.device("meta"):
+        model = get_model(model_name=model_name, num_classes=num_classes, pretrained=False)
+    state_dict = {k: v.float() if v.dtype == torch.float16 else v for k, v in state_dict.items()}
+    model.load_state_dict(state_dict, assign=True)
     model.to(device)
     model.eval()
     return model
+
+
+def metadata_path(checkpoint_path):
+    return checkpoint_path + ".meta.json"
+
+
+def load_metadata(checkpoint_path):
+    """
+    Metadata of a checkpoint (architecture, classes, calibration, ...), or {} if none.
+
+    Read from the safetensors header (without touching the weights), or from
+    the `.meta.json` sidecar of a legacy checkpoint.
+    """
+    if is_safetensors(checkpoint_path):
+        from safetensors import safe_open
+
+        with safe_open(checkpoint_path, framework="pt") as f:
+            header = f.metadata() or {}
+        return json.loads(header.get(METADATA_KEY, "{}"))
+    path = metadata_path(checkpoint_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_metadata(checkpoint_path, **updates):
+    """
+    Merge keys into the checkpoint's metadata (rewrites the safetensors header,
+    or the sidecar of a legacy checkpoint).
+    """
+    meta = load_metadata(checkpoint_path)
+    meta.update(updates)
+    if is_safetensors(checkpoint_path):
+        from safetensors.torch import load_file
+
+        _write_safetensors(load_file(checkpoint_path), meta, checkpoint_path)
+    else:
+        with open(metadata_path(checkpoint_path), "w") as f:
+            json.dump(meta, f, indent=2)
+    return meta
+
+
+def save_ood(checkpoint_path, means, precision, **info):
+    """
+    Store Mahalanobis OOD statistics (class means [C, D], shared precision
+    [D, D]) inside a .safetensors checkpoint; `info` (e.g. threshold) goes to
+    the metadata under "ood".
+    """
+    if not is_safetensors(checkpoint_path):
+        raise ValueError("OOD statistics need a .safetensors checkpoint (see src.convert_checkpoint)")
+    from safetensors.torch import load_file
+
+    tensors = {k: v for k, v in load_file(checkpoint_path).items() if not k.startswith(OOD_PREFIX)}
+    tensors[OOD_PREFIX + "means"] = torch.as_tensor(means, dtype=torch.float32).contiguous()
+    tensors[OOD_PREFIX + "precision"] = torch.as_tensor(precision, dtype=torch.float32).contiguous()
+    meta = load_metadata(checkpoint_path)
+    meta["ood"] = dict(method="mahalanobis", **info)
+    _write_safetensors(tensors, meta, checkpoint_path)
+
+
+def load_ood(checkpoint_path, device="cpu"):
+    """
+    Mahalanobis OOD detector stored with a checkpoint, ready for
+    mahalanobis_score, or None if the checkpoint has none.
+
+    The precision is factored once (P = L L^T) so a request costs a single
+    [D, D] product plus distances to C transformed means.
+    """
+    if not is_safetensors(checkpoint_path):
+        return None
+    info = load_metadata(checkpoint_path).get("ood")
+    if not info:
+        return None
+    from safetensors import safe_open
+
+    with safe_open(checkpoint_path, framework="pt", device=str(device)) as f:
+        means = f.get_tensor(OOD_PREFIX + "means")
+        precision = f.get_tensor(OOD_PREFIX + "precision")
+    return ood_detector(means, precision, **info)
+
+
+def ood_detector(means, precision, **info):
+    """
+    Detector dict for mahalanobis_score from class means and shared precision.
+    """
+    means = torch.as_tensor(means, dtype=torch.float32)
+    transform = torch.linalg.cholesky(torch.as_tensor(precision, dtype=torch.float64)).to(means)
+    return dict(info, transform=transform, means=means @ transform)
+
+
+def mahalanobis_score(embeddings, ood):
+    """
+    Squared Mahalanobis distance of each embedding [B, D] to its closest class
+    mean (higher = more out-of-distribution).
+    """
+    z = embeddings @ ood["transform"]
+    return torch.cdist(z, ood["means"]).pow(2).min(dim=1).values
+
+
+def calibrate_logits(logits, calibration):
+    """
+    Apply fitted calibration to logits.
+
+    Args:
+        logits (torch.Tensor): [..., C] raw logits
+        calibration (dict): {"method": "temperature", "temperature": T} or
+            {"method": "vector", "weight": [C], "bias": [C]}; None is a no-op
+
+    Returns:
+        torch.Tensor: Calibrated logits (softmax them as usual)
+    """
+    if not calibration:
+        return logits
+    if calibration["method"] == "temperature":
+        return logits / calibration["temperature"]
+    if calibration["method"] == "vector":
+        weight = torch.as_tensor(calibration["weight"], dtype=logits.dtype, device=logits.device)
+        bias = torch.as_tensor(calibration["bias"], dtype=logits.dtype, device=logits.device)
+        return logits * weight + bias
+    raise ValueError(f"Unknown calibration method: {calibration['method']}")
+
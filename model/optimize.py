@@ -0,0 +1,140 @@
+"""
+Inference-time graph optimization of models loaded with model.model.load_checkpoint.
+
+Modes:
+    none     the eval() model as trained
+    fold     BatchNorm folded into the preceding convolutions (torch.fx); the
+             result is still an nn.Module, so forward hooks keep working
+    script   fold + TorchScript trace + torch.jit.optimize_for_inference
+             (freezes weights; fuses conv+relu / conv+add+relu on CPU)
+    compile  fold + torch.compile (compiled lazily on the first call)
+
+fold and script results are cached next to the checkpoint (in .optimized/),
+keyed by the checkpoint's size/mtime, the device and the torch version, so
+later starts skip the work. Writing an entry removes the older entries of the
+same checkpoint, mode and device (e.g. left behind by a metadata rewrite).
+Every freshly optimized model is checked against the original on a random
+batch before it is used or cached.
+"""
+import glob
+import hashlib
+import os
+
+import torch
+import torch.fx.experimental.optimization as fx_opt
+
+from model.model import load_checkpoint, load_metadata
+
+OPTIMIZE_MODES = ("none", "fold", "script", "compile")
+
+
+def fold_batchnorm(model):
+    """
+    Copy of an eval-mode model with every Conv-BN pair folded into one Conv.
+    """
+    return fx_opt.fuse(model.eval(), inplace=False)
+
+
+def freeze_script(model, img_size=224):
+    """
+    Traced, frozen TorchScript module with oneDNN-friendly fusions applied.
+    """
+    example = torch.randn(1, 3, img_size, img_size, device=next(model.parameters()).device)
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example)
+    return torch.jit.optimize_for_inference(traced)
+
+
+def max_logit_diff(reference, candidate, img_size=224, batch_size=4, device="cpu"):
+    """
+    Largest absolute logit difference between two models on a random batch.
+    """
+    torch.manual_seed(0)
+    x = torch.randn(batch_size, 3, img_size, img_size, device=device)
+    with torch.no_grad():
+        return (reference(x) - candidate(x)).abs().max().item()
+
+
+def check_equivalence(reference, candidate, img_size=224, device="cpu", atol=1e-3):
+    """
+    Raise if the optimized model's logits drift from the original's.
+    """
+    diff = max_logit_diff(reference, candidate, img_size, device=device)
+    if diff > atol:
+        raise RuntimeError(f"Optimized model differs from the original (max |Δlogit| {diff:.2e} > {atol:.0e})")
+    return diff
+
+
+def cache_path(checkpoint_path, mode, device):
+    stat = os.stat(checkpoint_path)
+    key = hashlib.sha1(f"{os.path.abspath(checkpoint_path)}:{stat.st_size}:{stat.st_mtime_ns}:"
+                       f"{mode}:{device}:{torch.__version__}".encode()).hexdigest()[:16]
+    name = f"{os.path.basename(checkpoint_path)}.{mode}.{device}.{key}.pt"
+    return os.path.join(os.path.dirname(checkpoint_path), ".optimized", name)
+
+
+def prune_cache(path):
+    """
+    Delete cache entries of the same checkpoint/mode/device other than `path`.
+    """
+    prefix = os.path.basename(path).rsplit(".", 2)[0]  # drop "<key>.pt"
+    removed = 0
+    for old in glob.glob(os.path.join(glob.escape(os.path.dirname(path)), glob.escape(prefix) + ".*.pt")):
+        if old != path:
+            try:
+                os.remove(old)
+                removed += 1
+            except OSError:  # another process got there first
+                pass
+    return removed
+
+
+def optimize(model, mode="fold", img_size=224, device="cpu"):
+    """
+    Apply an OPTIMIZE_MODES transform to an eval-mode model and verify it.
+    """
+    if mode not in OPTIMIZE_MODES:
+        raise ValueError(f"Unknown optimize mode: {mode} (choose from {', '.join(OPTIMIZE_MODES)})")
+    if mode == "none":
+        return model
+    optimized = fold_batchnorm(model)
+    if mode == "script":
+        optimized = freeze_script(optimized, img_size)
+    check_equivalence(model, optimized, img_size, device)
+    if mode == "compile":
+        optimized = torch.compile(optimized)
+    return optimized
+
+
+def load_optimized(checkpoint_path, mode="fold", device="cpu", model_name=None, num_classes=None, cache=True):
+    """
+    load_checkpoint + optimize, reusing the on-disk cache when possible.
+
+    Returns:
+        The optimized model (nn.Module, or ScriptModule for mode='script')
+    """
+    if mode == "none":
+        return load_checkpoint(checkpoint_path, model_name, num_classes, device)
+
+    img_size = load_metadata(checkpoint_path).get("img_size", 224)
+    path = cache_path(checkpoint_path, mode, device) if cache and mode != "compile" else None
+    if path and os.path.exists(path):
+        try:
+            if mode == "script":
+                return torch.jit.load(path, map_location=device)
+            return torch.load(path, map_location=device, weights_only=False).eval()
+        except Exception as e:  # stale or partial cache: rebuild below
+            print(f"⚠️ Ignoring unreadable optimized-model cache {path}: {e}")
+
+    model = load_checkpoint(checkpoint_path, model_name, num_classes, device)
+    optimized = optimize(model, mode, img_size, device)
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"  # several worker processes may build it at once
+        if mode == "script":
+            torch.jit.save(optimized, tmp)
+        else:
+            torch.save(optimized, tmp)
+        os.replace(tmp, path)
+        prune_cache(path)
+    return optimized
@@ -0,0 +1,123 @@
+# src/calibrate.py
+"""
+Fit temperature (or per-class vector) scaling on validation logits.
+
+Validation logits come from the checkpoint's logits store (inference only runs
+for images not scored yet). The fitted parameters are written to the
+checkpoint metadata, where the API picks them up, so single-view inference
+returns calibrated confidences. ECE and NLL are reported before and after, on
+val and (if available) test.
+
+Usage:
+    python -m src.calibrate --method temperature
+"""
+import argparse
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from model.model import calibrate_logits, save_metadata
+from src.evaluate import score_split
+from src.utils import load_config
+
+
+def expected_calibration_error(probs, y_true, n_bins=15):
+    """
+    ECE with equal-width confidence bins.
+    """
+    conf = probs.max(axis=1)
+    correct = probs.argmax(axis=1) == y_true
+    edges = np.linspace(0.0, 1.0, n_bins + 1)
+    ece = 0.0
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        in_bin = (conf > lo) & (conf <= hi)
+        if in_bin.any():
+            ece += in_bin.mean() * abs(correct[in_bin].mean() - conf[in_bin].mean())
+    return float(ece)
+
+
+def fit_calibration(logits, y_true, method="temperature", max_iter=200):
+    """
+    Minimize NLL of calibrated logits with LBFGS.
+
+    Returns:
+        dict: calibration parameters for model.model.calibrate_logits
+    """
+    logits = torch.as_tensor(logits, dtype=torch.float64)
+    y = torch.as_tensor(y_true, dtype=torch.long)
+    n_classes = logits.shape[1]
+
+    if method == "temperature":
+        log_t = torch.zeros(1, dtype=torch.float64, requires_grad=True)  # T = exp(log_t) stays positive
+        params = [log_t]
+        scaled = lambda: logits / log_t.exp()
+    elif method == "vector":
+        weight = torch.ones(n_classes, dtype=torch.float64, requires_grad=True)
+        bias = torch.zeros(n_classes, dtype=torch.float64, requires_grad=True)
+        params = [weight, bias]
+        scaled = lambda: logits * weight + bias
+    else:
+        raise ValueError(f"Unknown calibration method: {method}")
+
+    opt = torch.optim.LBFGS(params, lr=0.1, max_iter=max_iter, line_search_fn="strong_wolfe")
+
+    def closure():
+        opt.zero_grad()
+        loss = F.cross_entropy(scaled(), y)
+        loss.backward()
+        return loss
+
+    opt.step(closure)
+    if method == "temperature":
+        return {"method": "temperature", "temperature": float(log_t.exp())}
+    return {"method": "vector", "weight": weight.detach().tolist(), "bias": bias.detach().tolist()}
+
+
+def calibration_metrics(logits, y_true, calibration=None):
+    scaled = calibrate_logits(torch.as_tensor(logits, dtype=torch.float32), calibration)
+    nll = float(F.cross_entropy(scaled, torch.as_tensor(y_true, dtype=torch.long)))
+    probs = torch.softmax(scaled, dim=1).numpy()
+    return expected_calibration_error(probs, y_true), nll
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit post-hoc calibration on validation logits")
+    parser.add_argument("--method", choices=["temperature", "vector"], default="temperature")
+    parser.add_argument("--no-test", action="store_true", help="Skip the before/after report on test")
+    args = parser.parse_args()
+
+    cfg = load_config("config.yaml")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    classes = cfg["data"]["class_names"]
+    ckpt_path = os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
+
+    val, store = score_split(cfg, ckpt_path, "val", device)
+    val_logits = store.get("logits", val["sha1"].tolist())
+    val_y = np.array([classes.index(label) for label in val["label"]])
+
+    calibration = fit_calibration(val_logits, val_y, method=args.method)
+    calibration["ece_val_before"], calibration["nll_val_before"] = calibration_metrics(val_logits, val_y)
+    calibration["ece_val_after"], calibration["nll_val_after"] = calibration_metrics(val_logits, val_y, calibration)
+
+    print(f"\n🌡️ Calibration ({args.method}) fitted on {len(val)} val images")
+    if args.method == "temperature":
+        print(f"  Temperature: {calibration['temperature']:.4f}")
+    print(f"  val  ECE {calibration['ece_val_before']:.4f} -> {calibration['ece_val_after']:.4f} | "
+          f"NLL {calibration['nll_val_before']:.4f} -> {calibration['nll_val_after']:.4f}")
+
+    if not args.no_test and os.path.isdir(cfg["data"]["test_dir"]):
+        test, store = score_split(cfg, ckpt_path, "test", device)
+        test_logits = store.get("logits", test["sha1"].tolist())
+        test_y = np.array([classes.index(label) for label in test["label"]])
+        ece_b, nll_b = calibration_metrics(test_logits, test_y)
+        ece_a, nll_a = calibration_metrics(test_logits, test_y, calibration)
+        print(f"  test ECE {ece_b:.4f} -> {ece_a:.4f} | NLL {nll_b:.4f} -> {nll_a:.4f}")
+
+    save_metadata(ckpt_path, calibration=calibration)
+    print(f"✅ Calibration saved to checkpoint metadata for {ckpt_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# src/compare_checkpoints.py
+"""
+Evaluate many checkpoints in one shared pass over the test set.
+
+Each test batch is decoded and preprocessed once and fed to every model that
+still needs it and expects the same preprocessing (img_size/mean/std from the
+checkpoint metadata), optionally concurrently on a thread pool - torch
+releases the GIL in its kernels. Outputs go to each checkpoint's logits store, so
+checkpoints already scored by src.evaluate skip the pass entirely. Latency is
+timed for every model on one shared batch per preprocessing.
+
+Usage:
+    python -m src.compare_checkpoints models/*.safetensors --parallel
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.metrics import accuracy_score, f1_score, recall_score
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from model.model import infer_architecture, load_checkpoint, load_metadata
+from src.dataset import ManifestDataset
+from src.evaluate import eval_preprocessing, eval_transform, test_samples
+from src.logits_store import LogitsStore, checkpoint_key
+from src.utils import load_config
+
+
+def load_for_eval(path, device):
+    model = load_checkpoint(path, device=device)
+    model_name = load_metadata(path).get("arch") or infer_architecture(model.state_dict())[0]
+    return model, model_name
+
+
+def shared_pass(models, rows, tfm, classes, device, batch_size=32, num_workers=0, parallel=False):
+    """
+    Run every model on the same decoded batches.
+
+    Returns:
+        dict: name -> np.ndarray logits [N, C]
+    """
+    ds = ManifestDataset(rows, classes=classes, transform=tfm)
+    loader = DataLoader(ds, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    logits = {name: [] for name in models}
+
+    def forward(name, x):
+        return name, models[name](x).cpu().numpy()
+
+    pool = ThreadPoolExecutor(max_workers=len(models)) if parallel and len(models) > 1 else None
+    with torch.no_grad():
+        for x, _ in tqdm(loader, desc=f"Shared pass x{len(models)} models"):
+            x = x.to(device)
+            results = pool.map(forward, models, [x] * len(models)) if pool else (forward(n, x) for n in models)
+            for name, out in results:
+                logits[name].append(out)
+    if pool:
+        pool.shutdown()
+    return {n: np.concatenate(v) for n, v in logits.items()}
+
+
+def measure_latency(models, x, device, repeats=3):
+    """
+    Milliseconds per image for each model on one already-decoded batch.
+    """
+    latency = {}
+    with torch.no_grad():
+        for name, model in models.items():
+            model(x)  # warmup
+            if device == "cuda":
+                torch.cuda.synchronize()
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                model(x)
+            if device == "cuda":
+                torch.cuda.synchronize()
+            latency[name] = 1000 * (time.perf_counter() - t0) / (repeats * x.size(0))
+    return latency
+
+
+def leaderboard_row(name, model_name, logits, y_true, classes, latency_ms):
+    y_pred = logits.argmax(axis=1)
+    recalls = recall_score(y_true, y_pred, labels=range(len(classes)), average=None, zero_division=0)
+    row = {
+        "checkpoint": name,
+        "arch": model_name,
+        "accuracy": accuracy_score(y_true, y_pred),
+        "macro_f1": f1_score(y_true, y_pred, labels=range(len(classes)), average="macro", zero_division=0),
+        "ms_per_image": latency_ms,
+    }
+    row.update({f"recall_{c}": r for c, r in zip(classes, recalls)})
+    return row
+
+
+def main():
+    cfg = load_config("config.yaml")
+    parser = argparse.ArgumentParser(description="Compare checkpoints with one shared test-set pass")
+    parser.add_argument("checkpoints", nargs="*", help="Checkpoint files (default: all *.safetensors / *.pt in checkpoint_dir)")
+    parser.add_argument("--parallel", action="store_true", help="Run the models concurrently on each batch")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--out", type=str, default=os.path.join(cfg["eval"]["outputs_dir"], "leaderboard.csv"))
+    args = parser.parse_args()
+
+    paths = args.checkpoints or sorted(p for ext in ("*.safetensors", "*.pt")
+                                       for p in glob.glob(os.path.join(cfg["train"]["checkpoint_dir"], ext)))
+    if not paths:
+        raise SystemExit("No checkpoints to compare")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    classes = cfg["data"]["class_names"]
+    # Checkpoints that expect the same preprocessing share decoded batches
+    groups = {}
+    for p in paths:
+        groups.setdefault(json.dumps(eval_preprocessing(cfg, p), sort_keys=True), []).append(p)
+
+    samples = test_samples(cfg)
+    hashes = samples["sha1"].tolist()
+    stores = {p: LogitsStore(cfg["eval"]["logits_dir"], checkpoint_key(p)) for p in paths}
+    models, arch = {}, {}
+    for p in paths:
+        models[p], arch[p] = load_for_eval(p, device)
+
+    # Images any model still needs are decoded once and fed to the models that need them
+    needs = {p: set(store.missing(hashes)) for p, store in stores.items()}
+    first = samples.drop_duplicates("sha1").head(args.batch_size).reset_index(drop=True)
+    latency = {}
+    for group in groups.values():
+        tfm = eval_transform(cfg, group[0])
+        todo = set().union(*(needs[p] for p in group))
+        if todo:
+            active = {p: models[p] for p in group if needs[p]}
+            rows = samples[samples["sha1"].isin(todo)].drop_duplicates("sha1").reset_index(drop=True)
+            print(f"🔄 Shared pass over {len(rows)} images for {len(active)}/{len(paths)} checkpoints")
+            logits = shared_pass(active, rows, tfm, classes, device, batch_size=args.batch_size,
+                                 num_workers=cfg["data"]["num_workers"], parallel=args.parallel)
+            for p in active:
+                stores[p].add(rows["sha1"].tolist(), rows["label"].tolist(), rows["path"].tolist(),
+                              {"logits": logits[p]})
+        else:
+            print(f"⚡ {len(group)}/{len(paths)} checkpoints already scored every test image")
+
+        x = torch.stack([img for img, _ in ManifestDataset(first, classes=classes, transform=tfm)]).to(device)
+        latency.update(measure_latency({p: models[p] for p in group}, x, device))
+
+    rows = []
+    for p in paths:
+        # Logit columns follow each checkpoint's own class order
+        ckpt_classes = load_metadata(p).get("class_names", classes)
+        y_true = np.array([ckpt_classes.index(label) for label in samples["label"]])
+        rows.append(leaderboard_row(os.path.basename(p), arch[p], stores[p].get("logits", hashes), y_true,
+                                    ckpt_classes, latency[p]))
+    board = pd.DataFrame(rows).sort_values("macro_f1", ascending=False)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    board.to_csv(args.out, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.precision", 4):
+        print(board.to_string(index=False))
+    print(f"🏆 Leaderboard saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
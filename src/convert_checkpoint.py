@@ -0,0 +1,67 @@
+# src/convert_checkpoint.py
+"""
+Convert bare state_dict checkpoints (.pt) to self-describing .safetensors.
+
+The architecture and class count are inferred from the weights; class names,
+img_size and normalization come from config.yaml, and calibration from the
+legacy `.meta.json` sidecar. The converted model is checked against the
+original on a random batch before anything is reported as done.
+
+Usage:
+    python -m src.convert_checkpoint models/resnet50_best.pt --fp16
+"""
+import argparse
+import os
+
+import torch
+
+from model.model import (checkpoint_metadata, get_model, infer_architecture, load_checkpoint, load_metadata,
+                         save_checkpoint)
+
+
+def convert(src, dst=None, class_names=None, img_size=224, fp16=False):
+    """
+    Write `src` (bare state_dict) as a .safetensors checkpoint.
+
+    Returns:
+        (str, float): output path, max |logit difference| vs. the original
+    """
+    dst = dst or os.path.splitext(src)[0] + ".safetensors"
+    state_dict = torch.load(src, map_location="cpu")
+    model_name, num_classes = infer_architecture(state_dict)
+    class_names = class_names or [str(i) for i in range(num_classes)]
+    if len(class_names) != num_classes:
+        raise ValueError(f"{src} has {num_classes} outputs but {len(class_names)} class names were given")
+
+    model = get_model(model_name, num_classes=num_classes, pretrained=False)
+    model.load_state_dict(state_dict)
+    model.eval()
+
+    extra = {k: v for k, v in load_metadata(src).items() if k in ("calibration",)}
+    meta = checkpoint_metadata(model_name, class_names, img_size, converted_from=os.path.basename(src), **extra)
+    save_checkpoint(model, dst, metadata=meta, fp16=fp16)
+
+    x = torch.randn(4, 3, img_size, img_size)
+    with torch.no_grad():
+        diff = (model(x) - load_checkpoint(dst)(x)).abs().max().item()
+    return dst, diff
+
+
+if __name__ == "__main__":
+    from src.utils import load_config
+
+    parser = argparse.ArgumentParser(description="Convert .pt checkpoints to self-describing .safetensors")
+    parser.add_argument("checkpoints", nargs="+", help="Bare state_dict checkpoint files")
+    parser.add_argument("--out", type=str, default=None, help="Output path (single input only)")
+    parser.add_argument("--fp16", action="store_true", help="Store conv/linear weights in fp16")
+    args = parser.parse_args()
+    if args.out and len(args.checkpoints) > 1:
+        parser.error("--out only works with a single checkpoint")
+
+    cfg = load_config("config.yaml")
+    for path in args.checkpoints:
+        dst, diff = convert(path, args.out, cfg["data"]["class_names"], cfg["data"]["img_size"], args.fp16)
+        tolerance = 5e-2 if args.fp16 else 1e-5
+        status = "✅" if diff <= tolerance else "⚠️"
+        print(f"{status} {path} -> {dst} ({os.path.getsize(path) / 1e6:.1f} MB -> "
+              f"{os.path.getsize(dst) / 1e6:.1f} MB, max |Δlogit| {diff:.2e})")
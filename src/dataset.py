@@ -1,7 +1,11 @@
 # src/dataset.py
 
+import json
+import os
+
 import torch
-from torch.utils.data import DataLoader
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
 from torchvision import datasets, transforms
 
 
@@ -36,7 +40,81 @@ def build_transforms(img_size=224, train=True):
         ])
 
 
-def get_dataloaders(train_dir, val_dir, img_size, batch_size, num_workers):
+class ManifestDataset(Dataset):
+    """
+    ImageFolder-compatible dataset backed by manifest rows instead of a directory walk.
+
+    Exposes `classes`, `class_to_idx`, `samples` and `targets` like ImageFolder,
+    so `compute_class_weights` and the training loop work unchanged.
+    """
+
+    def __init__(self, rows, classes=None, transform=None):
+        self.classes = list(classes) if classes is not None else sorted(rows["label"].unique())
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+        self.samples = [(p, self.class_to_idx[l]) for p, l in zip(rows["path"], rows["label"])]
+        self.targets = [t for _, t in self.samples]
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        path, target = self.samples[idx]
+        with open(path, "rb") as f:
+            img = Image.open(f).convert("RGB")
+        if self.transform is not None:
+            img = self.transform(img)
+        return img, target
+
+
+def build_datasets(train_dir, val_dir, img_size, manifest_path=None):
+    """
+    Train/val datasets from the manifest when configured, else ImageFolder scans.
+
+    Returns:
+        train_ds, val_ds
+    """
+    if manifest_path:
+        from src.manifest import refresh_manifest
+
+        df = refresh_manifest(manifest_path, {"train": train_dir, "val": val_dir})
+        train_ds = ManifestDataset(df[df["split"] == "train"], transform=build_transforms(img_size, train=True))
+        val_ds   = ManifestDataset(df[df["split"] == "val"], classes=train_ds.classes,
+                                   transform=build_transforms(img_size, train=False))
+    else:
+        train_ds = datasets.ImageFolder(train_dir, transform=build_transforms(img_size, train=True))
+        val_ds   = datasets.ImageFolder(val_dir,   transform=build_transforms(img_size, train=False))
+    return train_ds, val_ds
+
+
+def loader_kwargs(num_workers, prefetch_factor=None, tuning_path=None):
+    """
+    DataLoader keyword arguments for this machine.
+
+    If `tuning_path` points at results from `python -m src.tune_loader` recorded
+    on a machine with the same CPU count, its best setting overrides the
+    arguments. Workers are kept alive across epochs, and memory is only pinned
+    when there is a GPU to copy to.
+    """
+    if tuning_path and os.path.exists(tuning_path):
+        with open(tuning_path) as f:
+            tuned = json.load(f)
+        if tuned.get("cpu_count") == os.cpu_count():
+            num_workers = tuned["best"]["num_workers"]
+            prefetch_factor = tuned["best"].get("prefetch_factor")
+        else:
+            print(f"⚠️ Ignoring {tuning_path}: tuned for {tuned.get('cpu_count')} CPUs, this host has {os.cpu_count()}")
+
+    kwargs = {"num_workers": num_workers, "pin_memory": torch.cuda.is_available()}
+    if num_workers > 0:
+        kwargs["persistent_workers"] = True
+        if prefetch_factor:
+            kwargs["prefetch_factor"] = prefetch_factor
+    return kwargs
+
+
+def get_dataloaders(train_dir, val_dir, img_size, batch_size, num_workers, manifest_path=None,
+                    tuning_path=None):
     """
     Loads ImageFolder datasets and returns dataloaders.
 
@@ -46,16 +124,55 @@ def get_dataloaders(train_dir, val_dir, img_size, batch_size, num_workers):
         img_size (int): Resize target size
         batch_size (int): Mini-batch size
         num_workers (int): DataLoader parallel workers
+        manifest_path (str): Optional manifest; when set, samples come from the
+            manifest (refreshed incrementally) instead of ImageFolder scans
+        tuning_path (str): Optional loader auto-tune results (see loader_kwargs)
 
     Returns:
         train_loader, val_loader, class_names
     """
-    train_ds = datasets.ImageFolder(train_dir, transform=build_transforms(img_size, train=True))
-    val_ds   = datasets.ImageFolder(val_dir,   transform=build_transforms(img_size, train=False))
+    train_ds, val_ds = build_datasets(train_dir, val_dir, img_size, manifest_path)
+    kwargs = loader_kwargs(num_workers, tuning_path=tuning_path)
+
+    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True, **kwargs)
+    val_loader   = DataLoader(val_ds,   batch_size=batch_size, shuffle=False, **kwargs)
+
+    return train_loader, val_loader, train_ds.classes
+
+
+def scheduled_resolution(schedule, epoch, img_size, batch_size):
+    """
+    Training resolution and batch size for an epoch under a progressive-resize schedule.
 
-    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True,
-                              num_workers=num_workers, pin_memory=True)
-    val_loader   = DataLoader(val_ds,   batch_size=batch_size, shuffle=False,
-                              num_workers=num_workers, pin_memory=True)
+    Args:
+        schedule (list): Stages like {"epochs": [1, 4], "img_size": 128, "batch_size": 64};
+            epochs not covered by any stage use the defaults
+        epoch (int): 1-based epoch number
+        img_size (int): Default (final) resolution
+        batch_size (int): Default batch size
+
+    Returns:
+        (img_size, batch_size)
+    """
+    for stage in schedule or []:
+        first, last = stage["epochs"]
+        if first <= epoch <= last:
+            return stage["img_size"], stage.get("batch_size", batch_size)
+    return img_size, batch_size
+
+
+def resize_train_loader(loader, img_size, batch_size):
+    """
+    New training loader over the same dataset at another resolution/batch size.
+
+    The dataset is reused (no rescan); only its transform and the loader's
+    workers are replaced, since persistent workers hold their own dataset copy.
+    """
+    dataset = loader.dataset
+    dataset.transform = build_transforms(img_size, train=True)
+    kwargs = {"num_workers": loader.num_workers, "pin_memory": loader.pin_memory}
+    if loader.num_workers > 0:
+        kwargs["persistent_workers"] = loader.persistent_workers
+        kwargs["prefetch_factor"] = loader.prefetch_factor
+    return DataLoader(dataset, batch_size=batch_size, shuffle=True, **kwargs)
 
-    return train_loader, val_loader, train_ds.classes
\ No newline at end of file
@@ -0,0 +1,75 @@
+# src/eval_ood.py
+"""
+AUROC of the checkpoint's OOD detector on a held-out out-of-distribution set.
+
+In-distribution = the test split (from the logits store); OOD = every image
+under --ood-dir (non-skin photos, other modalities, ...). The Mahalanobis
+score is compared with the softmax baseline (1 - max probability of the
+single original view), and the stored threshold's detection rate is shown.
+
+Usage:
+    python -m src.eval_ood --ood-dir data/ood
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.metrics import roc_auc_score, roc_curve
+
+from model.model import load_ood, mahalanobis_score
+from src.evaluate import eval_transform, load_eval_model, run_inference, score_split, softmax
+from src.predict import iter_inputs
+from src.utils import load_config
+
+
+def fpr_at_tpr(y_ood, scores, tpr=0.95):
+    """
+    Share of in-distribution images flagged when `tpr` of the OOD set is caught.
+    """
+    fpr, tpr_curve, _ = roc_curve(y_ood, scores)
+    return float(fpr[np.searchsorted(tpr_curve, tpr)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the OOD detector against a held-out OOD image set")
+    parser.add_argument("--ood-dir", type=str, required=True, help="Directory (or glob / @list) of OOD images")
+    args = parser.parse_args()
+
+    cfg = load_config("config.yaml")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    classes = cfg["data"]["class_names"]
+    ckpt_path = os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
+    ood = load_ood(ckpt_path)
+    if ood is None:
+        raise SystemExit(f"❌ {ckpt_path} has no OOD detector; run `python -m src.fit_ood` first")
+
+    samples, store = score_split(cfg, ckpt_path, "test", device, embeddings=True)
+    hashes = samples["sha1"].tolist()
+    in_emb, in_logits = store.get("embeddings", hashes), store.get("logits", hashes)
+
+    # OOD images are not in any split: label them with an arbitrary class for the loader
+    ood_paths = list(iter_inputs([args.ood_dir]))
+    rows = pd.DataFrame({"path": ood_paths, "label": classes[0]})
+    print(f"🔄 Scoring {len(rows)} OOD images")
+    model = load_eval_model(cfg, ckpt_path, device)
+    out = run_inference(model, rows, eval_transform(cfg, ckpt_path), classes, device,
+                        num_workers=cfg["data"]["num_workers"], embeddings=True)
+
+    y_ood = np.r_[np.zeros(len(in_emb)), np.ones(len(rows))]
+    maha = mahalanobis_score(torch.as_tensor(np.r_[in_emb, out["embeddings"]]), ood).numpy()
+    msp = 1 - softmax(np.r_[in_logits, out["logits"]]).max(axis=1)
+
+    print(f"\n🛡️ OOD detection: {len(in_emb)} test (in-distribution) vs {len(rows)} OOD images")
+    print(f"  {'score':<14}{'AUROC':>8}{'FPR@95TPR':>12}")
+    for name, scores in (("mahalanobis", maha), ("1 - max prob", msp)):
+        print(f"  {name:<14}{roc_auc_score(y_ood, scores):>8.4f}{fpr_at_tpr(y_ood, scores):>12.4f}")
+
+    flagged = maha > ood["threshold"]
+    print(f"\n  Stored threshold {ood['threshold']:.1f}: flags {flagged[y_ood == 1].mean():.1%} of OOD "
+          f"and {flagged[y_ood == 0].mean():.1%} of test images")
+
+
+if __name__ == "__main__":
+    main()
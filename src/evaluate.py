@@ -1,15 +1,23 @@
 # src/evaluate.py
 
+import argparse
 import os
+import time
 import torch
 import numpy as np
-from sklearn.metrics import classification_report, confusion_matrix
+import pandas as pd
+from sklearn.metrics import classification_report, confusion_matrix, f1_score, recall_score
 import matplotlib.pyplot as plt
 from torch.utils.data import DataLoader
-from torchvision import datasets, transforms
+from torchvision import datasets
+from tqdm import tqdm
 
+from api.utils import TTA_POLICIES, transform_from_metadata, tta_batch
 from src.utils import load_config 
-from model.model import load_checkpoint
+from src.dataset import ManifestDataset
+from src.logits_store import LogitsStore, checkpoint_key
+from src.manifest import file_sha1, refresh_manifest
+from model.model import get_head, load_checkpoint, load_metadata
 
 
 def plot_confusion_matrix(cm, classes, out_path):
@@ -37,48 +45,235 @@ def plot_confusion_matrix(cm, classes, out_path):
     plt.close(fig)
 
 
-def main():
-    cfg = load_config("config.yaml")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+def split_samples(cfg, split="test"):
+    """
+    Images of one split as a DataFrame with path, label and sha1 columns.
+
+    Uses the manifest when configured (hashes are already there); otherwise
+    scans the split directory and hashes the files.
+    """
+    split_dir = cfg["data"][f"{split}_dir"]
+    if cfg["data"].get("manifest"):
+        df = refresh_manifest(cfg["data"]["manifest"], {split: split_dir})
+        return df[df["split"] == split][["path", "label", "sha1"]].reset_index(drop=True)
+
+    folder = datasets.ImageFolder(split_dir)
+    return pd.DataFrame({
+        "path": [p for p, _ in folder.samples],
+        "label": [folder.classes[t] for _, t in folder.samples],
+        "sha1": [file_sha1(p) for p, _ in folder.samples],
+    })
+
+
+def test_samples(cfg):
+    return split_samples(cfg, "test")
+
+
+def eval_preprocessing(cfg, ckpt_path):
+    """
+    img_size/mean/std a checkpoint was trained with (its metadata), with
+    config.yaml's img_size for legacy checkpoints that carry none.
+    """
+    meta = {"img_size": cfg["data"]["img_size"], **load_metadata(ckpt_path)}
+    return {k: meta[k] for k in ("img_size", "mean", "std") if k in meta}
+
 
-    tfm = transforms.Compose([
-        transforms.Resize((cfg["data"]["img_size"], cfg["data"]["img_size"])),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                             std=[0.229, 0.224, 0.225])
-    ])
+def eval_transform(cfg, ckpt_path):
+    return transform_from_metadata(eval_preprocessing(cfg, ckpt_path))
 
-    test_ds = datasets.ImageFolder(cfg["data"]["test_dir"], transform=tfm)
-    test_loader = DataLoader(test_ds, batch_size=32, shuffle=False, num_workers=cfg["data"]["num_workers"])
 
-    model = load_checkpoint(
-        os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"]),
+def load_eval_model(cfg, ckpt_path, device):
+    return load_checkpoint(
+        ckpt_path,
         model_name=cfg["model"]["name"],
         num_classes=cfg["model"]["num_classes"],
         device=device
     )
 
+
+def score_split(cfg, ckpt_path, split="test", device="cpu", tta=False, embeddings=False, model=None):
+    """
+    Logits store of a checkpoint, brought up to date for one split.
+
+    Only images the store has not seen (by content hash) go through the
+    network; the model is loaded lazily if `model` is not given.
+
+    Returns:
+        samples (pandas.DataFrame), store (LogitsStore)
+    """
+    classes = cfg["data"]["class_names"]
+    samples = split_samples(cfg, split)
+    store = LogitsStore(cfg["eval"]["logits_dir"], checkpoint_key(ckpt_path))
+
+    required = ("logits",) + (("tta_logits",) if tta else ()) + (("embeddings",) if embeddings else ())
+    todo = set(store.missing(samples["sha1"].tolist(), required))
+    if todo:
+        print(f"🔄 Running inference on {len(todo)}/{len(samples)} {split} images not in the logits store")
+        model = model or load_eval_model(cfg, ckpt_path, device)
+        rows = samples[samples["sha1"].isin(todo)].drop_duplicates("sha1").reset_index(drop=True)
+        arrays = run_inference(model, rows, eval_transform(cfg, ckpt_path), classes, device,
+                               num_workers=cfg["data"]["num_workers"], tta=tta, embeddings=embeddings)
+        store.add(rows["sha1"].tolist(), rows["label"].tolist(), rows["path"].tolist(), arrays)
+    else:
+        print(f"⚡ All {len(samples)} {split} images found in the logits store ({store.dir})")
+    return samples, store
+
+
+def run_inference(model, rows, tfm, classes, device, batch_size=32, num_workers=0, tta=False, embeddings=False):
+    """
+    Logits (and optionally per-view TTA logits / penultimate embeddings) for rows.
+
+    Returns:
+        dict: name -> np.ndarray, ready for LogitsStore.add
+    """
+    ds = ManifestDataset(rows, classes=classes, transform=tfm)
+    loader = DataLoader(ds, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+    captured = []
+    hook = get_head(model).register_forward_hook(lambda m, inp, out: captured.append(inp[0].detach())) if embeddings else None
+    out = {"logits": [], "tta_logits": [], "embeddings": []}
     model.eval()
-    y_true, y_pred = [], []
     with torch.no_grad():
-        for x, y in test_loader:
+        for x, _ in tqdm(loader, desc="Inference"):
             x = x.to(device)
-            outputs = model(x)
-            preds = torch.argmax(outputs, dim=1).cpu().numpy()
-            y_pred.extend(preds)
-            y_true.extend(y.numpy())
+            if tta:
+                views = tta_batch(x, "full")
+                b, v = views.shape[:2]
+                logits = model(views.flatten(0, 1)).view(b, v, -1)
+                out["tta_logits"].append(logits.cpu().numpy())
+                out["logits"].append(logits[:, 0].cpu().numpy())
+                if embeddings:
+                    out["embeddings"].append(captured.pop().view(b, v, -1)[:, 0].cpu().numpy())
+            else:
+                out["logits"].append(model(x).cpu().numpy())
+                if embeddings:
+                    out["embeddings"].append(captured.pop().cpu().numpy())
+    if hook is not None:
+        hook.remove()
+    return {k: np.concatenate(v) for k, v in out.items() if v}
+
+
+def softmax(logits, axis=-1):
+    z = logits - logits.max(axis=axis, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=axis, keepdims=True)
+
+
+def threshold_sweep(probs, y_true, thresholds):
+    """
+    Coverage and accuracy on accepted samples for max-probability OOD thresholds.
+    """
+    conf = probs.max(axis=1)
+    pred = probs.argmax(axis=1)
+    print("\nOOD threshold sweep (max softmax probability):")
+    print(f"  {'threshold':>9}  {'coverage':>8}  {'acc (accepted)':>14}")
+    for t in thresholds:
+        accepted = conf >= t
+        acc = (pred[accepted] == y_true[accepted]).mean() if accepted.any() else float("nan")
+        print(f"  {t:>9.2f}  {accepted.mean():>8.3f}  {acc:>14.4f}")
+
+
+def tta_policy_report(model, tta_logits, y_true, classes, x, policies):
+    """
+    Accuracy / macro-F1 / melanoma recall and CPU cost for each TTA policy.
+
+    Quality comes from the stored per-view logits (views of the "full" policy),
+    averaged over each policy's subset of views exactly like the API does.
+    Cost is CPU time of a batched forward over that policy's views of `x`.
+
+    Returns:
+        pandas.DataFrame: one row per policy
+    """
+    full = TTA_POLICIES["full"]
+    probs_per_view = softmax(tta_logits)
+    mel = classes.index("mel") if "mel" in classes else None
+    rows = []
+    for policy in policies:
+        idx = [full.index(v) for v in TTA_POLICIES[policy]]
+        y_pred = probs_per_view[:, idx].mean(axis=1).argmax(axis=1)
+        recalls = recall_score(y_true, y_pred, labels=range(len(classes)), average=None, zero_division=0)
+
+        with torch.no_grad():
+            model(tta_batch(x, policy).flatten(0, 1))  # warmup
+            t0 = time.process_time()
+            model(tta_batch(x, policy).flatten(0, 1))
+            cpu_ms = 1000 * (time.process_time() - t0) / x.size(0)
+
+        rows.append({
+            "policy": policy,
+            "views": len(idx),
+            "accuracy": float((y_pred == y_true).mean()),
+            "macro_f1": f1_score(y_true, y_pred, labels=range(len(classes)), average="macro", zero_division=0),
+            "mel_recall": recalls[mel] if mel is not None else float("nan"),
+            "cpu_ms_per_image": cpu_ms,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a checkpoint on the test split")
+    parser.add_argument("--tta", action="store_true", help="Also store per-view TTA logits")
+    parser.add_argument("--embeddings", action="store_true", help="Also store penultimate embeddings")
+    parser.add_argument("--thresholds", type=float, nargs="*", default=None,
+                        help="Print an OOD threshold sweep for these max-probability thresholds "
+                             "(no values = 0.05, 0.10, ..., 0.95)")
+    parser.add_argument("--tta-policies", nargs="*", default=None, choices=list(TTA_POLICIES),
+                        help="Compare accuracy and CPU cost of these TTA policies (implies --tta; "
+                             "no names = all policies)")
+    args = parser.parse_args()
+    if args.thresholds == []:
+        args.thresholds = np.round(np.linspace(0.05, 0.95, 19), 2).tolist()
+    if args.tta_policies == []:
+        args.tta_policies = list(TTA_POLICIES)
+    args.tta = args.tta or args.tta_policies is not None
+
+    cfg = load_config("config.yaml")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    ckpt_path = os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
+    classes = load_metadata(ckpt_path).get("class_names", cfg["data"]["class_names"])  # logit column order
+    tfm = eval_transform(cfg, ckpt_path)
+
+    model = load_eval_model(cfg, ckpt_path, device) if args.tta_policies else None
+    samples, store = score_split(cfg, ckpt_path, "test", device, tta=args.tta, embeddings=args.embeddings,
+                                 model=model)
+
+    hashes = samples["sha1"].tolist()
+    logits = store.get("logits", hashes)
+    y_true = np.array([classes.index(label) for label in samples["label"]])
+    y_pred = logits.argmax(axis=1)
 
     # Save classification report
     os.makedirs(cfg["eval"]["outputs_dir"], exist_ok=True)
     report_path = os.path.join(cfg["eval"]["outputs_dir"], cfg["eval"]["report_txt_name"])
-    report = classification_report(y_true, y_pred, target_names=test_ds.classes, digits=4)
+    report = classification_report(y_true, y_pred, labels=range(len(classes)), target_names=classes, digits=4)
     print(report)
     with open(report_path, "w") as f:
         f.write(report)
 
     # Save confusion matrix
     if cfg["eval"]["save_cm_png"]:
-        cm = confusion_matrix(y_true, y_pred)
+        cm = confusion_matrix(y_true, y_pred, labels=range(len(classes)))
         cm_path = os.path.join(cfg["eval"]["outputs_dir"], cfg["eval"]["cm_png_name"])
-        plot_confusion_matrix(cm, test_ds.classes, cm_path)
+        plot_confusion_matrix(cm, classes, cm_path)
         print(f"✅ Confusion matrix saved to: {cm_path}")
+
+    if args.thresholds:
+        if store.has("tta_logits", hashes):
+            probs = softmax(store.get("tta_logits", hashes)).mean(axis=1)  # same averaging as the API
+        else:
+            probs = softmax(logits)
+        threshold_sweep(probs, y_true, args.thresholds)
+
+    if args.tta_policies:
+        timing_rows = samples.drop_duplicates("sha1").head(32).reset_index(drop=True)
+        x = torch.stack([img for img, _ in ManifestDataset(timing_rows, classes=classes, transform=tfm)]).to(device)
+        table = tta_policy_report(model, store.get("tta_logits", hashes), y_true, classes, x, args.tta_policies)
+        table_path = os.path.join(cfg["eval"]["outputs_dir"], "tta_policies.csv")
+        table.to_csv(table_path, index=False)
+        print("\nTTA policies (quality from stored per-view logits, cost from a timed batch):")
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        print(f"📄 Saved to {table_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# src/fit_ood.py
+"""
+Fit the Mahalanobis OOD detector of a checkpoint on its train embeddings.
+
+Penultimate embeddings of data/train (single view, from the logits store) give
+per-class means and one shared, Ledoit-Wolf-shrunk covariance whose inverse is
+stored in the checkpoint next to the weights. The decision threshold is the
+validation-set quantile that keeps `--tpr` of in-distribution images (95% by
+default). The API then flags an upload as UNKNOWN from the embedding of its
+original view alone.
+
+Usage:
+    python -m src.fit_ood --tpr 0.95
+    python -m src.fit_ood --checkpoint checkpoints/resnet18.safetensors   # cascade fast stage
+"""
+import argparse
+import os
+
+import numpy as np
+import torch
+from sklearn.covariance import LedoitWolf
+
+from model.model import mahalanobis_score, ood_detector, save_ood
+from src.evaluate import score_split
+from src.utils import load_config
+
+
+def fit_gaussian(embeddings, labels, num_classes):
+    """
+    Class means [C, D] and shared precision [D, D] of labelled embeddings.
+    """
+    means = np.stack([embeddings[labels == c].mean(axis=0) for c in range(num_classes)])
+    centered = embeddings - means[labels]
+    precision = LedoitWolf(assume_centered=True).fit(centered).precision_
+    return means.astype(np.float32), precision.astype(np.float32)
+
+
+def split_embeddings(cfg, ckpt_path, split, device):
+    samples, store = score_split(cfg, ckpt_path, split, device, embeddings=True)
+    classes = cfg["data"]["class_names"]
+    labels = np.array([classes.index(label) for label in samples["label"]])
+    return store.get("embeddings", samples["sha1"].tolist()), labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the Mahalanobis OOD detector on train embeddings")
+    parser.add_argument("--tpr", type=float, default=0.95, help="Share of val images kept in-distribution")
+    parser.add_argument("--checkpoint", type=str, default=None, help="Checkpoint to fit (default: the served one)")
+    args = parser.parse_args()
+
+    cfg = load_config("config.yaml")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    ckpt_path = args.checkpoint or os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
+
+    train_emb, train_y = split_embeddings(cfg, ckpt_path, "train", device)
+    means, precision = fit_gaussian(train_emb, train_y, cfg["model"]["num_classes"])
+    print(f"📐 Fitted {means.shape[0]} class means, {means.shape[1]}-d shared precision on {len(train_y)} images")
+
+    val_emb, _ = split_embeddings(cfg, ckpt_path, "val", device)
+    val_scores = mahalanobis_score(torch.as_tensor(val_emb), ood_detector(means, precision)).numpy()
+    threshold = float(np.quantile(val_scores, args.tpr))
+    save_ood(ckpt_path, means, precision, threshold=threshold, tpr=args.tpr, fitted_on=len(train_y))
+    print(f"✅ OOD detector saved to {ckpt_path} (threshold {threshold:.1f} keeps {args.tpr:.0%} of val)")
+
+
+if __name__ == "__main__":
+    main()
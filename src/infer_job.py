@@ -0,0 +1,238 @@
+# src/infer_job.py
+"""
+Sharded, resumable offline inference built on the src.predict model path.
+
+A job freezes its input list (a manifest split, or directories / globs / @file
+lists) into <jobs_dir>/<name>/inputs.parquet and cuts it into fixed-size
+shards. Shards run on a spawn-based process pool; each worker loads the model
+once and writes its shard atomically to shards/shard-NNNNN.parquet. The parent
+records every finished shard (row offsets, counts, timing) in progress.json;
+a failing shard is recorded there too and stops the job without waiting for
+the shards still queued.
+
+After a kill, re-running the same command skips finished shards (a shard file
+on disk counts as finished even if progress.json missed it) and continues.
+When every shard is done they are merged in shard order, so the final file
+is identical regardless of which process finished first.
+
+Usage:
+    python -m src.infer_job --name archive-2024 --inputs /mnt/archive --out outputs/archive.parquet
+    python -m src.infer_job --name test-split --split test
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from model.model import load_metadata
+from src.logits_store import checkpoint_key
+from src.manifest import load_manifest
+from src.predict import (ResultWriter, checkpoint_path, checkpoint_spec, decode_batch, iter_batches,
+                         iter_inputs, load_predictor, prediction_rows)
+
+_worker = {}
+
+# Checkpoint metadata that changes the scores; part of the job fingerprint
+SCORING_METADATA = ("calibration", "class_names", "img_size", "mean", "std")
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def shard_path(job_dir, shard_id):
+    return os.path.join(job_dir, "shards", f"shard-{shard_id:05d}.parquet")
+
+
+def create_job(job_dir, paths, ckpt_path, shard_size):
+    """
+    Freeze the input list and job parameters, or reopen an existing job.
+
+    Returns:
+        dict: job description (job.json)
+    """
+    job_file = os.path.join(job_dir, "job.json")
+    key = checkpoint_key(ckpt_path)
+    # checkpoint_key leaves safetensors metadata out, but recalibrating or new
+    # preprocessing changes the scores just as much as new weights do
+    meta = load_metadata(ckpt_path)
+    scoring = {k: meta.get(k) for k in SCORING_METADATA}
+    if os.path.exists(job_file):
+        with open(job_file) as f:
+            job = json.load(f)
+        if job["checkpoint_key"] != key or job.get("scoring_metadata") != scoring:
+            raise SystemExit(f"❌ {ckpt_path} changed since job '{os.path.basename(job_dir)}' started; "
+                             f"use a new --name (or delete {job_dir}) to re-score")
+        print(f"🔄 Resuming job with {job['n_items']} images in {job['n_shards']} shards")
+        return job
+
+    if paths is None:
+        raise SystemExit("❌ New job needs --inputs or --split")
+    os.makedirs(os.path.join(job_dir, "shards"), exist_ok=True)
+    inputs = pd.DataFrame({"path": list(paths)})
+    inputs.to_parquet(os.path.join(job_dir, "inputs.parquet"), index=False)
+    n_items = len(inputs)
+    job = {
+        "checkpoint": ckpt_path,
+        "checkpoint_key": key,
+        "scoring_metadata": scoring,
+        "n_items": n_items,
+        "shard_size": shard_size,
+        "n_shards": (n_items + shard_size - 1) // shard_size,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    _write_json(job_file, job)
+    print(f"🆕 Job with {n_items} images in {job['n_shards']} shards of {shard_size}")
+    return job
+
+
+def load_progress(job_dir, job):
+    """
+    Finished shards: progress.json entries plus any shard file already on disk.
+    """
+    path = os.path.join(job_dir, "progress.json")
+    progress = {"completed": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            progress = json.load(f)
+    for shard_id in range(job["n_shards"]):
+        if str(shard_id) not in progress["completed"] and os.path.exists(shard_path(job_dir, shard_id)):
+            start = shard_id * job["shard_size"]
+            progress["completed"][str(shard_id)] = {
+                "start": start, "stop": min(start + job["shard_size"], job["n_items"]), "recovered": True,
+            }
+    return progress
+
+
+def _init_worker(cfg, threads):
+    # Set before torch spins up its pools in this process
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, calibration = load_predictor(cfg, device)
+    _worker.update(cfg=cfg, model=model, calibration=calibration, device=device, spec=checkpoint_spec(cfg))
+
+
+def run_shard(job_dir, shard_id, start, stop, batch_size):
+    """
+    Score rows [start, stop) of the job inputs into one shard file (worker process).
+    """
+    t0 = time.perf_counter()
+    spec = _worker["spec"]
+    paths = pq.read_table(os.path.join(job_dir, "inputs.parquet"), columns=["path"]) \
+        .slice(start, stop - start).column("path").to_pylist()
+
+    out = shard_path(job_dir, shard_id)
+    tmp = out.replace(".parquet", ".tmp.parquet")
+    writer = ResultWriter(tmp, spec["class_names"])
+    n_errors = 0
+    for batch in iter_batches(paths, batch_size):
+        pixels, errors = decode_batch(batch, spec["img_size"])
+        writer.write(prediction_rows(_worker["model"], _worker["calibration"], batch, pixels, errors,
+                                     spec["class_names"], _worker["device"], spec["mean"], spec["std"]))
+        n_errors += sum(err is not None for err in errors)
+    writer.close()
+    os.replace(tmp, out)  # a shard either exists completely or not at all
+    return shard_id, {"start": start, "stop": stop, "errors": n_errors, "seconds": time.perf_counter() - t0}
+
+
+def merge_shards(job_dir, job, out_path, class_names):
+    """
+    Concatenate shard outputs in shard order into the final result file.
+    """
+    writer = ResultWriter(out_path, class_names)
+    for shard_id in range(job["n_shards"]):
+        for batch in pq.ParquetFile(shard_path(job_dir, shard_id)).iter_batches():
+            writer.write([[row[c] for c in writer.columns] for row in batch.to_pylist()])
+    writer.close()
+
+
+def run_job(cfg, name, paths=None, out_path=None, processes=None, shard_size=None):
+    """
+    Create or resume job `name`, run its pending shards and merge them.
+
+    Returns:
+        str: path of the merged result file
+    """
+    infer_cfg = cfg.get("infer", {})
+    job_dir = os.path.join(infer_cfg.get("jobs_dir", "outputs/jobs"), name)
+    job = create_job(job_dir, paths, checkpoint_path(cfg), shard_size or infer_cfg.get("shard_size", 1000))
+    progress = load_progress(job_dir, job)
+    progress_file = os.path.join(job_dir, "progress.json")
+    _write_json(progress_file, progress)
+
+    pending = [s for s in range(job["n_shards"]) if str(s) not in progress["completed"]]
+    processes = max(1, min(processes or infer_cfg.get("processes", 4), len(pending) or 1))
+    threads = infer_cfg.get("threads_per_process") or max(1, (os.cpu_count() or 1) // processes)
+    batch_size = infer_cfg.get("batch_size", 64)
+
+    if pending:
+        print(f"🚀 {len(pending)}/{job['n_shards']} shards to go on {processes} processes x {threads} threads")
+        t0 = time.perf_counter()
+        done_images = 0
+        with ProcessPoolExecutor(max_workers=processes, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(cfg, threads)) as pool:
+            futures = {}
+            for s in pending:
+                start = s * job["shard_size"]
+                futures[pool.submit(run_shard, job_dir, s, start,
+                                    min(start + job["shard_size"], job["n_items"]), batch_size)] = s
+            for fut in as_completed(futures):
+                try:
+                    shard_id, stats = fut.result()
+                except Exception as e:
+                    # Queued shards are dropped; the ones already running finish and are kept for the resume
+                    progress.setdefault("failed", {})[str(futures[fut])] = f"{type(e).__name__}: {e}"
+                    _write_json(progress_file, progress)
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise SystemExit(f"❌ Shard {futures[fut]} failed ({type(e).__name__}: {e}); "
+                                     f"re-run with --name {name} to resume") from e
+                progress.get("failed", {}).pop(str(shard_id), None)
+                progress["completed"][str(shard_id)] = stats
+                _write_json(progress_file, progress)
+                done_images += stats["stop"] - stats["start"]
+                rate = done_images / (time.perf_counter() - t0)
+                print(f"  shard {shard_id}: {stats['stop'] - stats['start']} images, {stats['errors']} unreadable "
+                      f"| {len(progress['completed'])}/{job['n_shards']} done | {rate:.1f} img/s")
+    else:
+        print("⚡ Every shard already finished")
+
+    out_path = out_path or os.path.join(job_dir, "predictions.parquet")
+    merge_shards(job_dir, job, out_path, checkpoint_spec(cfg)["class_names"])
+    print(f"✅ Merged {job['n_shards']} shards ({job['n_items']} images) -> {out_path}")
+    return out_path
+
+
+if __name__ == "__main__":
+    from src.utils import load_config
+
+    parser = argparse.ArgumentParser(description="Sharded, resumable offline inference")
+    parser.add_argument("--name", required=True, help="Job name; re-run with the same name to resume")
+    parser.add_argument("--inputs", nargs="+", default=None, help="Directories, glob patterns or @file lists")
+    parser.add_argument("--split", type=str, default=None, help="Score a split of the data manifest instead")
+    parser.add_argument("--out", type=str, default=None, help="Merged output (.csv, .jsonl or .parquet)")
+    parser.add_argument("--processes", type=int, default=None, help="Override infer.processes")
+    parser.add_argument("--shard-size", type=int, default=None, help="Override infer.shard_size (new jobs only)")
+    args = parser.parse_args()
+
+    cfg = load_config("config.yaml")
+    paths = None
+    if args.inputs:
+        paths = iter_inputs(args.inputs)
+    elif args.split:
+        manifest = load_manifest(cfg["data"]["manifest"])
+        paths = manifest.loc[manifest["split"] == args.split, "path"].sort_values()
+
+    run_job(cfg, args.name, paths=paths, out_path=args.out, processes=args.processes, shard_size=args.shard_size)
@@ -0,0 +1,240 @@
+# src/load_test.py
+"""
+Load generator for the API: throughput, latency percentiles and error rates.
+
+Two arrival models:
+    closed   N concurrent clients, each sending its next request as soon as the
+             previous one returns (measures capacity)
+    open     Poisson arrivals at a fixed rate regardless of how the server keeps
+             up; latency is counted from the scheduled send time, so queueing
+             in the client is not hidden (no coordinated omission)
+
+Requests carry synthetic JPEGs drawn from a weighted image-size mix. With
+--sweep, the run is repeated for each concurrency (closed) or rate (open) and
+the saturation point is reported: the first level where throughput stops
+growing by --min-gain or p99 exceeds --p99-slo. --start-server launches a
+local uvicorn (api.app) for the run and stops it afterwards.
+
+Usage:
+    python -m src.load_test --start-server --mode closed --sweep 1 2 4 8 16 32 --duration 20
+    python -m src.load_test --url http://127.0.0.1:8000 --mode open --rate 5 --mix 600x450:0.8,4032x3024:0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from src.synthetic import jpeg_bytes, synthetic_image
+
+DEFAULT_MIX = "224x224:0.2,600x450:0.6,4032x3024:0.2"
+
+
+def parse_mix(spec):
+    """
+    "WxH:weight,..." -> {"WxH": ((W, H), weight)}
+    """
+    mix = {}
+    for item in spec.split(","):
+        size, _, weight = item.partition(":")
+        w, h = (int(v) for v in size.lower().split("x"))
+        mix[size] = ((w, h), float(weight or 1))
+    return mix
+
+
+def build_payloads(mix, per_size=8):
+    """
+    A few distinct JPEGs per size (distinct bytes, so no response cache is hit).
+    """
+    return {name: [jpeg_bytes(synthetic_image(w, h, seed=i)) for i in range(per_size)]
+            for name, ((w, h), _) in mix.items()}
+
+
+class Picker:
+    def __init__(self, mix, payloads, seed=0):
+        self.names = list(mix)
+        self.weights = [mix[n][1] for n in self.names]
+        self.payloads = payloads
+        self.rng = random.Random(seed)
+
+    def __call__(self):
+        name = self.rng.choices(self.names, self.weights)[0]
+        return name, self.rng.choice(self.payloads[name])
+
+
+async def send(client, url, data):
+    """
+    POST one image; returns the HTTP status code or the exception name.
+    """
+    try:
+        response = await client.post(url, files={"file": ("load.jpg", data, "image/jpeg")})
+        return response.status_code
+    except httpx.HTTPError as e:
+        return type(e).__name__
+
+
+async def closed_loop(client, url, picker, concurrency, duration, warmup):
+    records = []
+    t_start = time.perf_counter()
+    t_measure, t_end = t_start + warmup, t_start + warmup + duration
+
+    async def client_loop():
+        while time.perf_counter() < t_end:
+            size, data = picker()
+            t0 = time.perf_counter()
+            status = await send(client, url, data)
+            if t0 >= t_measure:
+                records.append((size, 1000 * (time.perf_counter() - t0), status))
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return records, time.perf_counter() - t_measure
+
+
+async def open_loop(client, url, picker, rate, duration, warmup, seed=0):
+    records = []
+    rng = random.Random(seed)
+    t_start = time.perf_counter()
+    t_measure, t_end = t_start + warmup, t_start + warmup + duration
+
+    async def timed(scheduled, size, data):
+        status = await send(client, url, data)
+        if scheduled >= t_measure:
+            records.append((size, 1000 * (time.perf_counter() - scheduled), status))
+
+    tasks = []
+    scheduled = t_start
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled > t_end:
+            break
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        tasks.append(asyncio.create_task(timed(scheduled, *picker())))
+    await asyncio.gather(*tasks)
+    return records, time.perf_counter() - t_measure
+
+
+def summarize(records, elapsed):
+    """
+    Throughput, latency percentiles (successful requests) and error rate of one run.
+    """
+    ok = np.array([ms for _, ms, status in records if status == 200])
+    errors = pd.Series([str(status) for _, _, status in records if status != 200], dtype=object)
+    pct = np.percentile(ok, [50, 95, 99]) if len(ok) else [np.nan] * 3
+    return {
+        "requests": len(records),
+        "throughput_rps": len(ok) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": pct[0],
+        "p95_ms": pct[1],
+        "p99_ms": pct[2],
+        "max_ms": ok.max() if len(ok) else np.nan,
+        "error_rate": len(errors) / len(records) if records else 0.0,
+        "errors": errors.value_counts().to_dict(),
+    }
+
+
+async def run_level(url, mode, level, picker, duration, warmup, timeout, max_connections):
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        if mode == "closed":
+            return await closed_loop(client, url, picker, int(level), duration, warmup)
+        return await open_loop(client, url, picker, float(level), duration, warmup)
+
+
+def saturation_point(table, min_gain=0.05, p99_slo=None):
+    """
+    Last sweep level before throughput stops growing by `min_gain` or p99 breaks the SLO.
+    """
+    best = None
+    for _, row in table.iterrows():
+        if p99_slo is not None and row["p99_ms"] > p99_slo:
+            break
+        if best is not None and row["throughput_rps"] < best["throughput_rps"] * (1 + min_gain):
+            break
+        best = row
+    return best
+
+
+def start_server(port, workers=1, timeout=180):
+    """
+    uvicorn api.app on 127.0.0.1:port, returned once /health answers.
+    """
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.app:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--workers", str(workers), "--log-level", "warning"])
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"❌ uvicorn exited with code {proc.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=2).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    proc.terminate()
+    raise SystemExit(f"❌ Server did not become healthy within {timeout}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the API and find its saturation point")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="Base URL of a running API")
+    parser.add_argument("--start-server", action="store_true", help="Start a local uvicorn for the run")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--endpoint", type=str, default="/predict", help="Path (and query), e.g. /predict?explain=true")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clients in closed mode")
+    parser.add_argument("--rate", type=float, default=5.0, help="Poisson arrivals per second in open mode")
+    parser.add_argument("--sweep", nargs="*", type=float, default=None,
+                        help="Concurrency levels (closed) or rates (open) to run in turn")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="Image sizes and weights, WxH:weight,...")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before each level")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout (seconds)")
+    parser.add_argument("--max-connections", type=int, default=256)
+    parser.add_argument("--min-gain", type=float, default=0.05, help="Throughput growth that still counts")
+    parser.add_argument("--p99-slo", type=float, default=None, help="p99 latency budget in ms")
+    parser.add_argument("--out", type=str, default="outputs/load_test.csv")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}" if args.start_server else args.url.rstrip("/")
+    url = base_url + args.endpoint
+    mix = parse_mix(args.mix)
+    picker = Picker(mix, build_payloads(mix))
+    levels = args.sweep or [args.concurrency if args.mode == "closed" else args.rate]
+    unit = "clients" if args.mode == "closed" else "req/s offered"
+
+    server = start_server(args.port, args.server_workers) if args.start_server else None
+    rows = []
+    try:
+        for level in levels:
+            print(f"🚦 {args.mode} loop, {level:g} {unit}: {args.warmup:g}s warmup + {args.duration:g}s")
+            records, elapsed = asyncio.run(run_level(url, args.mode, level, picker, args.duration, args.warmup,
+                                                     args.timeout, args.max_connections))
+            row = {"mode": args.mode, "level": level, **summarize(records, elapsed)}
+            rows.append(row)
+            print(f"  {row['throughput_rps']:.2f} req/s | p50 {row['p50_ms']:.0f} ms | p95 {row['p95_ms']:.0f} ms | "
+                  f"p99 {row['p99_ms']:.0f} ms | max {row['max_ms']:.0f} ms | errors {row['error_rate']:.1%}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    table = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    table.to_csv(args.out, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.precision", 2):
+        print(table.drop(columns="errors").to_string(index=False))
+    if len(rows) > 1:
+        best = saturation_point(table, args.min_gain, args.p99_slo)
+        if best is None:
+            print("⚠️ Even the first level breaks the p99 SLO")
+        else:
+            print(f"📈 Saturation: {best['level']:g} {unit} -> {best['throughput_rps']:.2f} req/s "
+                  f"(p99 {best['p99_ms']:.0f} ms)")
+    print(f"✅ Results saved to {args.out}")
@@ -0,0 +1,164 @@
+# src/logits_store.py
+"""
+Per-sample model outputs persisted for instant re-evaluation.
+
+Layout (one directory per checkpoint, keyed by the checkpoint's content hash):
+
+    <root>/<checkpoint_key>/index.parquet    sha1, label, path (row order)
+    <root>/<checkpoint_key>/logits.npy       float32 [N, C]
+    <root>/<checkpoint_key>/tta_logits.npy   float32 [N, V, C]   (optional)
+    <root>/<checkpoint_key>/embeddings.npy   float32 [N, D]      (optional)
+
+Arrays are opened with mmap, so reading a few thousand rows costs
+milliseconds. Rows are keyed by image content hash: renamed files hit the
+cache, and edited files miss it. Every array has a row for every index entry;
+rows that were added without an optional array hold NaN there until it is
+computed for them.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ARRAYS = ("logits", "tta_logits", "embeddings")
+
+
+def checkpoint_key(path, length=16):
+    """
+    Content hash of a checkpoint file, used as the store directory name.
+
+    For .safetensors files only the model's tensor data is hashed, so
+    metadata edits and auxiliary tensors (e.g. fitting calibration or the
+    ood.* detector statistics) keep the stored raw logits valid.
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        if not path.endswith(".safetensors"):
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+            return h.hexdigest()[:length]
+
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+        for name in sorted(k for k in header if k != "__metadata__" and not k.startswith("ood.")):
+            start, end = header[name]["data_offsets"]
+            f.seek(8 + header_len + start)
+            h.update(name.encode())
+            h.update(f.read(end - start))
+    return h.hexdigest()[:length]
+
+
+class LogitsStore:
+    """
+    Memory-mapped outputs of one checkpoint, addressable by image sha1.
+    """
+
+    def __init__(self, root, key):
+        self.dir = os.path.join(root, key)
+        self._load()
+
+    def _load(self):
+        index_path = os.path.join(self.dir, "index.parquet")
+        if os.path.exists(index_path):
+            self.index = pd.read_parquet(index_path)
+        else:
+            self.index = pd.DataFrame({"sha1": pd.Series(dtype="object"), "label": pd.Series(dtype="object"),
+                                       "path": pd.Series(dtype="object")})
+        self.arrays = {}
+        for name in ARRAYS:
+            path = os.path.join(self.dir, f"{name}.npy")
+            if os.path.exists(path):
+                self.arrays[name] = np.load(path, mmap_mode="r")
+        self._row = {h: i for i, h in enumerate(self.index["sha1"])}
+
+    def __len__(self):
+        return len(self.index)
+
+    def present(self, name, hashes):
+        """
+        Boolean mask: which of `hashes` have a row holding array `name`.
+        """
+        rows = np.array([self._row.get(h, -1) for h in hashes], dtype=np.int64)
+        mask = rows >= 0
+        if name not in self.arrays:
+            return np.zeros(len(rows), dtype=bool)
+        if mask.any():
+            first = np.asarray(self.arrays[name][rows[mask]]).reshape(mask.sum(), -1)[:, 0]
+            mask[mask] = ~np.isnan(first)
+        return mask
+
+    def has(self, name, hashes=None):
+        """
+        Whether the store holds array `name` (for all of `hashes`, if given).
+        """
+        if hashes is None:
+            return name in self.arrays
+        return bool(self.present(name, hashes).all())
+
+    def missing(self, hashes, required=("logits",)):
+        """
+        Hashes that have no row, or whose rows lack one of the required arrays.
+        """
+        hashes = list(dict.fromkeys(hashes))
+        ok = np.ones(len(hashes), dtype=bool)
+        for name in required:
+            ok &= self.present(name, hashes)
+        return [h for h, present in zip(hashes, ok) if not present]
+
+    def get(self, name, hashes):
+        """
+        Rows of array `name` for `hashes` (in that order), as an in-memory array.
+        """
+        rows = np.fromiter((self._row[h] for h in hashes), dtype=np.int64, count=len(hashes))
+        return np.asarray(self.arrays[name][rows])
+
+    def add(self, hashes, labels, paths, arrays):
+        """
+        Insert or replace rows.
+
+        Arrays not supplied keep their stored values for replaced rows (same
+        image content, same checkpoint) and are NaN for new ones; arrays the
+        store did not have yet are NaN for the untouched old rows. Nothing
+        already stored is ever dropped.
+
+        Args:
+            hashes, labels, paths (list): Per-sample keys and metadata
+            arrays (dict): name -> np.ndarray with len(hashes) rows
+        """
+        new_rows = set(hashes)
+        keep = np.array([h not in new_rows for h in self.index["sha1"]], dtype=bool)
+        index = pd.concat([self.index[keep],
+                           pd.DataFrame({"sha1": hashes, "label": labels, "path": paths})], ignore_index=True)
+        old_rows = np.array([self._row.get(h, -1) for h in hashes], dtype=np.int64)
+        replaced = old_rows >= 0
+
+        os.makedirs(self.dir, exist_ok=True)
+        merged = {}
+        for name in ARRAYS:
+            old = self.arrays.get(name)
+            if name in arrays:
+                new = np.asarray(arrays[name], dtype=np.float32)
+            elif old is not None:
+                new = np.full((len(hashes),) + old.shape[1:], np.nan, dtype=np.float32)
+                new[replaced] = old[old_rows[replaced]]
+            else:
+                continue
+            if old is not None:
+                kept = np.asarray(old[keep])
+            else:
+                kept = np.full((int(keep.sum()),) + new.shape[1:], np.nan, dtype=np.float32)
+            merged[name] = np.concatenate([kept, new])
+        self.arrays = {}  # release the old mmaps before their files are replaced
+
+        for name, data in merged.items():
+            tmp = os.path.join(self.dir, f"{name}.tmp.npy")
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=data.shape)
+            out[:] = data
+            out.flush()
+            del out
+            os.replace(tmp, os.path.join(self.dir, f"{name}.npy"))
+        index.to_parquet(os.path.join(self.dir, "index.parquet"), index=False)
+
+        self._load()
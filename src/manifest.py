@@ -0,0 +1,222 @@
+# src/manifest.py
+"""
+Persistent dataset manifest shared by split_dataset, train and evaluate.
+
+The manifest is a single Parquet file with one row per image:
+
+    path, label, split, size, mtime_ns, sha1, width, height, dir_mtime_ns
+
+Building it walks the split directories once. Later refreshes list every
+class directory again (`scandir` + `stat`, no reads) and only re-hash a file
+that is new or whose size or mtime changed, so an unchanged tree costs one
+`stat` per image instead of hashing and decoding it. An image rewritten in
+place keeps its directory's mtime but not its own, so it is picked up too.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from PIL import Image
+
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png", ".ppm", ".bmp", ".pgm", ".tif", ".tiff", ".webp")
+
+COLUMNS = ["path", "label", "split", "size", "mtime_ns", "sha1", "width", "height", "dir_mtime_ns"]
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """
+    Content hash of a file, read in chunks.
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def describe_image(path):
+    """
+    Hash a file and read its dimensions (PIL only parses the header).
+
+    Returns:
+        (sha1, width, height)
+    """
+    digest = file_sha1(path)
+    with Image.open(path) as im:
+        width, height = im.size
+    return digest, width, height
+
+
+INT_COLUMNS = ("size", "mtime_ns", "width", "height", "dir_mtime_ns")
+
+
+def empty_manifest():
+    """
+    Manifest with no rows but the right columns/dtypes.
+    """
+    return pd.DataFrame({c: pd.Series(dtype="int64" if c in INT_COLUMNS else "object") for c in COLUMNS})
+
+
+def load_manifest(manifest_path):
+    """
+    Load a manifest, or an empty one if the file does not exist yet.
+    """
+    if manifest_path and os.path.exists(manifest_path):
+        return pd.read_parquet(manifest_path)
+    return empty_manifest()
+
+
+def save_manifest(df, manifest_path):
+    """
+    Atomic write: a private temp file per call, so concurrent refreshes (e.g.
+    parallel sweep trials) never share one, then os.replace.
+    """
+    directory = os.path.dirname(manifest_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(manifest_path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, manifest_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def scan_class_dir(class_dir):
+    """
+    (path, size, mtime_ns) for every image directly inside a directory.
+    """
+    entries = []
+    with os.scandir(class_dir) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(IMG_EXTENSIONS):
+                st = entry.stat()
+                entries.append((entry.path, st.st_size, st.st_mtime_ns))
+    return entries
+
+
+def is_under(path, root):
+    return os.path.abspath(path).startswith(os.path.abspath(root) + os.sep)
+
+
+def refresh_manifest(manifest_path, roots, workers=8, save=True):
+    """
+    Bring the manifest in line with the ImageFolder-style split directories.
+
+    Only rows whose files live under a scanned root are rebuilt; rows of the
+    same split that point elsewhere are left untouched.
+
+    Args:
+        manifest_path (str): Parquet file to read/update
+        roots (dict): split name -> root directory (root/<class>/<image>)
+        workers (int): Threads used to hash/measure new or changed files
+        save (bool): Write the manifest back if anything changed
+
+    Returns:
+        pandas.DataFrame: The up-to-date manifest
+    """
+    old = load_manifest(manifest_path)
+    kept, todo, changed = [], [], False
+    scanned_splits = set()
+
+    for split, root in roots.items():
+        if not root or not os.path.isdir(root):
+            continue
+        scanned_splits.add(split)
+        old_split = old[old["split"] == split]
+        # Rows pointing outside the root (e.g. into data/raw after `split_dataset --mode none`)
+        # are not managed by this scan and are kept as they are
+        under_root = old_split["path"].map(lambda p: is_under(p, root)).astype(bool)
+        if (~under_root).any():
+            kept.append(old_split[~under_root])
+        old_split = old_split[under_root]
+        old_by_label = {label: grp for label, grp in old_split.groupby("label")}
+        seen_labels = set()
+
+        for class_entry in sorted(os.scandir(root), key=lambda e: e.name):
+            if not class_entry.is_dir():
+                continue
+            label = class_entry.name
+            seen_labels.add(label)
+            dir_mtime = class_entry.stat().st_mtime_ns
+            prev = old_by_label.get(label)
+            # A directory mtime change means files were added, removed or renamed
+            if prev is None or not len(prev) or int(prev["dir_mtime_ns"].iloc[0]) != dir_mtime:
+                changed = True
+
+            prev_rows = {} if prev is None else {r.path: r for r in prev.itertuples(index=False)}
+            reused = []
+            for path, size, mtime in scan_class_dir(class_entry.path):
+                row = prev_rows.get(path)
+                if row is not None and row.size == size and row.mtime_ns == mtime:
+                    reused.append(row._replace(dir_mtime_ns=dir_mtime))
+                else:
+                    todo.append((path, label, split, size, mtime, dir_mtime))
+            if len(reused) != len(prev_rows):
+                changed = True
+            if reused:
+                kept.append(pd.DataFrame(reused, columns=COLUMNS))
+
+        if set(old_by_label) - seen_labels:
+            changed = True
+
+    # Splits that were not passed in are left untouched
+    untouched = old[~old["split"].isin(scanned_splits)]
+    if len(untouched):
+        kept.append(untouched)
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            described = list(pool.map(describe_image, [t[0] for t in todo]))
+        kept.append(pd.DataFrame([
+            (path, label, split, size, mtime, digest, w, h, dir_mtime)
+            for (path, label, split, size, mtime, dir_mtime), (digest, w, h) in zip(todo, described)
+        ], columns=COLUMNS))
+
+    df = pd.concat(kept, ignore_index=True) if kept else empty_manifest()
+    df = df.sort_values(["split", "label", "path"], ignore_index=True)
+
+    if save and (changed or len(df) != len(old)):
+        save_manifest(df, manifest_path)
+    return df
+
+
+def split_roots(cfg):
+    """
+    split name -> directory mapping from the `data` section of config.yaml.
+    """
+    return {
+        "train": cfg["data"]["train_dir"],
+        "val": cfg["data"]["val_dir"],
+        "test": cfg["data"]["test_dir"],
+    }
+
+
+def load_split(cfg, split, refresh=True):
+    """
+    Rows of one split, refreshing the manifest first (cheap when nothing changed).
+    """
+    manifest_path = cfg["data"]["manifest"]
+    if refresh:
+        df = refresh_manifest(manifest_path, split_roots(cfg))
+    else:
+        df = load_manifest(manifest_path)
+    return df[df["split"] == split].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    from src.utils import load_config
+
+    parser = argparse.ArgumentParser(description="Build or refresh the dataset manifest")
+    parser.add_argument("--config", type=str, default="config.yaml")
+    parser.add_argument("--workers", type=int, default=8, help="Threads for hashing new files")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    df = refresh_manifest(cfg["data"]["manifest"], split_roots(cfg), workers=args.workers)
+    print(f"✅ Manifest {cfg['data']['manifest']}: {len(df)} images")
+    print(df.groupby(["split", "label"]).size().unstack(fill_value=0))
@@ -0,0 +1,84 @@
+# src/memory_bench.py
+"""
+Peak-memory comparison of the training memory options.
+
+Each configuration runs a few optimizer steps on synthetic images in its own
+spawned process (peak RSS only ever grows within a process), so the numbers
+are directly comparable.
+
+Usage:
+    python -m src.memory_bench --batch-size 64 --unfreeze-depth 2
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+CONFIGS = {
+    "baseline":       {"trainable_only": False, "memory_efficient": False, "checkpoint_segments": 0},
+    "trainable_only": {"trainable_only": True,  "memory_efficient": False, "checkpoint_segments": 0},
+    "no_grad_prefix": {"trainable_only": True,  "memory_efficient": True,  "checkpoint_segments": 0},
+    "checkpointing":  {"trainable_only": True,  "memory_efficient": True,  "checkpoint_segments": 2},
+}
+
+
+def _measure(model_name, unfreeze_depth, batch_size, img_size, steps, options, queue):
+    import torch
+    import torch.nn as nn
+    from torch.optim import Adam
+
+    from model.model import get_model, enable_memory_efficient, trainable_parameters
+    from src.utils import peak_rss_mb
+
+    torch.manual_seed(0)
+    model = get_model(model_name, num_classes=7, pretrained=False, unfreeze_depth=unfreeze_depth)
+    if options["memory_efficient"]:
+        enable_memory_efficient(model, checkpoint_segments=options["checkpoint_segments"])
+    params = trainable_parameters(model) if options["trainable_only"] else model.parameters()
+    opt = Adam(params, lr=1e-4)
+    ce = nn.CrossEntropyLoss()
+    x = torch.randn(batch_size, 3, img_size, img_size)
+    y = torch.randint(0, 7, (batch_size,))
+
+    model.train()
+    start_rss = peak_rss_mb()
+    t0 = time.perf_counter()
+    for _ in range(steps):
+        opt.zero_grad()
+        loss = ce(model(x), y)
+        loss.backward()
+        opt.step()
+    step_s = (time.perf_counter() - t0) / steps
+    queue.put({"start_rss_mb": start_rss, "peak_rss_mb": peak_rss_mb(), "step_s": step_s})
+
+
+def run(model_name, unfreeze_depth, batch_size, img_size, steps, configs=None):
+    """
+    Measure every configuration and return {name: result}.
+    """
+    ctx = mp.get_context("spawn")
+    results = {}
+    for name in configs or CONFIGS:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_measure,
+                           args=(model_name, unfreeze_depth, batch_size, img_size, steps, CONFIGS[name], queue))
+        proc.start()
+        results[name] = queue.get()
+        proc.join()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak RSS per training memory configuration")
+    parser.add_argument("--model", type=str, default="resnet50")
+    parser.add_argument("--unfreeze-depth", type=int, default=2, help="Trailing ResNet stages left trainable")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--configs", nargs="*", choices=list(CONFIGS), default=None)
+    args = parser.parse_args()
+
+    results = run(args.model, args.unfreeze_depth, args.batch_size, args.img_size, args.steps, args.configs)
+    print(f"\n🧠 {args.model}, unfreeze_depth={args.unfreeze_depth}, batch {args.batch_size} @ {args.img_size}px")
+    print(f"  {'config':<16}{'peak RSS (MB)':>14}{'after build':>13}{'s/step':>9}")
+    for name, r in results.items():
+        print(f"  {name:<16}{r['peak_rss_mb'] or 0:>14.0f}{r['start_rss_mb'] or 0:>13.0f}{r['step_s']:>9.2f}")
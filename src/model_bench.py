@@ -0,0 +1,133 @@
+# src/model_bench.py
+"""
+Cost/accuracy table for the architectures in model.model.MODEL_REGISTRY.
+
+For each architecture: parameter count, GFLOPs per 224px image (2 x
+multiply-accumulates of every conv and linear layer, counted with forward
+hooks), and median CPU latency at batch 1, 5 and 32. Checkpoints passed with
+--checkpoints add test accuracy / macro-F1 for their architecture (scored
+through the logits store, so re-runs are free).
+
+Usage:
+    python -m src.model_bench --threads 4 --checkpoints models/*.safetensors
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+from sklearn.metrics import accuracy_score, f1_score
+
+from model.model import MODEL_REGISTRY, get_model, infer_architecture, load_checkpoint, load_metadata
+
+BATCH_SIZES = (1, 5, 32)
+
+
+def count_params(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def count_flops(model, img_size=224):
+    """
+    FLOPs of one forward pass on a single image (2 x MACs of conv/linear layers).
+    """
+    macs = []
+
+    def conv_hook(m, inp, out):
+        macs.append(out.numel() * (m.in_channels // m.groups) * m.kernel_size[0] * m.kernel_size[1])
+
+    def linear_hook(m, inp, out):
+        macs.append(out.numel() * m.in_features)
+
+    hooks = [m.register_forward_hook(conv_hook if isinstance(m, nn.Conv2d) else linear_hook)
+             for m in model.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+    with torch.inference_mode():
+        model(torch.zeros(1, 3, img_size, img_size))
+    for h in hooks:
+        h.remove()
+    return 2 * sum(macs)
+
+
+def measure_latency(model, batch_size, img_size=224, repeats=10, warmup=3):
+    """
+    Median milliseconds per forward pass of one batch on CPU.
+    """
+    x = torch.randn(batch_size, 3, img_size, img_size)
+    times = []
+    with torch.inference_mode():
+        for i in range(warmup + repeats):
+            t0 = time.perf_counter()
+            model(x)
+            if i >= warmup:
+                times.append(1000 * (time.perf_counter() - t0))
+    return statistics.median(times)
+
+
+def checkpoint_accuracy(cfg, ckpt_path):
+    """
+    (model_name, accuracy, macro_f1) of a checkpoint on the test split.
+    """
+    from src.evaluate import score_split
+
+    model = load_checkpoint(ckpt_path)
+    model_name = load_metadata(ckpt_path).get("arch") or infer_architecture(model.state_dict())[0]
+    samples, store = score_split(cfg, ckpt_path, "test", "cpu", model=model)
+    classes = cfg["data"]["class_names"]
+    y_true = np.array([classes.index(label) for label in samples["label"]])
+    y_pred = store.get("logits", samples["sha1"].tolist()).argmax(axis=1)
+    return model_name, accuracy_score(y_true, y_pred), f1_score(y_true, y_pred, average="macro", zero_division=0)
+
+
+def benchmark(archs, img_size=224, repeats=10, num_classes=7):
+    rows = []
+    for name in archs:
+        model = get_model(name, num_classes=num_classes, pretrained=False).eval()
+        row = {"arch": name, "params_m": count_params(model) / 1e6, "gflops": count_flops(model, img_size) / 1e9}
+        for bs in BATCH_SIZES:
+            ms = measure_latency(model, bs, img_size, repeats=repeats)
+            row[f"ms_b{bs}"] = ms
+            row[f"img_s_b{bs}"] = 1000 * bs / ms
+        rows.append(row)
+        print(f"  {name}: {row['params_m']:.1f}M params | {row['gflops']:.2f} GFLOPs | "
+              f"{row['ms_b1']:.1f} ms @ batch 1")
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from src.utils import load_config
+
+    parser = argparse.ArgumentParser(description="Params / FLOPs / CPU latency / accuracy per architecture")
+    parser.add_argument("--archs", nargs="*", choices=list(MODEL_REGISTRY), default=list(MODEL_REGISTRY))
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads (default: torch's choice)")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--checkpoints", nargs="*", default=[], help="Trained checkpoints to add test accuracy")
+    parser.add_argument("--out", type=str, default=None)
+    args = parser.parse_args()
+
+    cfg = load_config("config.yaml")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    img_size = cfg["data"]["img_size"]
+    print(f"⏱️ Benchmarking {len(args.archs)} architectures on CPU ({torch.get_num_threads()} threads, {img_size}px)")
+    table = benchmark(args.archs, img_size, args.repeats, cfg["model"]["num_classes"])
+
+    scores = {}
+    for path in args.checkpoints:
+        model_name, acc, macro_f1 = checkpoint_accuracy(cfg, path)
+        best = scores.get(model_name)
+        if best is None or macro_f1 > best[2]:
+            scores[model_name] = (os.path.basename(path), acc, macro_f1)
+    table["checkpoint"] = table["arch"].map(lambda a: scores.get(a, (None,))[0])
+    table["accuracy"] = table["arch"].map(lambda a: scores.get(a, (None, np.nan))[1])
+    table["macro_f1"] = table["arch"].map(lambda a: scores.get(a, (None, None, np.nan))[2])
+
+    out = args.out or os.path.join(cfg["eval"]["outputs_dir"], "model_bench.csv")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    table.to_csv(out, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.precision", 3):
+        print(table.sort_values("ms_b1").to_string(index=False))
+    print(f"✅ Benchmark saved to {out}")
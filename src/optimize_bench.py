@@ -0,0 +1,102 @@
+# src/optimize_bench.py
+"""
+Latency and numerical equivalence of the inference optimization modes.
+
+For every mode in model.optimize.OPTIMIZE_MODES: cold load time (optimizing
+from the checkpoint), warm load time (from the on-disk cache), median CPU
+latency at batch 1 and 32, the max |logit| difference against the
+unoptimized model, and top-1 agreement on the random batch.
+
+Usage:
+    python -m src.optimize_bench --threads 4
+"""
+import argparse
+import os
+import statistics
+import time
+
+import pandas as pd
+import torch
+
+from model.model import load_checkpoint
+from model.optimize import OPTIMIZE_MODES, cache_path, load_optimized
+
+
+def median_ms(model, x, repeats=10, warmup=3):
+    times = []
+    with torch.no_grad():
+        for i in range(warmup + repeats):
+            t0 = time.perf_counter()
+            model(x)
+            if i >= warmup:
+                times.append(1000 * (time.perf_counter() - t0))
+    return statistics.median(times)
+
+
+def benchmark(ckpt_path, modes, img_size=224, repeats=10):
+    reference = load_checkpoint(ckpt_path)
+    torch.manual_seed(0)
+    check = torch.randn(8, 3, img_size, img_size)
+    with torch.no_grad():
+        ref_logits = reference(check)
+
+    rows = []
+    for mode in modes:
+        cached = cache_path(ckpt_path, mode, "cpu")
+        if os.path.exists(cached):
+            os.remove(cached)
+        t0 = time.perf_counter()
+        model = load_optimized(ckpt_path, mode)
+        cold_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        load_optimized(ckpt_path, mode)
+        warm_s = time.perf_counter() - t0
+
+        with torch.no_grad():
+            logits = model(check)  # also triggers compilation for mode="compile"
+        row = {
+            "mode": mode,
+            "cold_load_s": cold_s,
+            "warm_load_s": warm_s,
+            "max_abs_diff": (logits - ref_logits).abs().max().item(),
+            "top1_agree": (logits.argmax(1) == ref_logits.argmax(1)).float().mean().item(),
+        }
+        for bs in (1, 32):
+            row[f"ms_b{bs}"] = median_ms(model, torch.randn(bs, 3, img_size, img_size), repeats)
+        rows.append(row)
+        print(f"  {mode}: {row['ms_b1']:.1f} ms @ 1 | {row['ms_b32']:.1f} ms @ 32 | "
+              f"max |Δlogit| {row['max_abs_diff']:.1e}")
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from src.utils import load_config
+
+    cfg = load_config("config.yaml")
+    parser = argparse.ArgumentParser(description="Benchmark inference optimization modes")
+    parser.add_argument("--checkpoint", type=str,
+                        default=os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"]))
+    parser.add_argument("--modes", nargs="*", choices=OPTIMIZE_MODES, default=list(OPTIMIZE_MODES))
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--keep-cache", action="store_true", help="Leave the optimized models on disk")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    print(f"⏱️ {args.checkpoint} on CPU ({torch.get_num_threads()} threads)")
+    table = benchmark(args.checkpoint, args.modes, cfg["data"]["img_size"], args.repeats)
+    if not args.keep_cache:
+        for mode in args.modes:
+            cached = cache_path(args.checkpoint, mode, "cpu")
+            if os.path.exists(cached):
+                os.remove(cached)
+
+    if "none" in args.modes:
+        table["speedup_b1"] = table.loc[table["mode"] == "none", "ms_b1"].iloc[0] / table["ms_b1"]
+    out = os.path.join(cfg["eval"]["outputs_dir"], "optimize_bench.csv")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    table.to_csv(out, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.precision", 4):
+        print(table.to_string(index=False))
+    print(f"✅ Benchmark saved to {out}")
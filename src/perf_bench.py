@@ -0,0 +1,261 @@
+# src/perf_bench.py
+"""
+Offline performance benchmark suite, with a regression check against a baseline.
+
+Everything runs on synthetic images and random-init weights, so no dataset or
+trained checkpoint is needed:
+
+    decode_*         JPEG decode + RGB convert at several resolutions
+    preprocess_*     api.utils.preprocess_image (single view and full TTA)
+    forward_b*       model forward at batch 1, 5 and 32
+    format_prediction
+    predict_endpoint end-to-end POST /predict through the ASGI test client
+                     (the app loads a random-init checkpoint written to a temp dir)
+    dataloader       training DataLoader throughput over synthetic JPEG files
+
+Results are written to JSON. With --compare, every metric is checked against
+a saved baseline and the run fails (exit code 1) if any is worse by more than
+--max-regression (relative; per-metric overrides with --threshold).
+
+Usage:
+    python -m src.perf_bench --out outputs/perf_baseline.json
+    python -m src.perf_bench --compare outputs/perf_baseline.json --max-regression 0.15
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+
+from api.utils import format_prediction, preprocess_image
+from model.model import MODEL_REGISTRY, checkpoint_metadata, get_model, save_checkpoint
+from src.synthetic import jpeg_bytes, synthetic_image
+
+# Synthetic image sizes (width, height) for the decode benchmarks
+DECODE_SIZES = {
+    "224": (224, 224),
+    "ham_600x450": (600, 450),   # HAM10000 native resolution
+    "1024x768": (1024, 768),
+    "phone_4032x3024": (4032, 3024),
+}
+BATCH_SIZES = (1, 5, 32)
+CLASS_NAMES = ["akiec", "bcc", "bkl", "df", "mel", "nv", "vasc"]
+
+
+def time_ms(fn, repeats=20, warmup=3):
+    """
+    Median and p90 milliseconds of `fn()` over `repeats` calls after `warmup`.
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(1000 * (time.perf_counter() - t0))
+    return statistics.median(times), float(np.percentile(times, 90))
+
+
+def metric(value, unit, better="lower", **extra):
+    return {"value": value, "unit": unit, "better": better, **extra}
+
+
+def latency_metric(fn, repeats, warmup=3):
+    median, p90 = time_ms(fn, repeats, warmup)
+    return metric(median, "ms", p90_ms=p90)
+
+
+def bench_decode(repeats):
+    results = {}
+    for name, (w, h) in DECODE_SIZES.items():
+        data = jpeg_bytes(synthetic_image(w, h))
+        results[f"decode_{name}"] = latency_metric(lambda: Image.open(io.BytesIO(data)).convert("RGB"), repeats)
+    return results
+
+
+def bench_preprocess(repeats):
+    image = synthetic_image(*DECODE_SIZES["ham_600x450"])
+    return {f"preprocess_{policy}": latency_metric(lambda: preprocess_image(image, policy=policy), repeats)
+            for policy in ("none", "full")}
+
+
+def bench_forward(model, repeats, img_size=224):
+    results = {}
+    with torch.inference_mode():
+        for bs in BATCH_SIZES:
+            x = torch.randn(bs, 3, img_size, img_size)
+            results[f"forward_b{bs}"] = latency_metric(lambda: model(x), repeats)
+    return results
+
+
+def bench_format_prediction(repeats):
+    probs = np.random.default_rng(0).dirichlet(np.ones(len(CLASS_NAMES)))
+    descriptions = {c: c for c in CLASS_NAMES}
+    # Microseconds per call: time 1000 calls per sample
+    median, p90 = time_ms(lambda: [format_prediction(probs, CLASS_NAMES, descriptions) for _ in range(1000)],
+                          repeats)
+    return {"format_prediction": metric(median, "us", p90_us=p90)}
+
+
+def bench_predict_endpoint(arch, workdir, repeats, optimize_mode="fold"):
+    """
+    POST /predict through fastapi's TestClient against a random-init checkpoint.
+    """
+    ckpt = os.path.join(workdir, f"{arch}_random.safetensors")
+    save_checkpoint(get_model(arch, num_classes=len(CLASS_NAMES), pretrained=False), ckpt,
+                    metadata=checkpoint_metadata(arch, CLASS_NAMES, 224))
+    # api.app reads its configuration from the environment at import time
+    os.environ.update(MODEL_PATH=ckpt, OPTIMIZE_MODE=optimize_mode, TTA_POLICY="full")
+    for key in ("SHADOW_MODEL_PATH", "CASCADE_MODEL_PATH"):
+        os.environ.pop(key, None)
+    from fastapi.testclient import TestClient
+
+    from api.app import app
+
+    data = jpeg_bytes(synthetic_image(*DECODE_SIZES["ham_600x450"]))
+    files = {"file": ("lesion.jpg", data, "image/jpeg")}
+    with TestClient(app) as client:
+        def call():
+            response = client.post("/predict", files=files)
+            response.raise_for_status()
+
+        return {"predict_endpoint": latency_metric(call, repeats)}
+
+
+def bench_dataloader(workdir, n_images=256, batch_size=32, num_workers=2, n_batches=6):
+    """
+    Images/sec of the training DataLoader (train augmentations) over synthetic JPEG files.
+    """
+    from src.dataset import ManifestDataset, build_transforms
+    from src.tune_loader import benchmark_loader
+
+    img_dir = os.path.join(workdir, "images")
+    os.makedirs(img_dir, exist_ok=True)
+    paths = []
+    for i in range(n_images):
+        path = os.path.join(img_dir, f"{i:05d}.jpg")
+        synthetic_image(*DECODE_SIZES["ham_600x450"], seed=i).save(path, quality=90)
+        paths.append(path)
+    rows = pd.DataFrame({"path": paths, "label": [CLASS_NAMES[i % len(CLASS_NAMES)] for i in range(n_images)]})
+    dataset = ManifestDataset(rows, classes=CLASS_NAMES, transform=build_transforms(224, train=True))
+    result = benchmark_loader(dataset, batch_size, num_workers, prefetch_factor=2, n_batches=n_batches)
+    return {
+        "dataloader": metric(result["images_per_s"], "img/s", better="higher", num_workers=num_workers),
+        "dataloader_startup": metric(1000 * result["startup_s"], "ms"),
+    }
+
+
+def run_suite(arch="resnet50", repeats=20, num_workers=2, optimize_mode="fold", skip=()):
+    torch.manual_seed(0)
+    metrics = {}
+    with tempfile.TemporaryDirectory(prefix="perf_bench_") as workdir:
+        stages = {
+            "decode": lambda: bench_decode(repeats),
+            "preprocess": lambda: bench_preprocess(repeats),
+            "forward": lambda: bench_forward(get_model(arch, len(CLASS_NAMES), pretrained=False).eval(), repeats),
+            "format": lambda: bench_format_prediction(repeats),
+            "endpoint": lambda: bench_predict_endpoint(arch, workdir, repeats, optimize_mode),
+            "dataloader": lambda: bench_dataloader(workdir, num_workers=num_workers),
+        }
+        for name, stage in stages.items():
+            if name in skip:
+                continue
+            print(f"⏱️ {name}")
+            metrics.update(stage())
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "arch": arch,
+            "optimize": optimize_mode,
+            "repeats": repeats,
+            "torch": torch.__version__,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "threads": torch.get_num_threads(),
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(current, baseline, max_regression=0.10, thresholds=None):
+    """
+    Relative change of every metric present in both runs.
+
+    Returns:
+        pandas.DataFrame with a `regressed` column (worse than its threshold)
+    """
+    thresholds = thresholds or {}
+    rows = []
+    for name, cur in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None:
+            continue
+        change = (cur["value"] - base["value"]) / base["value"]
+        worse = change if cur["better"] == "lower" else -change
+        limit = thresholds.get(name, max_regression)
+        rows.append({"metric": name, "unit": cur["unit"], "baseline": base["value"], "current": cur["value"],
+                     "change": change, "threshold": limit, "regressed": worse > limit})
+    return pd.DataFrame(rows)
+
+
+def parse_thresholds(items):
+    thresholds = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        thresholds[name] = float(value)
+    return thresholds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks on synthetic data")
+    parser.add_argument("--arch", choices=list(MODEL_REGISTRY), default="resnet50")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads (default: torch's choice)")
+    parser.add_argument("--workers", type=int, default=2, help="DataLoader workers for the dataloader benchmark")
+    parser.add_argument("--optimize", type=str, default="fold", help="OPTIMIZE_MODE of the /predict benchmark")
+    parser.add_argument("--skip", nargs="*", default=[],
+                        choices=["decode", "preprocess", "forward", "format", "endpoint", "dataloader"])
+    parser.add_argument("--out", type=str, default="outputs/perf_bench.json")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON from an earlier run")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="Allowed relative slowdown")
+    parser.add_argument("--threshold", nargs="*", default=[], metavar="METRIC=FRAC",
+                        help="Per-metric allowed slowdown, e.g. predict_endpoint=0.25")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    results = run_suite(args.arch, args.repeats, args.workers, args.optimize, skip=args.skip)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    with pd.option_context("display.width", 200, "display.precision", 3):
+        print(pd.DataFrame([{"metric": k, "value": m["value"], "unit": m["unit"]}
+                            for k, m in results["metrics"].items()]).to_string(index=False))
+    print(f"✅ Results saved to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key in ("arch", "cpu_count", "threads", "torch"):
+            if baseline["meta"].get(key) != results["meta"][key]:
+                print(f"⚠️ Baseline {key} differs: {baseline['meta'].get(key)} vs {results['meta'][key]}")
+        table = compare(results, baseline, args.max_regression, parse_thresholds(args.threshold))
+        with pd.option_context("display.width", 200, "display.precision", 3):
+            print(f"\n📊 Against {args.compare} ({baseline['meta'].get('timestamp')}):")
+            print(table.to_string(index=False))
+        regressed = table[table["regressed"]]
+        if not regressed.empty:
+            print(f"❌ {len(regressed)} metric(s) regressed: {', '.join(regressed['metric'])}")
+            sys.exit(1)
+        print("✅ No regressions")
@@ -1,77 +1,347 @@
 # src/predict.py
 
 
+import argparse
+import csv
+import glob
+import json
+import multiprocessing as mp
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+
+import numpy as np
 import torch
 import torch.nn.functional as F
 from torchvision import transforms
 from PIL import Image
-import argparse
+from tqdm import tqdm
 
 
 from src.utils import load_config
-from src.model import get_model  # ✅ IMPORTANT: use same model builder used in training
+from model.model import load_metadata, calibrate_logits  # same model factory as training
+from model.optimize import load_optimized
 
-def load_image(img_path, img_size):
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png", ".ppm", ".bmp", ".pgm", ".tif", ".tiff", ".webp")
+MEAN = [0.485, 0.456, 0.406]  # ImageNet stats
+STD = [0.229, 0.224, 0.225]
+
+def load_image(img_path, img_size, mean=MEAN, std=STD):
     transform = transforms.Compose([
         transforms.Resize((img_size, img_size)),
         transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],  # ImageNet stats
-                             std=[0.229, 0.224, 0.225])
+        transforms.Normalize(mean=mean, std=std)
     ])
     image = Image.open(img_path).convert("RGB")
     return transform(image).unsqueeze(0)  # shape: [1, C, H, W]
 
 
+def checkpoint_path(cfg):
+    return os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
 
 
-def predict(img_path, cfg):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+def checkpoint_spec(cfg):
+    """
+    Class names and preprocessing of the configured checkpoint: embedded in
+    .safetensors checkpoints, taken from config.yaml for legacy .pt files.
+    """
+    meta = load_metadata(checkpoint_path(cfg))
+    return {
+        "class_names": meta.get("class_names", cfg["data"]["class_names"]),
+        "img_size": meta.get("img_size", cfg["data"]["img_size"]),
+        "mean": meta.get("mean", MEAN),
+        "std": meta.get("std", STD),
+    }
 
 
-    # Load model with same architecture
-    model = get_model(
+def load_predictor(cfg, device):
+    """
+    Model from the configured checkpoint plus its calibration (if any), built once.
+    """
+    ckpt_path = checkpoint_path(cfg)
+    model = load_optimized(
+        ckpt_path,
+        mode=cfg.get("infer", {}).get("optimize", "none"),
+        device=device,
         model_name=cfg["model"]["name"],
-        num_classes=cfg["model"]["num_classes"],
-        pretrained=False
-    ).to(device)
+        num_classes=cfg["model"]["num_classes"]
+    )
+    return model, load_metadata(ckpt_path).get("calibration")
 
 
-    # Load weights
-    ckpt_path = "models/resnet18_best.pt"
-    model.load_state_dict(torch.load(ckpt_path, map_location=device))
-    model.eval()
+def predict(img_path, cfg):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+    # Load model with same architecture and the configured weights
+    model, calibration = load_predictor(cfg, device)
+    spec = checkpoint_spec(cfg)
 
 
     # Load and preprocess image
-    img = load_image(img_path, cfg["data"]["img_size"]).to(device)
+    img = load_image(img_path, spec["img_size"], spec["mean"], spec["std"]).to(device)
 
 
     # Predict
     with torch.no_grad():
-        logits = model(img)
+        logits = calibrate_logits(model(img), calibration)
         probs = F.softmax(logits, dim=1)
         pred_class_idx = torch.argmax(probs, dim=1).item()
         pred_prob = probs[0, pred_class_idx].item()
 
 
-    class_name = cfg["data"]["class_names"][pred_class_idx]
+    class_name = spec["class_names"][pred_class_idx]
     print(f"✅ Prediction: {class_name} ({pred_prob * 100:.2f}%)")
 
 
     # Optional: Show all class probabilities
     print("\n📊 Class Probabilities:")
-    for i, cls in enumerate(cfg["data"]["class_names"]):
+    for i, cls in enumerate(spec["class_names"]):
         print(f"  {cls}: {probs[0, i].item():.4f}")
 
 
+# ---------------------------------------------------------------------------
+# Bulk mode: directories / globs / file lists -> CSV, JSONL or Parquet
+# ---------------------------------------------------------------------------
+
+def iter_inputs(inputs):
+    """
+    Lazily yield image paths from directories (recursive), glob patterns and
+    `@list.txt` files (one path per line), in a stable order.
+    """
+    for item in inputs:
+        if item.startswith("@"):
+            with open(item[1:]) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield line
+        elif os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMG_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield from sorted(glob.iglob(item, recursive=True))
+
+
+def iter_batches(paths, batch_size):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def decode_batch(paths, img_size, fast=False):
+    """
+    Decode and resize a batch of files to uint8 HWC arrays (runs in worker processes).
+
+    With `fast`, JPEGs are decoded at reduced scale via PIL's draft mode
+    (much cheaper for large photos, slightly different pixels than training).
+
+    Returns:
+        (np.ndarray [N, H, W, 3] uint8, list of error strings or None)
+    """
+    out = np.zeros((len(paths), img_size, img_size, 3), dtype=np.uint8)
+    errors = []
+    for i, path in enumerate(paths):
+        try:
+            with Image.open(path) as im:
+                if fast:
+                    im.draft("RGB", (img_size, img_size))
+                out[i] = np.asarray(im.convert("RGB").resize((img_size, img_size), Image.BILINEAR))
+            errors.append(None)
+        except Exception as e:  # unreadable files are reported, not fatal
+            errors.append(f"{type(e).__name__}: {e}")
+    return out, errors
+
+
+def prediction_rows(model, calibration, paths, pixels, errors, class_names, device, mean=MEAN, std=STD):
+    """
+    Output rows (ResultWriter column order) for one decoded batch from decode_batch.
+    """
+    x = torch.from_numpy(pixels).to(device).permute(0, 3, 1, 2).float().div_(255)
+    mean = torch.tensor(mean, device=device).view(1, 3, 1, 1)
+    std = torch.tensor(std, device=device).view(1, 3, 1, 1)
+    with torch.no_grad():
+        probs = F.softmax(calibrate_logits(model((x - mean) / std), calibration), dim=1).cpu().numpy()
+
+    rows = []
+    for path, p, err in zip(paths, probs, errors):
+        if err is not None:
+            rows.append([path, None, None] + [None] * len(class_names) + [err])
+            continue
+        idx = int(p.argmax())
+        rows.append([path, class_names[idx], float(p[idx])] + [float(v) for v in p] + [None])
+    return rows
+
+
+class ResultWriter:
+    """
+    Streams prediction rows to .csv, .jsonl or .parquet (chosen by extension).
+
+    Parquet uses a fixed schema rather than one inferred from the first chunk,
+    so a chunk without errors (all-None `error`) or with only errors (all-None
+    probabilities) cannot pin a column to the null type.
+    """
+
+    def __init__(self, path, class_names, parquet_rows=10000):
+        self.path = path
+        self.fmt = os.path.splitext(path)[1].lower().lstrip(".")
+        if self.fmt not in ("csv", "jsonl", "parquet"):
+            raise ValueError(f"Unsupported output format: {path} (use .csv, .jsonl or .parquet)")
+        self.columns = ["path", "prediction", "confidence"] + [f"prob_{c}" for c in class_names] + ["error"]
+        self.parquet_rows = parquet_rows
+        self.schema = None
+        self._pending = []
+        self._parquet = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if self.fmt == "csv":
+            self._file = open(path, "w", newline="")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(self.columns)
+        elif self.fmt == "jsonl":
+            self._file = open(path, "w")
+        else:
+            import pyarrow as pa
+
+            self.schema = pa.schema([(c, pa.float64() if c == "confidence" or c.startswith("prob_") else pa.string())
+                                     for c in self.columns])
+
+    def write(self, rows):
+        if self.fmt == "csv":
+            self._csv.writerows(rows)
+        elif self.fmt == "jsonl":
+            for row in rows:
+                self._file.write(json.dumps(dict(zip(self.columns, row))) + "\n")
+        else:
+            self._pending.extend(rows)
+            if len(self._pending) >= self.parquet_rows:
+                self._flush_parquet()
+
+    def _flush_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._pending:
+            return
+        table = pa.Table.from_pylist([dict(zip(self.columns, r)) for r in self._pending], schema=self.schema)
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self.path, self.schema)
+        self._parquet.write_table(table)
+        self._pending = []
+
+    def close(self):
+        if self.fmt == "parquet":
+            self._flush_parquet()
+            if self._parquet is None:  # no rows at all: still a valid, empty file
+                import pyarrow.parquet as pq
+
+                pq.write_table(self.schema.empty_table(), self.path)
+            else:
+                self._parquet.close()
+        else:
+            self._file.close()
+
+
+def predict_bulk(inputs, out_path, cfg, batch_size=64, workers=None, max_inflight=None, fast_decode=False,
+                 model=None, calibration=None, device=None):
+    """
+    Score any number of images with bounded memory and stream results to a file.
+
+    The main process walks the inputs lazily; batches of paths are decoded on
+    a process pool with at most `max_inflight` batches outstanding, so memory
+    does not grow with the input size, and results keep input order.
+
+    Returns:
+        dict: images, errors, seconds
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    if model is None:
+        model, calibration = load_predictor(cfg, device)
+    spec = checkpoint_spec(cfg)
+    class_names = spec["class_names"]
+    img_size = spec["img_size"]
+    workers = workers or os.cpu_count() or 1
+    max_inflight = max_inflight or 2 * workers
+
+    # Written next to the output and moved into place at the end, so a failed run
+    # never leaves a truncated CSV/JSONL or a Parquet file without its footer
+    root, ext = os.path.splitext(out_path)
+    tmp_path = f"{root}.tmp{ext}"
+    writer = ResultWriter(tmp_path, class_names)
+    n_images = n_errors = 0
+    start = time.perf_counter()
+    pbar = tqdm(unit="img", desc="Scoring", smoothing=0.05)
+    batches = iter_batches(iter_inputs(inputs), batch_size)
+
+    try:
+        # spawn: the parent may already hold a CUDA context, which must not be forked
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            inflight = deque()
+
+            def submit_next():
+                batch = next(batches, None)
+                if batch is not None:
+                    inflight.append((batch, pool.submit(decode_batch, batch, img_size, fast_decode)))
+
+            for _ in range(max_inflight):
+                submit_next()
+
+            while inflight:
+                paths, future = inflight.popleft()
+                pixels, errors = future.result()
+                submit_next()
+
+                rows = prediction_rows(model, calibration, paths, pixels, errors, class_names, device,
+                                       spec["mean"], spec["std"])
+                n_errors += sum(err is not None for err in errors)
+                writer.write(rows)
+                n_images += len(paths)
+                pbar.update(len(paths))
+    except BaseException:
+        try:
+            writer.close()
+        finally:
+            os.remove(tmp_path)
+        raise
+    finally:
+        pbar.close()
+
+    writer.close()
+    os.replace(tmp_path, out_path)
+    seconds = time.perf_counter() - start
+    print(f"✅ Scored {n_images} images ({n_errors} unreadable) in {seconds:.1f}s "
+          f"({n_images / max(seconds, 1e-9):.1f} img/s) -> {out_path}")
+    return {"images": n_images, "errors": n_errors, "seconds": seconds}
+
+
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--img", type=str, required=True, help="Path to input image")
+    parser.add_argument("--img", type=str, help="Path to input image")
+    parser.add_argument("--bulk", nargs="+", default=None,
+                        help="Directories, glob patterns (quote them) or @file lists to score in bulk")
+    parser.add_argument("--out", type=str, default="outputs/predictions.csv",
+                        help="Bulk output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None, help="Decode processes (default: all cores)")
+    parser.add_argument("--fast-decode", action="store_true", help="Reduced-scale JPEG decoding (bulk only)")
     args = parser.parse_args()
 
 
     cfg = load_config("config.yaml")
-    predict(args.img, cfg)
+    if args.bulk:
+        predict_bulk(args.bulk, args.out, cfg, batch_size=args.batch_size, workers=args.workers,
+                     fast_decode=args.fast_decode)
+    elif args.img:
+        predict(args.img, cfg)
+    else:
+        parser.error("either --img or --bulk is required")
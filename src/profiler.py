@@ -0,0 +1,139 @@
+# src/profiler.py
+"""
+Lightweight per-step timing for the training loop.
+
+StepTimer splits each iteration into data wait, host-to-device copy, forward,
+backward and optimizer step, and prints a per-epoch breakdown with images/sec.
+make_trace_profiler optionally wraps a window of steps in torch.profiler and
+exports a Chrome trace (open in chrome://tracing or https://ui.perfetto.dev).
+
+Both are driven by the `profile` section of config.yaml.
+"""
+import os
+import time
+from collections import OrderedDict
+
+import torch
+
+PHASES = ("data", "h2d", "forward", "backward", "step")
+
+
+class StepTimer:
+    """
+    Accumulates wall-clock time per phase. Call `start()` before the first
+    batch is fetched, `mark(phase)` right after each phase finishes and
+    `step(n)` at the end of each iteration.
+
+    On CUDA the timer synchronizes before every mark so kernel time is
+    attributed to the phase that launched it (this costs a little throughput,
+    so it is only active when profiling is enabled).
+    """
+
+    def __init__(self, device="cpu", enabled=True):
+        self.enabled = enabled
+        self.sync = enabled and str(device).startswith("cuda")
+        self.reset()
+
+    def reset(self):
+        self.totals = OrderedDict((p, 0.0) for p in PHASES)
+        self.steps = 0
+        self.images = 0
+        self._epoch_start = None
+        self._last = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._epoch_start = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        if self.sync:
+            torch.cuda.synchronize()
+        now = time.perf_counter()
+        self.totals[phase] += now - self._last
+        self._last = now
+
+    def step(self, batch_size):
+        if not self.enabled:
+            return
+        self.steps += 1
+        self.images += batch_size
+
+    def summary(self):
+        """
+        Dict with total seconds, per-phase ms/step and share, and images/sec.
+        """
+        wall = (time.perf_counter() - self._epoch_start) if self._epoch_start else 0.0
+        steps = max(self.steps, 1)
+        measured = sum(self.totals.values()) or 1e-12
+        return {
+            "wall_s": wall,
+            "steps": self.steps,
+            "images_per_s": self.images / wall if wall > 0 else 0.0,
+            "phases": {p: {"ms_per_step": 1000 * t / steps, "share": t / measured}
+                       for p, t in self.totals.items()},
+        }
+
+    def report(self, epoch=None):
+        if not self.enabled or self.steps == 0:
+            return None
+        s = self.summary()
+        title = f"Epoch {epoch} step profile" if epoch is not None else "Step profile"
+        print(f"\n⏱️ {title}: {s['steps']} steps in {s['wall_s']:.1f}s | {s['images_per_s']:.1f} img/s")
+        for phase, v in s["phases"].items():
+            bar = "#" * int(round(v["share"] * 40))
+            print(f"  {phase:<9}{v['ms_per_step']:9.2f} ms/step {v['share'] * 100:6.1f}%  {bar}")
+        if s["phases"]["data"]["share"] > 0.3:
+            print("  ⚠️ Over 30% of each step is spent waiting on the DataLoader")
+        return s
+
+
+def make_trace_profiler(profile_cfg, device="cpu", tag="train"):
+    """
+    torch.profiler context covering a window of steps, or a no-op context.
+
+    The returned object supports `with` and `.step()`; call `.step()` once per
+    iteration. With trace disabled it is a no-op stub.
+    """
+    trace_cfg = (profile_cfg or {}).get("trace") or {}
+    if not trace_cfg.get("enabled", False):
+        return _NullProfiler()
+
+    trace_dir = trace_cfg.get("dir", "outputs/traces")
+    os.makedirs(trace_dir, exist_ok=True)
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if str(device).startswith("cuda"):
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    def export(prof):
+        path = os.path.join(trace_dir, f"{tag}_{int(time.time())}.json")
+        prof.export_chrome_trace(path)
+        print(f"🧭 Chrome trace saved to {path}")
+
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(
+            skip_first=trace_cfg.get("skip_first", 0),
+            wait=trace_cfg.get("wait", 1),
+            warmup=trace_cfg.get("warmup", 2),
+            active=trace_cfg.get("active", 5),
+            repeat=1,
+        ),
+        on_trace_ready=export,
+        record_shapes=trace_cfg.get("record_shapes", False),
+        profile_memory=trace_cfg.get("profile_memory", False),
+        with_stack=False,
+    )
+
+
+class _NullProfiler:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def step(self):
+        pass
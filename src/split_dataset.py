@@ -1,38 +1,217 @@
 # src/split_dataset.py
+"""
+Stratified, seeded train/val/test split of data/raw, recorded in the manifest.
+
+Each class is split on its own so every split keeps the class balance.
+Images already in the manifest keep their split. On a re-run, only new raw
+images are hashed, assigned (to fill each split back to its target ratio) and
+materialized.
+
+Materialization modes:
+    hardlink  data/<split>/<class>/<img> are hard links (falls back to copy across devices)
+    symlink   data/<split>/<class>/<img> are symlinks into data/raw
+    copy      full copies (the old behaviour)
+    none      nothing is written; the manifest points at data/raw directly
+
+Usage:
+    python -m src.split_dataset --mode hardlink --workers 16
+"""
+import argparse
 import os
 import random
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-random.seed(42)
-
-source_dir = Path("data/raw")
-dest_dir = Path("data")
-splits = {"train": 0.7, "val": 0.2, "test": 0.1}
-
-# Ensure target dirs exist
-for split in splits:
-    for class_dir in source_dir.iterdir():
-        target_dir = dest_dir / split / class_dir.name
-        target_dir.mkdir(parents=True, exist_ok=True)
-
-# Split and copy files
-for class_dir in source_dir.iterdir():
-    if class_dir.is_dir():
-        images = list(class_dir.glob("*.jpg"))
-        random.shuffle(images)
-        n_total = len(images)
-        n_train = int(n_total * splits["train"])
-        n_val = int(n_total * splits["val"])
-        split_data = {
-            "train": images[:n_train],
-            "val": images[n_train:n_train + n_val],
-            "test": images[n_train + n_val:]
-        }
-
-        for split, image_list in split_data.items():
-            for img_path in image_list:
-                dest_path = dest_dir / split / class_dir.name / img_path.name
-                shutil.copy(img_path, dest_path)
-
-print("✅ Done splitting dataset into train, val, test.")
+import pandas as pd
+
+from src.manifest import COLUMNS, describe_image, load_manifest, refresh_manifest, save_manifest, scan_class_dir
+
+SPLITS = ("train", "val", "test")
+
+
+def split_targets(total, ratios):
+    """
+    Number of images each split should hold for a class of `total` images.
+    """
+    n_train = int(total * ratios["train"])
+    n_val = int(total * ratios["val"])
+    return {"train": n_train, "val": n_val, "test": total - n_train - n_val}
+
+
+def assign_splits(new_items, existing_counts, ratios, rng, group_of=None, fixed=None):
+    """
+    Assign new images of one class so the class's splits approach their targets.
+
+    Items sharing a group (near-duplicates, see src.dedup) are placed as one
+    unit, and a group that already has a split in `fixed` stays there.
+
+    Args:
+        new_items (list): Sorted new items (anything; returned as keys)
+        existing_counts (dict): split -> images of this class already assigned
+        ratios (dict): split -> fraction
+        rng (random.Random): Seeded RNG
+        group_of (callable): Optional item -> group id (None for ungrouped items)
+        fixed (dict): Optional group id -> split; updated with new decisions
+
+    Returns:
+        dict: item -> split
+    """
+    fixed = {} if fixed is None else fixed
+    units = {}
+    for item in new_items:
+        group = group_of(item) if group_of else None
+        units.setdefault(("group", group) if group is not None else ("item", item), []).append(item)
+    units = list(units.items())
+    rng.shuffle(units)
+
+    targets = split_targets(sum(existing_counts.values()) + len(new_items), ratios)
+    filled = {s: existing_counts.get(s, 0) for s in SPLITS}
+    assignment = {}
+    for (kind, key), items in units:
+        split = fixed.get(key) if kind == "group" else None
+        if split is None:
+            # Fill train, then val, then test; rounding leftovers go to train
+            split = next((s for s in SPLITS if filled[s] < targets[s]), "train")
+            if kind == "group":
+                fixed[key] = split
+        filled[split] += len(items)
+        for item in items:
+            assignment[item] = split
+    return assignment
+
+
+def materialize(src, dst, mode):
+    """
+    Place one image at its split location. Returns the mode actually used.
+    """
+    if os.path.lexists(dst):
+        return mode
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return mode
+        except OSError:  # cross-device or unsupported filesystem
+            mode = "copy"
+    if mode == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+    elif mode == "copy":
+        shutil.copy2(src, dst)  # keeps mtime so the manifest entry stays valid
+    return mode
+
+
+def split_dataset(raw_dir, out_dir, manifest_path, ratios, seed=42, mode="hardlink", workers=8,
+                  groups=None, drop=None):
+    """
+    Split raw images into train/val/test and update the manifest.
+
+    Args:
+        raw_dir (str): Raw ImageFolder-style directory (raw/<class>/<img>)
+        out_dir (str): Parent of the train/val/test directories
+        manifest_path (str): Manifest to read existing assignments from and write to
+        ratios (dict): split -> fraction (train/val/test)
+        seed (int): Seed for the per-class shuffles
+        mode (str): hardlink | symlink | copy | none
+        workers (int): Threads for hashing and materializing
+        groups (dict): Optional (label, basename) -> near-duplicate cluster id;
+            each cluster is kept within a single split
+        drop (set): Optional (label, basename) keys to leave out (thinning)
+
+    Returns:
+        pandas.DataFrame: The updated manifest
+    """
+    if mode not in ("hardlink", "symlink", "copy", "none"):
+        raise ValueError(f"Unsupported split mode: {mode}")
+
+    old = load_manifest(manifest_path)
+    known = {(label, os.path.basename(p)) for label, p in zip(old["label"], old["path"])}
+    existing = old[old["split"].isin(SPLITS)].groupby(["label", "split"]).size()
+    rng = random.Random(seed)
+    groups = groups or {}
+    skip = known | (drop or set())
+    fixed = {groups[(label, os.path.basename(p))]: split
+             for label, p, split in zip(old["label"], old["path"], old["split"])
+             if (label, os.path.basename(p)) in groups}
+
+    todo = []  # (raw_path, label, split, size, mtime)
+    for class_entry in sorted(os.scandir(raw_dir), key=lambda e: e.name):
+        if not class_entry.is_dir():
+            continue
+        label = class_entry.name
+        new = sorted(e for e in scan_class_dir(class_entry.path)
+                     if (label, os.path.basename(e[0])) not in skip)
+        if not new:
+            continue
+        counts = {s: int(existing.get((label, s), 0)) for s in SPLITS}
+        assignment = assign_splits(new, counts, ratios, rng, fixed=fixed,
+                                   group_of=lambda e: groups.get((label, os.path.basename(e[0]))))
+        todo.extend((path, label, assignment[(path, size, mtime)], size, mtime) for path, size, mtime in new)
+
+    if not todo:
+        print("✅ No new images to split.")
+        return old
+
+    print(f"🔀 Splitting {len(todo)} new images ({mode})")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        described = list(pool.map(describe_image, [t[0] for t in todo]))
+
+        if mode == "none":
+            dest_paths = [t[0] for t in todo]
+        else:
+            dest_paths = [str(Path(out_dir) / split / label / os.path.basename(path))
+                          for path, label, split, _, _ in todo]
+            for d in {os.path.dirname(p) for p in dest_paths}:
+                os.makedirs(d, exist_ok=True)
+            used = list(pool.map(materialize, [t[0] for t in todo], dest_paths, [mode] * len(todo)))
+            fallbacks = sum(u != mode for u in used)
+            if fallbacks:
+                print(f"⚠️ {fallbacks} files were copied because hard links were not possible")
+
+    new_rows = pd.DataFrame([
+        (dest, label, split, size, mtime, digest, w, h, 0)
+        for dest, (_, label, split, size, mtime), (digest, w, h) in zip(dest_paths, todo, described)
+    ], columns=COLUMNS)
+    df = pd.concat([old, new_rows], ignore_index=True)
+    save_manifest(df, manifest_path)
+
+    if mode != "none":
+        # Records the new directory mtimes; rows above are reused, nothing is re-hashed
+        df = refresh_manifest(manifest_path, {s: str(Path(out_dir) / s) for s in SPLITS}, workers=workers)
+
+    summary = new_rows.groupby(["label", "split"]).size().unstack(fill_value=0)
+    print(summary)
+    return df
+
+
+if __name__ == "__main__":
+    from src.utils import load_config
+
+    cfg = load_config("config.yaml")
+    split_cfg = cfg["data"].get("split", {})
+
+    parser = argparse.ArgumentParser(description="Stratified, incremental dataset split")
+    parser.add_argument("--raw-dir", type=str, default=cfg["data"].get("raw_dir", "data/raw"))
+    parser.add_argument("--out-dir", type=str, default=str(Path(cfg["data"]["train_dir"]).parent))
+    parser.add_argument("--mode", type=str, default=split_cfg.get("mode", "hardlink"),
+                        choices=["hardlink", "symlink", "copy", "none"])
+    parser.add_argument("--seed", type=int, default=cfg["seed"])
+    parser.add_argument("--workers", type=int, default=split_cfg.get("workers", 8))
+    parser.add_argument("--group-duplicates", action="store_true",
+                        help="Keep perceptual near-duplicate clusters within one split (src.dedup)")
+    parser.add_argument("--thin", action="store_true",
+                        help="With --group-duplicates, keep only one image per cluster")
+    args = parser.parse_args()
+
+    groups, drop = None, None
+    if args.group_duplicates:
+        from src.dedup import build_hash_index, duplicate_groups
+
+        dedup_cfg = cfg["data"].get("dedup", {})
+        index_df = build_hash_index(args.raw_dir, dedup_cfg.get("index", "data/phash.parquet"))
+        groups, redundant = duplicate_groups(index_df, dedup_cfg.get("max_distance", 6))
+        drop = redundant if args.thin else None
+
+    ratios = split_cfg.get("ratios", {"train": 0.7, "val": 0.2, "test": 0.1})
+    split_dataset(args.raw_dir, args.out_dir, cfg["data"]["manifest"], ratios,
+                  seed=args.seed, mode=args.mode, workers=args.workers, groups=groups, drop=drop)
+    print("✅ Done splitting dataset into train, val, test.")
@@ -0,0 +1,248 @@
+# src/sweep.py
+"""
+Parallel hyperparameter sweep over src.train.train.
+
+Trials are sampled from the `sweep.space` section of config.yaml and run on a
+process pool, each with its own torch thread budget. Every epoch's val loss is
+written to a local SQLite results store; trials consult the same store to
+decide whether to stop early (median-stopping or asynchronous successive
+halving), so pruning works across processes without a coordinator.
+
+Usage:
+    python -m src.sweep --trials 16 --parallel 4
+"""
+import argparse
+import copy
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import sqlite3
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.utils import load_config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id INTEGER PRIMARY KEY,
+    sweep TEXT,
+    params TEXT,
+    status TEXT,
+    best_val_loss REAL,
+    best_epoch INTEGER,
+    seconds REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    trial_id INTEGER,
+    epoch INTEGER,
+    train_loss REAL,
+    val_loss REAL,
+    val_acc REAL,
+    PRIMARY KEY (trial_id, epoch)
+);
+"""
+
+
+def connect(db_path):
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def sample_params(space, rng):
+    """
+    Draw one configuration from the search space.
+
+    Each entry maps a dotted config key (e.g. "train.lr") to a spec:
+        {type: choice, values: [...]}
+        {type: uniform|loguniform, low: x, high: y}
+        {type: int, low: a, high: b}
+    """
+    params = {}
+    for key, spec in space.items():
+        kind = spec.get("type", "choice")
+        if kind == "choice":
+            params[key] = rng.choice(spec["values"])
+        elif kind == "uniform":
+            params[key] = rng.uniform(float(spec["low"]), float(spec["high"]))
+        elif kind == "loguniform":
+            lo, hi = math.log(float(spec["low"])), math.log(float(spec["high"]))
+            params[key] = math.exp(rng.uniform(lo, hi))
+        elif kind == "int":
+            params[key] = rng.randint(int(spec["low"]), int(spec["high"]))
+        else:
+            raise ValueError(f"Unsupported search space type for {key}: {kind}")
+    return params
+
+
+def apply_params(cfg, params):
+    """
+    Return a copy of cfg with dotted-key overrides applied.
+    """
+    cfg = copy.deepcopy(cfg)
+    for key, value in params.items():
+        node = cfg
+        *parents, leaf = key.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return cfg
+
+
+def should_prune(conn, sweep, trial_id, epoch, val_loss, sweep_cfg):
+    """
+    Decide from the shared results store whether a trial should stop now.
+
+    Only trials of the same sweep (by name) are compared; earlier sweeps in the
+    same results_db may have searched other spaces or data.
+
+    median:  after `min_epochs`, stop if this trial's best val loss so far is
+             worse than the median best-so-far of other trials at the same epoch.
+    halving: at rungs min_epochs * eta^k, keep only the top 1/eta of the trials
+             that have reached that rung (asynchronous successive halving).
+    """
+    pruner = sweep_cfg.get("pruner", "median")
+    min_epochs = sweep_cfg.get("min_epochs", 2)
+    if pruner == "none" or epoch < min_epochs:
+        return False
+
+    if pruner == "median":
+        rows = conn.execute(
+            "SELECT e.trial_id, MIN(e.val_loss) FROM epochs e JOIN trials t ON t.trial_id = e.trial_id "
+            "WHERE t.sweep = ? AND e.epoch <= ? AND e.trial_id != ? "
+            "AND e.trial_id IN (SELECT trial_id FROM epochs WHERE epoch = ?) GROUP BY e.trial_id",
+            (sweep, epoch, trial_id, epoch)).fetchall()
+        if len(rows) < sweep_cfg.get("min_trials", 3):
+            return False
+        best_so_far = conn.execute(
+            "SELECT MIN(val_loss) FROM epochs WHERE trial_id = ? AND epoch <= ?",
+            (trial_id, epoch)).fetchone()[0]
+        return best_so_far > statistics.median(r[1] for r in rows)
+
+    if pruner == "halving":
+        eta = sweep_cfg.get("reduction_factor", 3)
+        rung = math.log(epoch / min_epochs, eta)
+        if abs(rung - round(rung)) > 1e-9:
+            return False
+        losses = sorted(r[0] for r in conn.execute(
+            "SELECT e.val_loss FROM epochs e JOIN trials t ON t.trial_id = e.trial_id "
+            "WHERE t.sweep = ? AND e.epoch = ?", (sweep, epoch)).fetchall())
+        keep = len(losses) // eta
+        if keep == 0:
+            return False
+        return val_loss > losses[keep - 1]
+
+    raise ValueError(f"Unknown pruner: {pruner}")
+
+
+def _init_worker(threads):
+    # Set before torch spins up its pools in this process
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    os.environ["TQDM_DISABLE"] = "1"
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def run_trial(sweep, trial_id, cfg, params, sweep_cfg):
+    """
+    Train one configuration, reporting every epoch to the results store.
+    """
+    from src.train import train
+
+    db_path = sweep_cfg["results_db"]
+    trial_dir = os.path.join(sweep_cfg["output_dir"], f"trial_{trial_id:04d}")
+    cfg = apply_params(cfg, params)
+    cfg["train"]["checkpoint_dir"] = trial_dir
+    cfg["eval"]["outputs_dir"] = trial_dir
+    if "num_workers" in sweep_cfg:
+        cfg["data"]["num_workers"] = sweep_cfg["num_workers"]
+        cfg["data"]["loader_tuning"] = None  # tuned for a whole box, not one trial
+
+    conn = connect(db_path)
+    pruned = {"flag": False}
+
+    def report(epoch, metrics):
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO epochs VALUES (?, ?, ?, ?, ?)",
+                         (trial_id, epoch, metrics["train_loss"], metrics["val_loss"], metrics["val_acc"]))
+        pruned["flag"] = should_prune(conn, sweep, trial_id, epoch, metrics["val_loss"], sweep_cfg)
+        return pruned["flag"]
+
+    start = time.perf_counter()
+    try:
+        result = train(cfg, epoch_callback=report)
+        status, error = ("pruned" if pruned["flag"] else "complete"), None
+    except Exception as e:  # keep the sweep going, record the failure
+        result, status, error = {"best_val_loss": None, "best_epoch": None}, "failed", repr(e)
+    seconds = time.perf_counter() - start
+
+    with conn:
+        conn.execute("UPDATE trials SET status = ?, best_val_loss = ?, best_epoch = ?, seconds = ?, error = ? "
+                     "WHERE trial_id = ?",
+                     (status, result["best_val_loss"], result["best_epoch"], seconds, error, trial_id))
+    conn.close()
+    return trial_id, status, result["best_val_loss"], seconds
+
+
+def run_sweep(cfg, n_trials=None, parallel=None):
+    """
+    Sample trials from cfg["sweep"]["space"] and run them on a process pool.
+
+    Returns:
+        list of (trial_id, status, best_val_loss, seconds), best first
+    """
+    sweep_cfg = cfg["sweep"]
+    n_trials = n_trials or sweep_cfg.get("n_trials", 8)
+    parallel = parallel or sweep_cfg.get("max_parallel") or 1
+    threads = sweep_cfg.get("threads_per_trial") or max(1, (os.cpu_count() or 1) // parallel)
+    rng = random.Random(sweep_cfg.get("seed", cfg["seed"]))
+    name = sweep_cfg.get("name", time.strftime("sweep-%Y%m%d-%H%M%S"))
+
+    conn = connect(sweep_cfg["results_db"])
+    trials = []
+    for _ in range(n_trials):
+        params = sample_params(sweep_cfg["space"], rng)
+        with conn:
+            cur = conn.execute("INSERT INTO trials (sweep, params, status) VALUES (?, ?, 'running')",
+                               (name, json.dumps(params)))
+        trials.append((cur.lastrowid, params))
+    conn.close()
+
+    print(f"🔎 Sweep {name}: {n_trials} trials, {parallel} in parallel, {threads} threads each")
+    results = []
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=mp.get_context("spawn"),
+                             initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = {pool.submit(run_trial, name, tid, cfg, params, sweep_cfg): tid for tid, params in trials}
+        for fut in as_completed(futures):
+            trial_id, status, best, seconds = fut.result()
+            best_str = f"{best:.4f}" if best is not None else "n/a"
+            print(f"  trial {trial_id}: {status} | best val loss {best_str} | {seconds:.0f}s")
+            results.append((trial_id, status, best, seconds))
+
+    results.sort(key=lambda r: float("inf") if r[2] is None else r[2])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep")
+    parser.add_argument("--config", type=str, default="config.yaml")
+    parser.add_argument("--trials", type=int, default=None, help="Override sweep.n_trials")
+    parser.add_argument("--parallel", type=int, default=None, help="Override sweep.max_parallel")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    results = run_sweep(cfg, n_trials=args.trials, parallel=args.parallel)
+
+    conn = connect(cfg["sweep"]["results_db"])
+    print("\n🏆 Leaderboard")
+    for trial_id, status, best, seconds in results[:10]:
+        params = conn.execute("SELECT params FROM trials WHERE trial_id = ?", (trial_id,)).fetchone()[0]
+        best_str = f"{best:.4f}" if best is not None else "n/a"
+        print(f"  #{trial_id} [{status}] val loss {best_str}  {params}")
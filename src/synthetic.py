@@ -0,0 +1,29 @@
+# src/synthetic.py
+"""
+Synthetic lesion-like test images for the benchmark and load-testing tools.
+
+Only numpy and Pillow are needed, so the load generator can run on a light
+client machine without torch.
+"""
+import io
+
+import numpy as np
+from PIL import Image
+
+
+def synthetic_image(width, height, seed=0):
+    """
+    Lesion-like RGB test image: smooth low-frequency blobs plus mild noise,
+    so it compresses like a photo rather than like pure noise.
+    """
+    rng = np.random.default_rng(seed)
+    coarse = Image.fromarray(rng.integers(60, 200, (12, 16, 3), dtype=np.uint8)).resize((width, height),
+                                                                                         Image.BICUBIC)
+    pixels = np.asarray(coarse, dtype=np.int16) + rng.integers(-8, 9, (height, width, 3), dtype=np.int16)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def jpeg_bytes(image, quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
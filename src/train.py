@@ -1,5 +1,6 @@
 # src/train.py
 import os
+import time
 import torch
 import torch.nn as nn
 from torch.optim import Adam
@@ -9,10 +10,10 @@ from sklearn.metrics import accuracy_score
 import pandas as pd  # Added for CSV output
 import matplotlib.pyplot as plt  # Added for F1 bar chart
 
-from src.dataset import get_dataloaders  # type: ignore
-from src.utils import load_config, set_seed, compute_class_weights, calculate_metrics, plot_confusion_matrix  # type: ignore
-from model.model import get_model, save_checkpoint  # type: ignore
-from torchvision import datasets, transforms
+from src.dataset import get_dataloaders, resize_train_loader, scheduled_resolution  # type: ignore
+from src.profiler import StepTimer, make_trace_profiler  # type: ignore
+from src.utils import load_config, set_seed, compute_class_weights, calculate_metrics, plot_confusion_matrix, peak_rss_mb  # type: ignore
+from model.model import get_model, save_checkpoint, checkpoint_metadata, enable_memory_efficient, trainable_parameters  # type: ignore
 
 def validate(model, loader, device, class_names, epoch=None, output_dir=None):
     model.eval()
@@ -75,8 +76,18 @@ def validate(model, loader, device, class_names, epoch=None, output_dir=None):
 
     return val_loss, val_acc
 
-def main():
-    cfg = load_config("config.yaml")
+def train(cfg, epoch_callback=None):
+    """
+    Full training run driven by a config dict.
+
+    Args:
+        cfg (dict): Parsed config.yaml (or a sweep trial's overridden copy)
+        epoch_callback (callable): Optional fn(epoch, metrics) called after each
+            validation; returning True stops training (used for sweep pruning)
+
+    Returns:
+        dict: best_val_loss, best_epoch and per-epoch history
+    """
     set_seed(cfg["seed"])
     device = "cuda" if torch.cuda.is_available() else "cpu"
     os.makedirs(cfg["train"]["checkpoint_dir"], exist_ok=True)
@@ -85,15 +96,18 @@ def main():
     # Data
     train_loader, val_loader, classes = get_dataloaders(
         cfg["data"]["train_dir"], cfg["data"]["val_dir"],
-        cfg["data"]["img_size"], cfg["train"]["batch_size"], cfg["data"]["num_workers"]
+        cfg["data"]["img_size"], cfg["train"]["batch_size"], cfg["data"]["num_workers"],
+        manifest_path=cfg["data"].get("manifest"), tuning_path=cfg["data"].get("loader_tuning")
         )
-    # Class weights (optional)
-    train_ds = datasets.ImageFolder(cfg["data"]["train_dir"], transform=transforms.ToTensor())
-    class_weights, counts = compute_class_weights(train_ds, classes)
+    # Class weights (optional) - targets come from the loader's dataset, no second scan
+    class_weights, counts = compute_class_weights(train_loader.dataset, classes)
 
     # Model
     model = get_model(cfg["model"]["name"], num_classes=cfg["model"]["num_classes"],
-                      pretrained=cfg["model"]["pretrained"]).to(device)
+                      pretrained=cfg["model"]["pretrained"],
+                      unfreeze_depth=cfg["model"].get("unfreeze_depth")).to(device)
+    if cfg["train"].get("memory_efficient"):
+        enable_memory_efficient(model, checkpoint_segments=cfg["train"].get("checkpoint_segments", 0))
 
     # Loss
     if cfg["train"]["use_class_weights"]:
@@ -102,53 +116,101 @@ def main():
         ce = nn.CrossEntropyLoss()
 
     # Optimizer + LR scheduler
-    opt = Adam(model.parameters(), lr=cfg["train"]["lr"], weight_decay=cfg["train"]["weight_decay"])
+    opt = Adam(trainable_parameters(model), lr=cfg["train"]["lr"], weight_decay=cfg["train"]["weight_decay"])
     sched = StepLR(opt, step_size=cfg["train"]["step_size"], gamma=cfg["train"]["gamma"]) if cfg["train"]["scheduler"] == "step" else None
 
     # Training loop
     best_val = float("inf")
     patience = cfg["train"]["early_stopping_patience"]
     no_improve = 0
+    best_epoch = 0
+    history = []
 
     print("Run ID: exp-002")
-    print("Model: ResNet50")
-    print("Layers unfrozen: layer3, layer4, fc")
-    print("LR: 1e-4 | Epochs: 10")
-
-    for epoch in range(1, cfg["train"]["epochs"] + 1):
-        model.train()
-        running_loss = 0.0
-        pbar = tqdm(train_loader, desc=f"Epoch {epoch}/{cfg['train']['epochs']}")
-        for x, y in pbar:
-            x, y = x.to(device), y.to(device)
-            opt.zero_grad()
-            logits = model(x)
-            loss = ce(logits, y)
-            loss.backward()
-            opt.step()
-            running_loss += loss.item() * x.size(0)
-            pbar.set_postfix(loss=loss.item())
-
-        train_loss = running_loss / len(train_loader.dataset)
-        val_loss, val_acc = validate(model, val_loader, device, classes, epoch, output_dir=cfg["eval"]["outputs_dir"])
-
-        if sched:
-            sched.step()
-
-        print(f"[Epoch {epoch}] Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.4f}")
-
-        # Early stopping + checkpointing
-        if val_loss < best_val:
-            best_val = val_loss
-            no_improve = 0
-            ckpt_path = os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
-            save_checkpoint(model, ckpt_path)
-            print(f"✅ Saved best model to {ckpt_path}")
-        else:
-            no_improve += 1
-            if no_improve >= patience:
-                print("⏹️ Early stopping triggered.")
+    print(f"Model: {cfg['model']['name']}")
+    print(f"Unfreeze depth: {cfg['model'].get('unfreeze_depth') or 'all'}")
+    print(f"LR: {cfg['train']['lr']} | Epochs: {cfg['train']['epochs']}")
+
+    profile_cfg = cfg.get("profile") or {}
+    timer = StepTimer(device, enabled=profile_cfg.get("enabled", False))
+
+    # Progressive resizing: train loader follows the schedule, validation stays at full size
+    schedule = cfg["train"].get("progressive_resize")
+    current = (cfg["data"]["img_size"], cfg["train"]["batch_size"])
+
+    with make_trace_profiler(profile_cfg, device) as trace:
+        for epoch in range(1, cfg["train"]["epochs"] + 1):
+            epoch_start = time.perf_counter()
+            wanted = scheduled_resolution(schedule, epoch, cfg["data"]["img_size"], cfg["train"]["batch_size"])
+            if wanted != current:
+                train_loader = resize_train_loader(train_loader, *wanted)
+                current = wanted
+                print(f"📐 Training at {current[0]}px, batch size {current[1]}")
+
+            model.train()
+            running_loss = 0.0
+            timer.reset()
+            pbar = tqdm(train_loader, desc=f"Epoch {epoch}/{cfg['train']['epochs']}")
+            timer.start()
+            for x, y in pbar:
+                timer.mark("data")
+                x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+                timer.mark("h2d")
+                opt.zero_grad()
+                logits = model(x)
+                loss = ce(logits, y)
+                timer.mark("forward")
+                loss.backward()
+                timer.mark("backward")
+                opt.step()
+                timer.mark("step")
+                timer.step(x.size(0))
+                trace.step()
+                running_loss += loss.item() * x.size(0)
+                pbar.set_postfix(loss=loss.item())
+
+            train_loss = running_loss / len(train_loader.dataset)
+            timer.report(epoch)
+            val_loss, val_acc = validate(model, val_loader, device, classes, epoch, output_dir=cfg["eval"]["outputs_dir"])
+
+            if sched:
+                sched.step()
+
+            epoch_s = time.perf_counter() - epoch_start
+            print(f"[Epoch {epoch}] Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f} | Val Acc: {val_acc:.4f} "
+                  f"| {current[0]}px | {epoch_s:.1f}s | peak RSS {peak_rss_mb() or 0:.0f} MB")
+            metrics = {"train_loss": train_loss, "val_loss": val_loss, "val_acc": val_acc,
+                       "img_size": current[0], "epoch_s": epoch_s}
+            history.append({"epoch": epoch, **metrics})
+
+            # Early stopping + checkpointing
+            if val_loss < best_val:
+                best_val = val_loss
+                best_epoch = epoch
+                no_improve = 0
+                ckpt_path = os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
+                meta = checkpoint_metadata(cfg["model"]["name"], classes, cfg["data"]["img_size"],
+                                           epoch=epoch, val_loss=val_loss, val_acc=val_acc)
+                save_checkpoint(model, ckpt_path, metadata=meta, fp16=cfg["train"].get("checkpoint_fp16", False))
+                print(f"✅ Saved best model to {ckpt_path}")
+            else:
+                no_improve += 1
+                if no_improve >= patience:
+                    print("⏹️ Early stopping triggered.")
+                    break
+
+            if epoch_callback is not None and epoch_callback(epoch, metrics):
+                print("✂️ Stopped by epoch callback.")
                 break
 
+    total_s = sum(h["epoch_s"] for h in history)
+    print(f"🕒 Total training wall-clock: {total_s:.1f}s over {len(history)} epochs")
+    return {"best_val_loss": best_val, "best_epoch": best_epoch, "history": history}
+
+
+def main():
+    cfg = load_config("config.yaml")
+    train(cfg)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
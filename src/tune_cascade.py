@@ -0,0 +1,145 @@
+# src/tune_cascade.py
+"""
+Pick the API cascade thresholds on the validation split.
+
+The fast checkpoint (cascade.checkpoint, e.g. a resnet18) answers on its own
+when its top-1 probability and top-1/top-2 margin clear two thresholds;
+everything else escalates to the served checkpoint with cascade.tta_policy
+views. Both models' val logits come from the logits store (calibrated the
+way the API calibrates them), so the grid search itself is pure numpy.
+
+Among the (confidence, margin) pairs whose cascaded melanoma recall reaches
+--target-mel-recall, the one with the lowest average compute per request
+(FLOPs: fast model + escalated share x views x full model) is chosen and
+saved to the fast checkpoint's metadata, where the API reads it.
+
+Usage:
+    python -m src.tune_cascade --target-mel-recall 0.9
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import torch
+
+from api.utils import TTA_POLICIES, cascade_accepts
+from model.model import calibrate_logits, load_checkpoint, load_metadata, save_metadata
+from src.evaluate import score_split
+from src.model_bench import count_flops
+from src.utils import load_config
+
+CONFIDENCES = np.round(np.arange(0.30, 1.0, 0.01), 2)
+MARGINS = np.round(np.arange(0.0, 0.95, 0.05), 2)
+
+
+def calibrated_probs(logits, ckpt_path):
+    calibration = load_metadata(ckpt_path).get("calibration")
+    logits = calibrate_logits(torch.as_tensor(logits, dtype=torch.float32), calibration)
+    return torch.softmax(logits, dim=-1).numpy()
+
+
+def cascade_grid(fast_probs, full_probs, y_true, mel, fast_flops, full_flops):
+    """
+    Quality and cost of every threshold pair in CONFIDENCES x MARGINS.
+
+    Args:
+        fast_probs, full_probs (np.ndarray): [N, C] probabilities of each stage
+        y_true (np.ndarray): [N] class indices
+        mel (int): Index of the melanoma class
+        fast_flops, full_flops (float): FLOPs per request of each stage on its own
+
+    Returns:
+        pandas.DataFrame: one row per threshold pair
+    """
+    fast_pred, full_pred = fast_probs.argmax(axis=1), full_probs.argmax(axis=1)
+    is_mel = y_true == mel
+    rows = []
+    for conf in CONFIDENCES:
+        for margin in MARGINS:
+            accept = cascade_accepts(fast_probs, conf, margin)
+            y_pred = np.where(accept, fast_pred, full_pred)
+            escalated = 1 - accept.mean()
+            rows.append({
+                "min_confidence": conf,
+                "min_margin": margin,
+                "escalated": escalated,
+                "accuracy": float((y_pred == y_true).mean()),
+                "mel_recall": float((y_pred[is_mel] == mel).mean()) if is_mel.any() else float("nan"),
+                "gflops_per_request": (fast_flops + escalated * full_flops) / 1e9,
+            })
+    return pd.DataFrame(rows)
+
+
+def main():
+    cfg = load_config("config.yaml")
+    cascade_cfg = cfg.get("cascade", {})
+    parser = argparse.ArgumentParser(description="Choose cascade thresholds for a target melanoma recall on val")
+    parser.add_argument("--fast", type=str, default=cascade_cfg.get("checkpoint"), help="Fast (first stage) checkpoint")
+    parser.add_argument("--target-mel-recall", type=float, default=cascade_cfg.get("target_mel_recall", 0.9))
+    parser.add_argument("--tta-policy", choices=TTA_POLICIES, default=cascade_cfg.get("tta_policy", "full"),
+                        help="Views of the escalated stage")
+    parser.add_argument("--no-save", action="store_true", help="Only report; leave the checkpoint metadata alone")
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    classes = cfg["data"]["class_names"]
+    img_size = cfg["data"]["img_size"]
+    full_path = os.path.join(cfg["train"]["checkpoint_dir"], cfg["train"]["checkpoint_name"])
+    if not args.fast or not os.path.exists(args.fast):
+        raise SystemExit(f"❌ Fast checkpoint not found: {args.fast} (set cascade.checkpoint or --fast)")
+
+    # The fast model's architecture comes from the checkpoint, not from model.name
+    fast_model = load_checkpoint(args.fast, num_classes=cfg["model"]["num_classes"], device=device)
+    val, fast_store = score_split(cfg, args.fast, "val", device, model=fast_model)
+    _, full_store = score_split(cfg, full_path, "val", device, tta=True)
+    hashes = val["sha1"].tolist()
+    y_true = np.array([classes.index(label) for label in val["label"]])
+
+    full = TTA_POLICIES["full"]
+    views = [full.index(v) for v in TTA_POLICIES[args.tta_policy]]
+    fast_probs = calibrated_probs(fast_store.get("logits", hashes), args.fast)
+    full_probs = calibrated_probs(full_store.get("tta_logits", hashes)[:, views], full_path).mean(axis=1)
+
+    fast_flops = count_flops(fast_model.cpu(), img_size)
+    full_model = load_checkpoint(full_path, cfg["model"]["name"], cfg["model"]["num_classes"])
+    full_flops = len(views) * count_flops(full_model, img_size)
+    mel = classes.index("mel")
+    grid = cascade_grid(fast_probs, full_probs, y_true, mel, fast_flops, full_flops)
+    os.makedirs(cfg["eval"]["outputs_dir"], exist_ok=True)
+    grid_path = os.path.join(cfg["eval"]["outputs_dir"], "cascade_thresholds.csv")
+    grid.to_csv(grid_path, index=False)
+
+    full_mel = float((full_probs.argmax(axis=1)[y_true == mel] == mel).mean())
+    print(f"\n🪜 Cascade on {len(val)} val images ({args.tta_policy} policy, {len(views)} views when escalated)")
+    print(f"  full model alone: mel recall {full_mel:.4f}, {full_flops / 1e9:.2f} GFLOPs/request")
+
+    ok = grid[grid["mel_recall"] >= args.target_mel_recall]
+    if ok.empty:
+        raise SystemExit(f"❌ No threshold pair reaches mel recall {args.target_mel_recall:.2f} "
+                         f"(grid saved to {grid_path})")
+    best = ok.sort_values(["gflops_per_request", "accuracy"], ascending=[True, False]).iloc[0]
+    print(f"  chosen: confidence >= {best['min_confidence']:.2f}, margin >= {best['min_margin']:.2f}")
+    print(f"    mel recall {best['mel_recall']:.4f} | accuracy {best['accuracy']:.4f} | "
+          f"escalated {best['escalated']:.1%} | {best['gflops_per_request']:.2f} GFLOPs/request "
+          f"({best['gflops_per_request'] * 1e9 / full_flops:.0%} of full)")
+    print(f"📄 Full grid saved to {grid_path}")
+    if load_metadata(full_path).get("ood") and not load_metadata(args.fast).get("ood"):
+        print(f"⚠️ {args.fast} has no OOD detector but {full_path} does: the API will escalate every request "
+              f"until you run `python -m src.fit_ood --checkpoint {args.fast}`")
+
+    if not args.no_save:
+        save_metadata(args.fast, cascade={
+            "min_confidence": float(best["min_confidence"]),
+            "min_margin": float(best["min_margin"]),
+            "target_mel_recall": args.target_mel_recall,
+            "val_mel_recall": float(best["mel_recall"]),
+            "val_escalated": float(best["escalated"]),
+            "tta_policy": args.tta_policy,
+            "escalates_to": os.path.basename(full_path),
+        })
+        print(f"✅ Cascade thresholds saved to checkpoint metadata for {args.fast}")
+
+
+if __name__ == "__main__":
+    main()
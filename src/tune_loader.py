@@ -0,0 +1,110 @@
+# src/tune_loader.py
+"""
+Benchmark DataLoader settings on this machine and dataset, and save the best.
+
+Sweeps num_workers x prefetch_factor (persistent workers on, pin_memory only
+with CUDA) over the real training dataset and augmentation pipeline, then
+writes the fastest setting to `data.loader_tuning`, which get_dataloaders
+picks up on the next run.
+
+Usage:
+    python -m src.tune_loader --batches 30
+"""
+import argparse
+import json
+import os
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from src.dataset import build_datasets, loader_kwargs
+from src.utils import load_config
+
+
+def default_worker_grid():
+    cpus = os.cpu_count() or 1
+    grid = {0, 1, 2, 4, cpus // 2, cpus}
+    return sorted(w for w in grid if 0 <= w <= cpus)
+
+
+def benchmark_loader(dataset, batch_size, num_workers, prefetch_factor, n_batches=30, warmup=3):
+    """
+    Measure one DataLoader setting.
+
+    Returns:
+        dict with startup seconds (worker spawn + first batch) and steady-state images/sec
+    """
+    kwargs = loader_kwargs(num_workers, prefetch_factor=prefetch_factor)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, drop_last=True, **kwargs)
+
+    t0 = time.perf_counter()
+    it = iter(loader)
+    next(it)
+    startup = time.perf_counter() - t0
+    for _ in range(max(warmup - 1, 0)):
+        next(it)
+
+    images = 0
+    t_steady = time.perf_counter()
+    for _ in range(n_batches):
+        try:
+            x, _ = next(it)
+        except StopIteration:
+            break
+        images += x.size(0)
+    elapsed = time.perf_counter() - t_steady
+    del it, loader  # shut workers down before the next setting
+
+    return {
+        "num_workers": num_workers,
+        "prefetch_factor": prefetch_factor if num_workers > 0 else None,
+        "startup_s": startup,
+        "images_per_s": images / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def tune(cfg, workers=None, prefetch=(2, 4, 8), n_batches=30):
+    """
+    Run the sweep and return (best, all_results).
+    """
+    train_ds, _ = build_datasets(cfg["data"]["train_dir"], cfg["data"]["val_dir"],
+                                 cfg["data"]["img_size"], cfg["data"].get("manifest"))
+    batch_size = cfg["train"]["batch_size"]
+    results = []
+    for w in workers or default_worker_grid():
+        for pf in (prefetch if w > 0 else (None,)):
+            r = benchmark_loader(train_ds, batch_size, w, pf, n_batches=n_batches)
+            results.append(r)
+            print(f"  workers={w:<3} prefetch={str(r['prefetch_factor']):<5} "
+                  f"startup={r['startup_s']:.2f}s  {r['images_per_s']:.1f} img/s")
+    best = max(results, key=lambda r: r["images_per_s"])
+    return best, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auto-tune DataLoader settings for this machine")
+    parser.add_argument("--config", type=str, default="config.yaml")
+    parser.add_argument("--batches", type=int, default=30, help="Timed batches per setting")
+    parser.add_argument("--workers", type=int, nargs="*", default=None, help="Worker counts to try")
+    parser.add_argument("--prefetch", type=int, nargs="*", default=[2, 4, 8], help="prefetch_factor values to try")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    torch.manual_seed(cfg["seed"])
+    print(f"🔧 Tuning DataLoader on {os.cpu_count()} CPUs (batch_size={cfg['train']['batch_size']})")
+    best, results = tune(cfg, workers=args.workers, prefetch=args.prefetch, n_batches=args.batches)
+
+    out_path = cfg["data"]["loader_tuning"]
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump({
+            "cpu_count": os.cpu_count(),
+            "cuda": torch.cuda.is_available(),
+            "batch_size": cfg["train"]["batch_size"],
+            "img_size": cfg["data"]["img_size"],
+            "best": {"num_workers": best["num_workers"], "prefetch_factor": best["prefetch_factor"]},
+            "results": results,
+        }, f, indent=2)
+    print(f"✅ Best: workers={best['num_workers']} prefetch={best['prefetch_factor']} "
+          f"({best['images_per_s']:.1f} img/s) saved to {out_path}")
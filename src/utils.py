@@ -2,6 +2,7 @@
 
 import os
 import random
+import sys
 import numpy as np
 import torch
 import yaml
@@ -29,6 +30,19 @@ def set_seed(seed=42):
     torch.cuda.manual_seed_all(seed)
 
 
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (None where unsupported).
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
 def compute_class_weights(imagefolder_dataset, class_names):
     """
     Compute inverse-frequency class weights.
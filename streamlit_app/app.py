@@ -4,8 +4,11 @@ Provides a user-friendly interface for uploading images and viewing predictions.
 """
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 import io
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -13,6 +16,11 @@ import os
 
 # Configuration - works for both local and Hugging Face Spaces
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+MODEL_IMG_SIZE = int(os.getenv("MODEL_IMG_SIZE", "224"))
+# Uploads larger than this are downscaled client-side to the model resolution
+DOWNSCALE_BYTES = int(os.getenv("UPLOAD_DOWNSCALE_BYTES", str(1024 * 1024)))
+# Max concurrent /predict requests when analyzing several images
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
 
 # Page configuration
 st.set_page_config(
@@ -265,31 +273,58 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def get_session():
+    """Pooled HTTP session shared by all reruns (keeps connections to the API alive)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=10, show_spinner=False)
 def check_api_health():
     """Check if the API is running and healthy."""
     try:
-        response = requests.get(f"{API_URL}/health", timeout=2)
+        response = get_session().get(f"{API_URL}/health", timeout=2)
         return response.status_code == 200
-    except:
+    except requests.exceptions.RequestException:
         return False
 
 
+@st.cache_data(ttl=300, show_spinner=False)
 def get_classes():
     """Get list of classes from API."""
     try:
-        response = requests.get(f"{API_URL}/classes")
+        response = get_session().get(f"{API_URL}/classes", timeout=5)
         if response.status_code == 200:
             return response.json()["classes"]
         return []
-    except:
+    except requests.exceptions.RequestException:
         return []
 
 
-def predict_image(image_bytes):
+def prepare_upload(data, filename, content_type):
+    """
+    Bytes to send for an upload: the original file, or - when it is large - a
+    lossless PNG already resized to the model resolution (the API's first step
+    is the same RGB conversion and resize, so the prediction is unchanged).
+    """
+    if len(data) <= DOWNSCALE_BYTES:
+        return data, filename, content_type or "image/jpeg"
+    with Image.open(io.BytesIO(data)) as image:
+        small = image.convert("RGB").resize((MODEL_IMG_SIZE, MODEL_IMG_SIZE), Image.BILINEAR)
+    buffer = io.BytesIO()
+    small.save(buffer, format="PNG")
+    return buffer.getvalue(), os.path.splitext(filename)[0] + ".png", "image/png"
+
+
+def predict_image(image_bytes, filename="image.jpg", content_type="image/jpeg", session=None):
     """Send image to API for prediction."""
     try:
-        files = {"file": ("image.jpg", image_bytes, "image/jpeg")}
-        response = requests.post(f"{API_URL}/predict", files=files, timeout=30)
+        files = {"file": (filename, image_bytes, content_type)}
+        response = (session or get_session()).post(f"{API_URL}/predict", files=files, timeout=30)
         
         if response.status_code == 200:
             return response.json(), None
@@ -301,6 +336,61 @@ def predict_image(image_bytes):
         return None, f"Error: {str(e)}"
 
 
+def analyze_batch(uploads, keys, results, on_update=None):
+    """
+    Predict every upload whose content is not in `results` yet, through a
+    bounded thread pool. `results` (file sha1 -> entry) lives in session_state,
+    so reruns and re-uploads of the same image never hit the API again.
+    """
+    session = get_session()  # resolved here: worker threads have no Streamlit context
+    todo = {}
+    for uploaded, key in zip(uploads, keys):
+        if key not in results and key not in todo:
+            todo[key] = (uploaded.getvalue(), uploaded.name, uploaded.type)
+
+    def send(data, name, content_type):
+        return predict_image(*prepare_upload(data, name, content_type), session=session)
+
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as pool:
+        futures = {pool.submit(send, *item): key for key, item in todo.items()}
+        for future in as_completed(futures):
+            result, error = future.result()
+            results[futures[future]] = {"result": result, "error": error}
+            if on_update:
+                on_update()
+    return len(todo)
+
+
+def batch_table(uploads, keys, results):
+    """One row per uploaded file, in upload order; pending files show as such."""
+    rows = []
+    for uploaded, key in zip(uploads, keys):
+        entry = results.get(key)
+        row = {"File": uploaded.name, "Prediction": None, "Confidence": None, "Runner-up": None, "Status": "pending"}
+        if entry is not None and entry["error"]:
+            row["Status"] = entry["error"]
+        elif entry is not None:
+            pred = entry["result"]["prediction"]
+            ranked = entry["result"]["all_probabilities"]
+            row.update({
+                "Prediction": pred["class"],
+                "Confidence": pred["confidence"],
+                "Runner-up": f"{ranked[1]['class']} ({ranked[1]['percentage']})" if len(ranked) > 1 else None,
+                "Status": "done",
+            })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def show_batch_table(placeholder, uploads, keys, results):
+    placeholder.dataframe(
+        batch_table(uploads, keys, results),
+        use_container_width=True,
+        hide_index=True,
+        column_config={"Confidence": st.column_config.ProgressColumn("Confidence", min_value=0.0, max_value=1.0, format="%.2f")},
+    )
+
+
 def main():
     # Header
     st.markdown('<div class="main-header">Skin Lesion Classifier</div>', unsafe_allow_html=True)
@@ -343,30 +433,39 @@ def main():
         
         with col1:
             st.subheader("Upload Image")
-            uploaded_file = st.file_uploader(
-                "Choose a skin lesion image",
+            uploaded_files = st.file_uploader(
+                "Choose skin lesion images",
                 type=["jpg", "jpeg", "png"],
-                help="Upload a clear image of the skin lesion"
+                accept_multiple_files=True,
+                help="Upload a clear image of the skin lesion, or several images from one visit"
             )
+            uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
+            
+            if len(uploaded_files) > 1:
+                # Results are keyed by content, so reruns reuse them
+                upload_keys = [hashlib.sha1(f.getvalue()).hexdigest() for f in uploaded_files]
+                batch_results = st.session_state.setdefault('batch_results', {})
+                st.write(f"{len(uploaded_files)} images selected")
+                analyze_all = st.button("ANALYZE ALL", type="primary")
+                
+                # Detail view follows the image picked under the batch table
+                picked = batch_results.get(st.session_state.get('batch_detail'))
+                if picked and picked["result"]:
+                    st.session_state['prediction_result'] = picked["result"]
             
             if uploaded_file is not None:
                 # Display uploaded image
-                image = Image.open(uploaded_file)
-                st.image(image, caption="Uploaded Image", width=400)
+                image_bytes = uploaded_file.getvalue()
+                st.image(image_bytes, caption="Uploaded Image", width=400)
                 
                 # Predict button
                 if st.button("ANALYZE IMAGE", type="primary"):
                     with st.spinner("Analyzing image..."):
-                        # Convert image to bytes
-                        img_bytes = io.BytesIO()
-                        # Ensure image is in RGB mode (handles RGBA, P, L, etc.)
-                        if image.mode != 'RGB':
-                            image = image.convert('RGB')
-                        image.save(img_bytes, format='JPEG')
-                        img_bytes.seek(0)
+                        # Send the original bytes (downscaled only when large)
+                        payload = prepare_upload(image_bytes, uploaded_file.name, uploaded_file.type)
                         
                         # Get prediction
-                        result, error = predict_image(img_bytes.getvalue())
+                        result, error = predict_image(*payload)
                         
                         if error:
                             st.error(error)
@@ -451,6 +550,24 @@ def main():
             else:
                 st.info("Upload an image and click 'ANALYZE IMAGE' to see results")
     
+        if len(uploaded_files) > 1:
+            st.subheader("Batch Results")
+            placeholder = st.empty()
+            show_batch_table(placeholder, uploaded_files, upload_keys, batch_results)
+            if analyze_all:
+                sent = analyze_batch(
+                    uploaded_files, upload_keys, batch_results,
+                    on_update=lambda: show_batch_table(placeholder, uploaded_files, upload_keys, batch_results)
+                )
+                if sent == 0:
+                    st.info("All images already analyzed")
+            
+            names = {key: f.name for f, key in zip(uploaded_files, upload_keys)
+                     if (batch_results.get(key) or {}).get("result")}
+            if names:
+                st.selectbox("Show details for", list(names), format_func=names.get, key='batch_detail',
+                             index=None, placeholder="Pick an analyzed image")
+    
     with tab2:
         st.subheader("Skin Lesion Class Information")
         
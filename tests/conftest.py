@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Modules are imported as src.*, api.*, model.* from the repository root
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def make_image():
+    """Write a small RGB image and return its path."""
+    def _make(path, size=(32, 24), seed=0):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pixels = np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(path)
+        return str(path)
+    return _make
@@ -0,0 +1,83 @@
+import importlib
+import io
+
+import pytest
+import torch
+from PIL import Image
+
+pytest.importorskip("httpx")  # fastapi.testclient
+from fastapi.testclient import TestClient
+
+from model.model import checkpoint_metadata, get_model, save_checkpoint, save_ood
+
+CLASSES = ["benign", "malignant", "other"]
+
+
+def jpeg(size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (180, 120, 90)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def make_app(monkeypatch, model_path, **env):
+    monkeypatch.setenv("MODEL_PATH", model_path)
+    monkeypatch.setenv("OPTIMIZE_MODE", env.pop("OPTIMIZE_MODE", "none"))
+    for key in ("SHADOW_MODEL_PATH", "CASCADE_MODEL_PATH", "TTA_POLICY"):
+        monkeypatch.delenv(key, raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    import api.app
+    return importlib.reload(api.app)
+
+
+@pytest.fixture
+def safetensors_ckpt(tmp_path):
+    torch.manual_seed(0)
+    path = str(tmp_path / "small.safetensors")
+    save_checkpoint(get_model("resnet18", num_classes=len(CLASSES), pretrained=False), path,
+                    metadata=checkpoint_metadata("resnet18", CLASSES, 96))
+    return path
+
+
+def test_labels_and_preprocessing_from_metadata(monkeypatch, safetensors_ckpt):
+    app_module = make_app(monkeypatch, safetensors_ckpt, TTA_POLICY="hflip")
+    with TestClient(app_module.app) as client:
+        assert [c["code"] for c in client.get("/classes").json()["classes"]] == CLASSES
+        health = client.get("/health").json()
+        assert health["model"] == "resnet18" and health["num_classes"] == 3
+
+        body = client.post("/predict", files={"file": ("x.jpg", jpeg(), "image/jpeg")}).json()
+        assert {p["class"] for p in body["all_probabilities"]} == set(CLASSES)
+        assert body["prediction"]["class"] in CLASSES + ["UNKNOWN"]
+    assert app_module.transform.transforms[0].size == (96, 96)
+
+
+def test_legacy_checkpoint_falls_back_to_constants(monkeypatch, tmp_path):
+    path = str(tmp_path / "legacy.pt")
+    torch.save(get_model("resnet50", num_classes=7, pretrained=False).state_dict(), path)  # MODEL_NAME
+    app_module = make_app(monkeypatch, path)
+    with TestClient(app_module.app) as client:
+        body = client.post("/predict", files={"file": ("x.jpg", jpeg(), "image/jpeg")}).json()
+        assert {p["class"] for p in body["all_probabilities"]} == set(app_module.CLASS_NAMES)
+    assert app_module.transform.transforms[0].size == (224, 224)
+
+
+def test_rejects_non_images(monkeypatch, safetensors_ckpt):
+    app_module = make_app(monkeypatch, safetensors_ckpt)
+    with TestClient(app_module.app) as client:
+        response = client.post("/predict", files={"file": ("x.txt", b"hello", "text/plain")})
+        assert response.status_code == 400
+
+
+def test_cascade_without_ood_escalates(monkeypatch, tmp_path, safetensors_ckpt):
+    # Served model flags everything as OOD; the fast model has no detector but would accept everything
+    save_ood(safetensors_ckpt, torch.zeros(len(CLASSES), 512), torch.eye(512), threshold=-1.0)
+    fast = str(tmp_path / "fast.safetensors")
+    save_checkpoint(get_model("resnet18", num_classes=len(CLASSES), pretrained=False), fast,
+                    metadata=checkpoint_metadata("resnet18", CLASSES, 96))
+    app_module = make_app(monkeypatch, safetensors_ckpt, CASCADE_MODEL_PATH=fast,
+                          CASCADE_MIN_CONFIDENCE="0", CASCADE_MIN_MARGIN="0")
+    with TestClient(app_module.app) as client:
+        body = client.post("/predict", files={"file": ("x.jpg", jpeg(), "image/jpeg")}).json()
+    assert body["stage"] == "full" and body["prediction"]["class"] == "UNKNOWN"
+    assert "ood_score" in body
@@ -0,0 +1,34 @@
+import numpy as np
+
+from api.utils import cascade_accepts
+from src.tune_cascade import CONFIDENCES, MARGINS, cascade_grid
+
+
+def test_cascade_accepts_needs_confidence_and_margin():
+    probs = np.array([[0.90, 0.05, 0.05],   # confident, wide margin
+                      [0.50, 0.45, 0.05],   # confident enough, narrow margin
+                      [0.40, 0.10, 0.50],   # wide margin, low confidence
+                      [0.34, 0.33, 0.33]])
+    assert cascade_accepts(probs, 0.5, 0.2).tolist() == [True, False, False, False]
+    assert cascade_accepts(probs, 0.5, 0.0).tolist() == [True, True, True, False]
+    assert cascade_accepts(probs, 0.0, 0.0).all()
+    assert cascade_accepts(probs[0], 0.5, 0.2)  # single row
+
+
+def test_cascade_grid_mixes_stages_and_costs():
+    y_true = np.array([0, 1, 0, 1])  # class 0 is melanoma
+    fast = np.array([[0.95, 0.05], [0.10, 0.90], [0.40, 0.60], [0.55, 0.45]])  # last two wrong, unsure
+    full = np.eye(2)[y_true]  # always right
+    grid = cascade_grid(fast, full, y_true, mel=0, fast_flops=1e9, full_flops=4e9)
+    assert len(grid) == len(CONFIDENCES) * len(MARGINS)
+
+    lax = grid[(grid["min_confidence"] == 0.3) & (grid["min_margin"] == 0.0)].iloc[0]
+    assert lax["escalated"] == 0 and lax["accuracy"] == 0.5 and lax["mel_recall"] == 0.5
+    assert lax["gflops_per_request"] == 1.0
+
+    strict = grid[(grid["min_confidence"] == 0.8) & (grid["min_margin"] == 0.5)].iloc[0]
+    assert strict["escalated"] == 0.5 and strict["accuracy"] == 1.0 and strict["mel_recall"] == 1.0
+    assert strict["gflops_per_request"] == 3.0
+
+    # Stricter thresholds never escalate less
+    assert grid.groupby("min_margin")["escalated"].apply(lambda s: s.is_monotonic_increasing).all()
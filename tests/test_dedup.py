@@ -0,0 +1,63 @@
+import pandas as pd
+
+from src.dedup import dhash_file, duplicate_groups, find_clusters, hamming
+
+
+def test_find_clusters_is_transitive():
+    a = 0
+    b = a ^ 0b111               # 3 bits from a
+    c = b ^ (0b111 << 20)       # 3 bits from b, 6 from a
+    far = (1 << 64) - 1         # 64 bits from a
+    assert hamming(a, c) == 6
+    clusters = find_clusters([a, far, b, c], max_distance=3)
+    assert [sorted(cl) for cl in clusters] == [[0, 2, 3]]
+    assert find_clusters([a, far], max_distance=3) == []
+
+
+def test_find_clusters_matches_brute_force():
+    import random
+    rng = random.Random(0)
+    base = [rng.getrandbits(64) for _ in range(5)]
+    hashes = [h ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for h in base for _ in range(3)]
+    clusters = find_clusters(hashes, max_distance=4)
+    # Brute-force connected components
+    seen, expected = set(), []
+    for i in range(len(hashes)):
+        if i in seen:
+            continue
+        component, stack = {i}, [i]
+        while stack:
+            j = stack.pop()
+            for k in range(len(hashes)):
+                if k not in component and hamming(hashes[j], hashes[k]) <= 4:
+                    component.add(k)
+                    stack.append(k)
+        seen |= component
+        if len(component) > 1:
+            expected.append(sorted(component))
+    assert sorted(sorted(c) for c in clusters) == sorted(expected)
+
+
+def test_duplicate_groups_keeps_largest(tmp_path):
+    index_df = pd.DataFrame({
+        "path": ["raw/mel/a.jpg", "raw/mel/b.jpg", "raw/nv/c.jpg", "raw/nv/d.jpg"],
+        "label": ["mel", "mel", "nv", "nv"],
+        "dhash": [0, 1, 2 ** 32 - 1, 2 ** 64 - 1],
+        "width": [100, 200, 300, 50],
+        "height": [100, 200, 300, 50],
+    })
+    groups, redundant = duplicate_groups(index_df, max_distance=2)
+    assert groups == {("mel", "a.jpg"): 0, ("mel", "b.jpg"): 0}
+    assert redundant == {("mel", "a.jpg")}
+
+
+def test_dhash_survives_resizing(tmp_path, make_image):
+    original = make_image(tmp_path / "a.png", size=(64, 48), seed=1)
+    from PIL import Image
+    Image.open(original).resize((128, 96)).save(tmp_path / "big.png")
+    other = make_image(tmp_path / "b.png", size=(64, 48), seed=2)
+
+    h, w, ht = dhash_file(original)
+    assert (w, ht) == (64, 48)
+    assert hamming(h, dhash_file(str(tmp_path / "big.png"))[0]) <= 6
+    assert hamming(h, dhash_file(other)[0]) > 6
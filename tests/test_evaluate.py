@@ -0,0 +1,63 @@
+import sys
+
+import pandas as pd
+import torch
+import yaml
+from PIL import Image
+
+from model.model import checkpoint_metadata, get_model, load_checkpoint, save_checkpoint
+from src.evaluate import eval_preprocessing, eval_transform
+from src.logits_store import LogitsStore, checkpoint_key
+from src.manifest import file_sha1
+
+CLASSES = ["mel", "nv"]
+
+
+def save(path, img_size, classes=CLASSES, **meta):
+    torch.manual_seed(0)
+    path.parent.mkdir(exist_ok=True)
+    save_checkpoint(get_model("resnet18", num_classes=len(classes), pretrained=False), str(path),
+                    metadata=checkpoint_metadata("resnet18", classes, img_size, **meta))
+    return str(path)
+
+
+def test_preprocessing_from_metadata(tmp_path):
+    cfg = {"data": {"img_size": 224}}
+    ckpt = save(tmp_path / "small.safetensors", 96, mean=[0.5, 0.5, 0.5], std=[0.25, 0.25, 0.25])
+    tfm = eval_transform(cfg, ckpt)
+    assert tfm.transforms[0].size == (96, 96) and tfm.transforms[-1].mean == [0.5, 0.5, 0.5]
+
+    legacy = tmp_path / "legacy.pt"
+    legacy.write_bytes(b"")
+    assert eval_preprocessing(cfg, str(legacy)) == {"img_size": 224}
+    assert eval_transform(cfg, str(legacy)).transforms[0].size == (224, 224)
+
+
+def test_compare_checkpoints_with_mixed_preprocessing(tmp_path, make_image, monkeypatch):
+    for label in CLASSES:
+        for i in range(3):
+            make_image(tmp_path / "data" / "test" / label / f"{label}_{i}.png", seed=10 * len(label) + i)
+    save(tmp_path / "ckpt" / "a.safetensors", 64)
+    b = save(tmp_path / "ckpt" / "b.safetensors", 96, classes=CLASSES[::-1])
+    cfg = {
+        "data": {"test_dir": str(tmp_path / "data" / "test"), "class_names": CLASSES, "img_size": 224,
+                 "num_workers": 0, "manifest": str(tmp_path / "data" / "manifest.parquet")},
+        "train": {"checkpoint_dir": str(tmp_path / "ckpt")},
+        "eval": {"outputs_dir": str(tmp_path / "outputs"), "logits_dir": str(tmp_path / "logits")},
+    }
+    (tmp_path / "config.yaml").write_text(yaml.safe_dump(cfg))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["compare_checkpoints", "--batch-size", "4"])
+
+    from src.compare_checkpoints import main
+    main()
+    board = pd.read_csv(tmp_path / "outputs" / "leaderboard.csv")
+    assert sorted(board["checkpoint"]) == ["a.safetensors", "b.safetensors"]
+    assert board["ms_per_image"].notna().all()
+
+    # b.safetensors was scored at its own 96px, not config.yaml's 224px
+    image = str(tmp_path / "data" / "test" / "nv" / "nv_0.png")
+    with torch.no_grad():
+        expected = load_checkpoint(b)(eval_transform(cfg, b)(Image.open(image).convert("RGB"))[None])[0]
+    stored = LogitsStore(cfg["eval"]["logits_dir"], checkpoint_key(b)).get("logits", [file_sha1(image)])[0]
+    assert torch.allclose(torch.as_tensor(stored), expected, atol=1e-4)
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+import torch
+
+from model.model import checkpoint_metadata, get_model, save_checkpoint, save_metadata
+from src.infer_job import create_job, run_job, shard_path
+from src.predict import checkpoint_path
+
+CLASSES = ["mel", "nv", "bkl"]
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    torch.manual_seed(0)
+    ckpt_dir = tmp_path / "ckpt"
+    ckpt_dir.mkdir()
+    save_checkpoint(get_model("resnet18", num_classes=len(CLASSES), pretrained=False),
+                    str(ckpt_dir / "small.safetensors"), metadata=checkpoint_metadata("resnet18", CLASSES, 32))
+    return {
+        "train": {"checkpoint_dir": str(ckpt_dir), "checkpoint_name": "small.safetensors"},
+        "model": {"name": "resnet18", "num_classes": len(CLASSES)},
+        "data": {"class_names": CLASSES, "img_size": 32},
+        "infer": {"jobs_dir": str(tmp_path / "jobs"), "processes": 1, "threads_per_process": 1,
+                  "shard_size": 2, "batch_size": 2},
+    }
+
+
+def test_job_without_inputs_writes_empty_output(cfg):
+    out = run_job(cfg, "empty", paths=[])
+    assert os.path.exists(out) and len(pd.read_parquet(out)) == 0
+
+
+def test_failing_shard_stops_the_job(cfg, tmp_path, make_image):
+    paths = [make_image(tmp_path / "imgs" / f"{i}.png", seed=i) for i in range(12)]
+    job_dir = os.path.join(cfg["infer"]["jobs_dir"], "broken")
+    # A directory where shard 0 wants its temp file makes that shard raise
+    os.makedirs(shard_path(job_dir, 0).replace(".parquet", ".tmp.parquet"))
+
+    with pytest.raises(SystemExit, match="Shard 0 failed"):
+        run_job(cfg, "broken", paths=paths)
+    with open(os.path.join(job_dir, "progress.json")) as f:
+        progress = json.load(f)
+    assert "0" in progress["failed"]
+    assert not all(os.path.exists(shard_path(job_dir, s)) for s in range(1, 6))  # queued shards were dropped
+
+
+def test_resume_refuses_recalibrated_checkpoint(cfg, tmp_path):
+    job_dir, ckpt = str(tmp_path / "jobs" / "calib"), checkpoint_path(cfg)
+    create_job(job_dir, ["a.png"], ckpt, shard_size=2)
+    assert create_job(job_dir, None, ckpt, shard_size=2)["n_items"] == 1
+
+    save_metadata(ckpt, calibration={"method": "temperature", "temperature": 1.5})
+    with pytest.raises(SystemExit, match="changed since"):
+        create_job(job_dir, None, ckpt, shard_size=2)
@@ -0,0 +1,40 @@
+import math
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("httpx")
+from src.load_test import parse_mix, saturation_point, summarize
+
+
+def test_summarize_counts_errors_separately():
+    records = [("224x224", float(ms), 200) for ms in range(1, 101)]
+    records += [("224x224", 5000.0, 503), ("224x224", 30000.0, "ReadTimeout")]
+    stats = summarize(records, elapsed=10.0)
+    assert stats["requests"] == 102
+    assert stats["throughput_rps"] == 10.0
+    assert stats["p50_ms"] == pytest.approx(50.5) and stats["max_ms"] == 100
+    assert stats["error_rate"] == pytest.approx(2 / 102)
+    assert stats["errors"] == {"503": 1, "ReadTimeout": 1}
+
+
+def test_summarize_without_successes():
+    stats = summarize([("224x224", 10.0, 500)], elapsed=1.0)
+    assert stats["throughput_rps"] == 0 and math.isnan(stats["p99_ms"]) and stats["error_rate"] == 1
+
+
+def sweep(*rows):
+    return pd.DataFrame([{"level": level, "throughput_rps": rps, "p99_ms": p99} for level, rps, p99 in rows])
+
+
+def test_saturation_point():
+    table = sweep((1, 10.0, 100), (2, 19.0, 110), (4, 19.5, 200), (8, 30.0, 400))
+    assert saturation_point(table)["level"] == 2  # 4 clients gain < 5%, later levels are ignored
+    assert saturation_point(table, min_gain=0.0)["level"] == 8
+    assert saturation_point(table, p99_slo=105)["level"] == 1
+    assert saturation_point(table, p99_slo=50) is None
+
+
+def test_parse_mix():
+    mix = parse_mix("224x224:0.2,4032X3024:0.8,600x450")
+    assert mix == {"224x224": ((224, 224), 0.2), "4032X3024": ((4032, 3024), 0.8), "600x450": ((600, 450), 1.0)}
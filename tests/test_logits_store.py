@@ -0,0 +1,91 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from src.logits_store import LogitsStore, checkpoint_key
+
+
+def rows(prefix, n, c=7, seed=0):
+    rng = np.random.default_rng(seed)
+    hashes = [f"{prefix}{i}" for i in range(n)]
+    return hashes, ["nv"] * n, [f"/data/{h}.jpg" for h in hashes], rng.normal(size=(n, c)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LogitsStore(str(tmp_path), "ckpt")
+
+
+def test_roundtrip_and_reload(tmp_path, store):
+    hashes, labels, paths, logits = rows("a", 5)
+    store.add(hashes, labels, paths, {"logits": logits})
+    reopened = LogitsStore(str(tmp_path), "ckpt")
+    assert len(reopened) == 5
+    np.testing.assert_allclose(reopened.get("logits", hashes[::-1]), logits[::-1])
+    assert reopened.missing(hashes + ["new"]) == ["new"]
+
+
+def test_new_optional_array_on_partial_add(store):
+    # evaluate (test logits) followed by fit_ood (train logits + embeddings)
+    test_h, labels, paths, test_logits = rows("test", 4)
+    store.add(test_h, labels, paths, {"logits": test_logits})
+    train_h, labels, paths, train_logits = rows("train", 3, seed=1)
+    emb = np.ones((3, 16), dtype=np.float32)
+    store.add(train_h, labels, paths, {"logits": train_logits, "embeddings": emb})
+
+    assert store.has("embeddings", train_h)
+    assert not store.has("embeddings", test_h)
+    np.testing.assert_allclose(store.get("embeddings", train_h), emb)
+    np.testing.assert_allclose(store.get("logits", test_h), test_logits)
+    assert store.missing(test_h + train_h, ("logits", "embeddings")) == test_h
+
+
+def test_partial_add_keeps_cached_arrays(tmp_path, store):
+    # evaluate --tta, then calibrate on val (logits only), then the test TTA logits must survive
+    test_h, labels, paths, logits = rows("test", 4)
+    tta = np.random.default_rng(2).normal(size=(4, 5, 7)).astype(np.float32)
+    store.add(test_h, labels, paths, {"logits": logits, "tta_logits": tta})
+    val_h, labels, paths, val_logits = rows("val", 3, seed=3)
+    store.add(val_h, labels, paths, {"logits": val_logits})
+
+    reopened = LogitsStore(str(tmp_path), "ckpt")
+    assert reopened.has("tta_logits", test_h)
+    np.testing.assert_allclose(reopened.get("tta_logits", test_h), tta)
+    assert reopened.missing(val_h, ("logits", "tta_logits")) == val_h
+    assert reopened.missing(val_h) == []
+
+
+def test_replacing_rows_keeps_unsupplied_arrays(store):
+    hashes, labels, paths, logits = rows("a", 3)
+    emb = np.arange(6, dtype=np.float32).reshape(3, 2)
+    store.add(hashes, labels, paths, {"logits": logits, "embeddings": emb})
+    store.add(hashes[:1] + ["b0"], labels[:2], ["/moved/a0.jpg", "/data/b0.jpg"], {"logits": logits[:2] + 1})
+
+    assert len(store) == 4
+    np.testing.assert_allclose(store.get("logits", ["a0"]), logits[:1] + 1)
+    np.testing.assert_allclose(store.get("embeddings", ["a0", "a1"]), emb[:2])
+    assert store.missing(["a0", "b0"], ("embeddings",)) == ["b0"]
+
+
+def write_safetensors(path, tensors, metadata):
+    header, offset, blobs = {"__metadata__": metadata}, 0, []
+    for name, arr in tensors.items():
+        data = np.ascontiguousarray(arr, dtype=np.float32).tobytes()
+        header[name] = {"dtype": "F32", "shape": list(arr.shape), "data_offsets": [offset, offset + len(data)]}
+        offset += len(data)
+        blobs.append(data)
+    raw = json.dumps(header).encode()
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(raw)) + raw + b"".join(blobs))
+
+
+def test_checkpoint_key_ignores_metadata_and_ood(tmp_path):
+    weights = {"fc.weight": np.ones((7, 4)), "fc.bias": np.zeros(7)}
+    a, b, c = (str(tmp_path / f"{n}.safetensors") for n in "abc")
+    write_safetensors(a, weights, {"skin_lesion": "{}"})
+    write_safetensors(b, {**weights, "ood.means": np.ones((7, 4))}, {"skin_lesion": '{"calibration": 1}'})
+    write_safetensors(c, {**weights, "fc.bias": np.ones(7)}, {"skin_lesion": "{}"})
+    assert checkpoint_key(a) == checkpoint_key(b)
+    assert checkpoint_key(a) != checkpoint_key(c)
@@ -0,0 +1,33 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.manifest import load_manifest, refresh_manifest, save_manifest
+
+
+def test_concurrent_saves_leave_a_readable_manifest(tmp_path, make_image):
+    for i in range(4):
+        make_image(tmp_path / "train" / "mel" / f"{i}.png", seed=i)
+    manifest = str(tmp_path / "manifest.parquet")
+    df = refresh_manifest(manifest, {"train": str(tmp_path / "train")}, save=False)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: save_manifest(df, manifest), range(32)))
+    assert load_manifest(manifest)["path"].tolist() == df["path"].tolist()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["manifest.parquet", "train"]
+
+
+def test_image_rewritten_in_place_is_rehashed(tmp_path, make_image):
+    path = make_image(tmp_path / "train" / "mel" / "a.png", size=(32, 24), seed=0)
+    manifest = str(tmp_path / "manifest.parquet")
+    before = refresh_manifest(manifest, {"train": str(tmp_path / "train")})
+
+    class_dir = tmp_path / "train" / "mel"
+    dir_mtime = class_dir.stat().st_mtime_ns
+    make_image(path, size=(40, 30), seed=1)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))  # coarse-mtime filesystems
+    os.utime(class_dir, ns=(dir_mtime, dir_mtime))
+
+    after = refresh_manifest(manifest, {"train": str(tmp_path / "train")})
+    assert after["sha1"][0] != before["sha1"][0] and (after["width"][0], after["height"][0]) == (40, 30)
+    assert load_manifest(manifest)["sha1"][0] == after["sha1"][0]
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+import torch
+
+from model.model import checkpoint_metadata, get_model, load_checkpoint, save_checkpoint, save_metadata
+from model.optimize import cache_path, load_optimized, max_logit_diff, optimize
+
+
+@pytest.fixture(scope="module")
+def ckpt(tmp_path_factory):
+    torch.manual_seed(0)
+    path = str(tmp_path_factory.mktemp("ckpt") / "resnet18.safetensors")
+    model = get_model("resnet18", num_classes=7, pretrained=False)
+    # Non-trivial BatchNorm statistics, so folding has something to fold
+    with torch.no_grad():
+        for m in model.modules():
+            if isinstance(m, torch.nn.BatchNorm2d):
+                m.running_mean.uniform_(-0.1, 0.1)
+                m.running_var.uniform_(0.5, 1.5)
+    save_checkpoint(model, path, metadata=checkpoint_metadata("resnet18", list("abcdefg"), 64))
+    return path
+
+
+@pytest.mark.parametrize("mode", ["fold", "script"])
+def test_optimized_model_matches_original(ckpt, mode):
+    reference = load_checkpoint(ckpt)
+    optimized = optimize(reference, mode, img_size=64)
+    assert max_logit_diff(reference, optimized, img_size=64) < 1e-3
+    if mode == "fold":
+        assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in optimized.modules())
+
+
+def test_cache_reused_and_pruned(ckpt):
+    first = load_optimized(ckpt, mode="fold")
+    entry = cache_path(ckpt, "fold", "cpu")
+    assert os.path.exists(entry)
+    assert max_logit_diff(first, load_optimized(ckpt, mode="fold"), img_size=64) == 0
+
+    save_metadata(ckpt, calibration={"method": "temperature", "temperature": 1.5})  # new size/mtime
+    load_optimized(ckpt, mode="fold")
+    entries = os.listdir(os.path.dirname(entry))
+    assert entries == [os.path.basename(cache_path(ckpt, "fold", "cpu"))]
@@ -0,0 +1,30 @@
+from src.perf_bench import compare, metric, parse_thresholds
+
+
+def run(**values):
+    return {"metrics": {name: metric(value, unit, better) for name, (value, unit, better) in values.items()}}
+
+
+def test_compare_respects_direction_and_thresholds():
+    baseline = run(forward=(100.0, "ms", "lower"), decode=(10.0, "ms", "lower"),
+                   loader=(200.0, "img/s", "higher"), gone=(1.0, "ms", "lower"))
+    current = run(forward=(105.0, "ms", "lower"), decode=(13.0, "ms", "lower"),
+                  loader=(150.0, "img/s", "higher"), new=(1.0, "ms", "lower"))
+    table = compare(current, baseline, max_regression=0.10, thresholds={"decode": 0.5}).set_index("metric")
+
+    assert list(table.index) == ["forward", "decode", "loader"]  # only metrics present in both runs
+    assert table.loc["forward", "change"] == 0.05 and not table.loc["forward", "regressed"]
+    assert table.loc["decode", "threshold"] == 0.5 and not table.loc["decode", "regressed"]
+    assert table.loc["loader", "change"] == -0.25 and table.loc["loader", "regressed"]
+
+
+def test_faster_is_never_a_regression():
+    table = compare(run(forward=(50.0, "ms", "lower"), loader=(400.0, "img/s", "higher")),
+                    run(forward=(100.0, "ms", "lower"), loader=(200.0, "img/s", "higher")), max_regression=0.0)
+    assert not table["regressed"].any()
+
+
+def test_parse_thresholds():
+    assert parse_thresholds(["forward_resnet50_b1=0.2", "decode=0.05"]) == {"forward_resnet50_b1": 0.2,
+                                                                            "decode": 0.05}
+    assert parse_thresholds([]) == {}
@@ -0,0 +1,115 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+from model.model import save_metadata
+from src.predict import ResultWriter, checkpoint_spec, decode_batch, iter_batches, iter_inputs, predict_bulk
+
+CLASSES = ["mel", "nv"]
+OK = ["a.jpg", "nv", 0.9, 0.1, 0.9, None]
+BAD = ["b.jpg", None, None, None, None, "UnidentifiedImageError: cannot identify image file"]
+
+
+@pytest.mark.parametrize("chunks", [[[OK], [BAD]], [[BAD], [OK]]])
+def test_parquet_chunks_keep_column_types(tmp_path, chunks):
+    out = str(tmp_path / "preds.parquet")
+    writer = ResultWriter(out, CLASSES, parquet_rows=1)
+    for rows in chunks:
+        writer.write(rows)
+    writer.close()
+
+    df = pd.read_parquet(out)
+    assert list(df.columns) == ["path", "prediction", "confidence", "prob_mel", "prob_nv", "error"]
+    assert df["confidence"].dtype == np.float64
+    assert df.set_index("path").loc["b.jpg", "error"].startswith("UnidentifiedImageError")
+
+
+@pytest.mark.parametrize("ext", ["csv", "jsonl"])
+def test_text_formats(tmp_path, ext):
+    out = str(tmp_path / f"preds.{ext}")
+    writer = ResultWriter(out, CLASSES)
+    writer.write([OK, BAD])
+    writer.close()
+    if ext == "csv":
+        df = pd.read_csv(out)
+    else:
+        df = pd.DataFrame([json.loads(line) for line in open(out)])
+    assert df["path"].tolist() == ["a.jpg", "b.jpg"]
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        ResultWriter(str(tmp_path / "preds.xlsx"), CLASSES)
+
+
+def test_iter_inputs_and_batches(tmp_path, make_image):
+    b = make_image(tmp_path / "imgs" / "sub" / "b.png")
+    a = make_image(tmp_path / "imgs" / "a.png")
+    (tmp_path / "imgs" / "notes.txt").write_text("x")
+    listing = tmp_path / "list.txt"
+    listing.write_text(f"{b}\n\n{a}\n")
+
+    assert list(iter_inputs([str(tmp_path / "imgs")])) == [a, b]
+    assert list(iter_inputs([str(tmp_path / "imgs" / "*.png")])) == [a]
+    assert list(iter_inputs([f"@{listing}"])) == [b, a]
+    assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_decode_batch_reports_unreadable(tmp_path, make_image):
+    good = make_image(tmp_path / "good.png", size=(40, 30))
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not an image")
+    pixels, errors = decode_batch([good, str(bad)], 16)
+    assert pixels.shape == (2, 16, 16, 3) and pixels.dtype == np.uint8
+    assert errors[0] is None and errors[1]
+
+
+def test_checkpoint_spec_prefers_metadata(tmp_path):
+    cfg = {"train": {"checkpoint_dir": str(tmp_path), "checkpoint_name": "legacy.pt"},
+           "data": {"class_names": ["a", "b"], "img_size": 224}}
+    (tmp_path / "legacy.pt").write_bytes(b"")
+    assert checkpoint_spec(cfg)["class_names"] == ["a", "b"] and checkpoint_spec(cfg)["img_size"] == 224
+
+    save_metadata(str(tmp_path / "legacy.pt"), class_names=["x", "y", "z"], img_size=128)
+    spec = checkpoint_spec(cfg)
+    assert spec["class_names"] == ["x", "y", "z"] and spec["img_size"] == 128
+
+
+@pytest.mark.parametrize("ext", ["parquet", "csv", "jsonl"])
+def test_empty_output_is_still_written(tmp_path, ext):
+    out = tmp_path / f"preds.{ext}"
+    ResultWriter(str(out), CLASSES).close()
+    assert out.exists()
+    if ext == "parquet":
+        df = pd.read_parquet(out)
+        assert len(df) == 0 and list(df.columns)[-1] == "error"
+
+
+class FailingModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def forward(self, x):
+        self.calls += 1
+        if self.calls > 1:
+            raise RuntimeError("out of memory")
+        return torch.zeros(len(x), len(CLASSES))
+
+
+def test_failed_bulk_run_leaves_no_partial_output(tmp_path, make_image):
+    for i in range(4):
+        make_image(tmp_path / "imgs" / f"{i}.png", seed=i)
+    cfg = {"train": {"checkpoint_dir": str(tmp_path), "checkpoint_name": "missing.pt"},
+           "data": {"class_names": CLASSES, "img_size": 16}}
+    out = tmp_path / "out" / "preds.csv"  # written as it goes, unlike buffered Parquet
+    with pytest.raises(RuntimeError, match="out of memory"):
+        predict_bulk([str(tmp_path / "imgs")], str(out), cfg, batch_size=2, workers=1,
+                     model=FailingModel(), device="cpu")
+    assert list((tmp_path / "out").iterdir()) == []
+
+    predict_bulk([str(tmp_path / "imgs")], str(out), cfg, batch_size=4, workers=1, model=FailingModel(), device="cpu")
+    assert len(pd.read_csv(out)) == 4
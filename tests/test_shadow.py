@@ -0,0 +1,27 @@
+import torch
+
+from api.shadow import ShadowEvaluator
+
+CLASSES = ["mel", "nv", "bkl"]
+
+
+def test_bad_sample_does_not_kill_worker(tmp_path):
+    torch.manual_seed(0)
+    shadow = ShadowEvaluator(torch.nn.Linear(4, 3), CLASSES, str(tmp_path / "shadow.db"))
+    primary = torch.tensor([0.2, 0.7, 0.1])
+    assert shadow.submit("bad", torch.randn(2, 5), primary)  # shape mismatch in the candidate
+    assert shadow.submit("good", torch.randn(2, 4), primary)
+    shadow.stop()
+
+    stats = shadow.stats()
+    assert stats["scored"] == 1 and stats["failed"] == 1
+    assert "RuntimeError" in stats["last_error"]
+    assert stats["pending"] == 0
+
+
+def test_submit_after_worker_exit_is_dropped(tmp_path):
+    shadow = ShadowEvaluator(torch.nn.Linear(4, 3), CLASSES, str(tmp_path / "shadow.db"))
+    shadow.stop()
+    assert not shadow.alive
+    assert not shadow.submit("late", torch.randn(1, 4), torch.tensor([0.5, 0.3, 0.2]))
+    assert shadow.stats()["dropped"] == 1 and not shadow.stats()["worker_alive"]
@@ -0,0 +1,46 @@
+import os
+
+from src.manifest import load_manifest, refresh_manifest
+from src.split_dataset import split_dataset
+
+RATIOS = {"train": 0.5, "val": 0.25, "test": 0.25}
+
+
+def make_raw(make_image, raw, n=8):
+    for label in ("mel", "nv"):
+        for i in range(n):
+            make_image(raw / label / f"{label}_{i}.png", seed=100 * (label == "nv") + i)
+
+
+def test_mode_none_points_at_raw(tmp_path, make_image):
+    raw, manifest = tmp_path / "raw", str(tmp_path / "manifest.parquet")
+    make_raw(make_image, raw)
+    df = split_dataset(str(raw), str(tmp_path), manifest, RATIOS, mode="none", workers=2)
+    assert len(df) == 16
+    assert all(p.startswith(str(raw)) for p in df["path"])
+    assert not os.path.exists(tmp_path / "train")
+
+
+def test_refresh_keeps_mode_none_rows(tmp_path, make_image):
+    raw, manifest = tmp_path / "raw", str(tmp_path / "manifest.parquet")
+    make_raw(make_image, raw)
+    before = split_dataset(str(raw), str(tmp_path), manifest, RATIOS, mode="none", workers=2)
+    # A split directory appearing later (e.g. from an older copy run) must not wipe the raw rows
+    extra = make_image(tmp_path / "train" / "mel" / "extra.png", seed=999)
+
+    after = refresh_manifest(manifest, {s: str(tmp_path / s) for s in ("train", "val", "test")})
+    assert set(before["path"]) | {extra} == set(after["path"])
+    assert set(load_manifest(manifest)["path"]) == set(after["path"])
+
+
+def test_rerun_only_adds_new_images(tmp_path, make_image):
+    raw, manifest = tmp_path / "raw", str(tmp_path / "manifest.parquet")
+    make_raw(make_image, raw)
+    first = split_dataset(str(raw), str(tmp_path), manifest, RATIOS, mode="hardlink", workers=2)
+    make_image(raw / "nv" / "nv_new.png", seed=1234)
+    second = split_dataset(str(raw), str(tmp_path), manifest, RATIOS, mode="hardlink", workers=2)
+
+    assert len(second) == len(first) + 1
+    old = first.set_index(first["path"].map(os.path.basename))["split"]
+    new = second.set_index(second["path"].map(os.path.basename))["split"]
+    assert (new[old.index] == old).all()
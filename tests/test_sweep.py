@@ -0,0 +1,24 @@
+import pytest
+
+from src.sweep import connect, should_prune
+
+
+def add_trial(conn, sweep, losses):
+    cur = conn.execute("INSERT INTO trials (sweep, params, status) VALUES (?, '{}', 'running')", (sweep,))
+    conn.executemany("INSERT INTO epochs VALUES (?, ?, 0, ?, 0)",
+                     [(cur.lastrowid, epoch, loss) for epoch, loss in enumerate(losses, start=1)])
+    return cur.lastrowid
+
+
+@pytest.mark.parametrize("pruner", ["median", "halving"])
+def test_prunes_only_against_the_same_sweep(tmp_path, pruner):
+    conn = connect(str(tmp_path / "results.db"))
+    sweep_cfg = {"pruner": pruner, "min_epochs": 2, "min_trials": 3, "reduction_factor": 3}
+    for _ in range(3):
+        add_trial(conn, "old", [0.2, 0.1])  # an earlier, much better sweep
+    trial = add_trial(conn, "new", [1.0, 0.9])
+    assert not should_prune(conn, "new", trial, 2, 0.9, sweep_cfg)
+
+    for _ in range(3):
+        add_trial(conn, "new", [0.5, 0.4])
+    assert should_prune(conn, "new", trial, 2, 0.9, sweep_cfg)